@@ -0,0 +1,71 @@
+"""Compare setting a bank of float sensors one by one and via a SensorBank.
+
+Creates a bank of float sensors, each sampled by a differential strategy
+per simulated client, and reports the time taken to set all the sensors
+with Sensor.set and with SensorBank.set_values. Values change by small
+amounts so that only a few strategies cross their thresholds.
+
+Requires NumPy.
+
+"""
+
+import time
+
+from optparse import OptionParser
+from thread import get_ident
+
+import numpy
+import tornado.ioloop
+
+from katcp import Sensor
+from katcp.sampling import SampleDifferential, SensorBank
+
+
+def make_bank(num_sensors, num_clients, ioloop):
+    sensors = []
+    for i in xrange(num_sensors):
+        sensor = Sensor.float('bank.channel%d' % i)
+        sensor.set(0.0, Sensor.NOMINAL, 0.0)
+        sensors.append(sensor)
+    for _ in xrange(num_clients):
+        for sensor in sensors:
+            strategy = SampleDifferential(lambda sensor, reading: None,
+                                          sensor, 0.5, ioloop=ioloop)
+            # Pretend the strategy was started in this (the ioloop) thread
+            strategy._ioloop_thread_id = get_ident()
+            strategy.attach()
+    return sensors
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option('-n', '--num-sensors', dest='num_sensors', type=int,
+                      default=64 * 4096)
+    parser.add_option('-c', '--num-clients', dest='num_clients', type=int,
+                      default=2)
+    parser.add_option('-r', '--repeats', dest='repeats', type=int, default=5)
+    options, args = parser.parse_args()
+
+    ioloop = tornado.ioloop.IOLoop.current()
+    sensors = make_bank(options.num_sensors, options.num_clients, ioloop)
+    bank = SensorBank(sensors)
+    # The first call collects the observers of the sensors
+    bank.set_values(numpy.zeros(len(sensors)))
+    set_time = bank_time = 0.0
+    for _ in xrange(options.repeats):
+        values = numpy.random.normal(0.0, 0.2, len(sensors))
+        start = time.time()
+        for sensor, value in zip(sensors, values.tolist()):
+            sensor.set(start, Sensor.NOMINAL, value)
+        set_time += time.time() - start
+        values = numpy.random.normal(0.0, 0.2, len(sensors))
+        start = time.time()
+        bank.set_values(values, timestamp=start)
+        bank_time += time.time() - start
+    print "%d sensors, %d clients: Sensor.set %.3f s, SensorBank %.3f s" % (
+        len(sensors), options.num_clients, set_time / options.repeats,
+        bank_time / options.repeats)
+
+
+if __name__ == '__main__':
+    main()
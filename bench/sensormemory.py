@@ -0,0 +1,60 @@
+"""Report the memory used per katcp.Sensor object.
+
+Creates a large number of sensors of mixed types, similar to those of an
+aggregating device server, and reports the growth of the process' maximum
+resident set size divided by the number of sensors.
+
+"""
+
+import gc
+import resource
+import sys
+
+from optparse import OptionParser
+
+from katcp import Sensor
+
+
+def max_rss():
+    """Return the maximum resident set size of the process in bytes."""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on Mac OS X
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def make_sensors(num_sensors):
+    sensors = []
+    for i in xrange(num_sensors):
+        kind = i % 4
+        if kind == 0:
+            sensors.append(Sensor.float('device.float%d' % i, unit='V',
+                                        params=[-10.0, 10.0]))
+        elif kind == 1:
+            sensors.append(Sensor.integer('device.int%d' % i,
+                                          params=[0, 100]))
+        elif kind == 2:
+            sensors.append(Sensor.boolean('device.bool%d' % i))
+        else:
+            sensors.append(Sensor.discrete('device.mode%d' % i,
+                                           params=['idle', 'busy', 'error']))
+    return sensors
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option('-n', '--num-sensors', dest='num_sensors', type=int,
+                      default=100000)
+    options, args = parser.parse_args()
+
+    gc.collect()
+    before = max_rss()
+    sensors = make_sensors(options.num_sensors)
+    gc.collect()
+    after = max_rss()
+    print "%d sensors: %.1f MB, %d bytes per sensor" % (
+        len(sensors), (after - before) / 1e6,
+        (after - before) // len(sensors))
+
+
+if __name__ == '__main__':
+    main()
@@ -10,6 +10,7 @@
 from __future__ import division, print_function, absolute_import
 
 from .core import (Message, KatcpSyntaxError, MessageParser,
+                   FastMessageParser, LazyMessage, LazyMessageParser,
                    DeviceMetaclass, FailReply,
                    AsyncReply, KatcpDeviceError, KatcpClientError,
                    Sensor, ProtocolFlags, AttrDict)
@@ -26,6 +26,7 @@ from concurrent.futures import Future, TimeoutError
 from .core import (DeviceMetaclass, MessageParser, Message,
                    KatcpClientError, KatcpVersionError, KatcpClientDisconnected,
                    ProtocolFlags, AsyncEvent, until_later, LatencyTimer,
+                   LineSplitter,
                    SEC_TS_KATCP_MAJOR, FLOAT_TS_KATCP_MAJOR, SEC_TO_MS_FAC)
 from .ioloop_manager import IOLoopManager
 
@@ -139,6 +140,17 @@ class DeviceClient(object):
 
     """
 
+    CHUNKED_READS = False
+    """Read data from the server in chunks rather than one line at a time.
+
+    If True, whatever data is available is read from the stream (up to
+    READ_CHUNK_SIZE bytes) and split into lines in one go, instead of doing
+    one `read_until_regex()` call per line.
+
+    """
+    READ_CHUNK_SIZE = 64*1024
+    """Maximum number of bytes to read at a time if CHUNKED_READS is True."""
+
     def __init__(self, host, port, tb_limit=20, logger=log,
                  auto_reconnect=True):
         self._parser = MessageParser()
@@ -675,7 +687,10 @@ class DeviceClient(object):
         while self._running.isSet():
             if self._connected.isSet():
                 try:
-                    yield self._line_read_loop()
+                    if self.CHUNKED_READS:
+                        yield self._chunked_line_read_loop()
+                    else:
+                        yield self._line_read_loop()
                 except Exception:
                     self._logger.exception('Unhandled exception in _reading_loop()')
             elif self._auto_reconnect:
@@ -718,24 +733,79 @@ class DeviceClient(object):
                 line = line.replace("\r", "\n").split("\n")[0]
                 msg = self._parser.parse(line) if line else None
             except Exception:
-                e_type, e_value, trace = sys.exc_info()
-                reason = "\n".join(traceback.format_exception(
-                    e_type, e_value, trace, self._tb_limit))
-                self._logger.error("BAD COMMAND: %s" % (reason,))
+                self._log_bad_line()
             else:
                 try:
                     if msg:
                         yield gen.maybe_future(self.handle_message(msg))
                 except Exception:
-                    self._logger.exception(
-                        'Unhandled exception in handle_message() from {0} for '
-                        'message {1!r}'.format(self.bind_address_string, str(msg)))
+                    self._log_handle_message_error(msg)
 
         self._disconnect()
 
         self._logger.debug('client _line_read_loop() from {0} completed'
                            .format(self.bind_address_string))
 
+    @gen.coroutine
+    def _chunked_line_read_loop(self):
+        assert get_thread_ident() == self.ioloop_thread_id
+        latency_timer = LatencyTimer(self.MAX_LOOP_LATENCY)
+        splitter = LineSplitter(self.MAX_MSG_SIZE)
+        while self._running.isSet():
+            try:
+                chunk_fut = self._stream.read_bytes(self.READ_CHUNK_SIZE,
+                                                    partial=True)
+                latency_timer.check_future(chunk_fut)
+                if latency_timer.time_to_yield():
+                    yield gen.moment
+                chunk = yield chunk_fut
+                lines = splitter.feed(chunk)
+            except tornado.iostream.StreamClosedError:
+                # Assume that _stream_closed_callback() will handle this case
+                break
+            except Exception:
+                if self._stream:
+                    self._logger.warn('Unhandled Exception while reading from {0}:'
+                                      .format(self._bindaddr), exc_info=True)
+                    # Prevent potential tight error loops from blocking ioloop
+                    self._disconnect()
+                    yield gen.moment
+                else:
+                    self._logger.warn('self._stream object seems to have disappeared.')
+                break
+            for line in lines:
+                try:
+                    msg = self._parser.parse(line)
+                except Exception:
+                    self._log_bad_line()
+                    continue
+                try:
+                    ready = gen.maybe_future(self.handle_message(msg))
+                    latency_timer.check_future(ready)
+                    if latency_timer.time_to_yield():
+                        yield gen.moment
+                    yield ready
+                except Exception:
+                    self._log_handle_message_error(msg)
+
+        self._disconnect()
+
+        self._logger.debug('client _chunked_line_read_loop() from {0} completed'
+                           .format(self.bind_address_string))
+
+    def _log_bad_line(self):
+        """Log a line that failed to parse (in an exception context)."""
+        e_type, e_value, trace = sys.exc_info()
+        reason = "\n".join(traceback.format_exception(
+            e_type, e_value, trace, self._tb_limit))
+        self._logger.error("BAD COMMAND: %s" % (reason,))
+
+    def _log_handle_message_error(self, msg):
+        """Log a handle_message() failure (in an exception context)."""
+        self._logger.exception(
+            'Unhandled exception in handle_message() from {0} for '
+            'message {1!r}'.format(self.bind_address_string, str(msg)))
+
     def set_ioloop(self, ioloop=None):
         """Set the tornado.ioloop.IOLoop instance to use.
 
@@ -10,6 +10,7 @@ from __future__ import division, print_function, absolute_import
 
 import re
 import sys
+import threading
 import time
 import warnings
 import logging
@@ -355,7 +356,7 @@ class Message(object):
     def __eq__(self, other):
         if not isinstance(other, Message):
             return NotImplemented
-        for name in self.__slots__:
+        for name in Message.__slots__:
             if getattr(self, name) != getattr(other, name):
                 return False
         return True
@@ -468,6 +469,35 @@ class Message(object):
         """
         return cls(cls.INFORM, req_msg.name, args, req_msg.mid)
 
+    @classmethod
+    def trusted(cls, mtype, name, arguments, mid=None):
+        """Create a message from pre-validated parts, skipping all checks.
+
+        Intended for messages generated by the library itself on hot paths
+        (e.g. #sensor-status informs), where the type, name and id are known
+        to be valid. Arguments that are already strings are used as-is,
+        others are passed through :meth:`format_argument`.
+
+        Parameters
+        ----------
+        mtype : Message type constant
+            The message type (request, reply or inform).
+        name : str
+            The message name, must be a valid KATCP message name.
+        arguments : list of objects
+            The message arguments.
+        mid : str or None
+            The message identifier, must be a string of digits or None.
+
+        """
+        msg = cls.__new__(cls)
+        msg.mtype = mtype
+        msg.name = name
+        msg.mid = mid
+        msg.arguments = [arg if type(arg) is str else msg.format_argument(arg)
+                         for arg in arguments]
+        return msg
+
     # pylint: enable-msg = W0142
 
 
@@ -496,6 +526,9 @@ class MessageParser(object):
     NAME_RE = re.compile(
         r"^(?P<name>[a-zA-Z][a-zA-Z0-9\-]*)(\[(?P<id>[0-9]+)\])?$")
 
+    ## @brief Regular expression matching KATCP line terminators.
+    LINE_END_RE = re.compile(r"[\n\r]")
+
     def _unescape_match(self, match):
         """Given an re.Match, unescape the escape code it represents."""
         char = match.group(1)
@@ -559,6 +592,365 @@ class MessageParser(object):
 
         return Message(mtype, name, arguments, mid)
 
+    def parse_many(self, buffer):
+        """Parse all complete lines in a block of data.
+
+        Lines are terminated by a newline or carriage return and empty lines
+        are skipped. A line that fails to parse is reported in `errors` and
+        does not stop the rest of the block from being parsed.
+
+        Parameters
+        ----------
+        buffer : str
+            The data to parse, typically a chunk read from a stream or a
+            block of a recorded log.
+
+        Returns
+        -------
+        msgs : list of Message objects
+            The messages parsed from the complete lines, in order.
+        tail : str
+            The unconsumed data after the last line terminator (the start of
+            an incomplete line), to be prepended to the next block.
+        errors : list of (str, KatcpSyntaxError) tuples
+            The lines that could not be parsed and the corresponding errors.
+
+        """
+        lines = self.LINE_END_RE.split(buffer)
+        tail = lines.pop()
+        msgs = []
+        errors = []
+        parse = self.parse
+        for line in lines:
+            if not line:
+                continue
+            try:
+                msgs.append(parse(line))
+            except KatcpSyntaxError, e:
+                errors.append((line, e))
+        return msgs, tail, errors
+
+
+class FastMessageParser(MessageParser):
+    """Parses lines into Message objects using a single compiled scan.
+
+    Produces the same messages as :class:`MessageParser`, but tokenizes the
+    line, extracts the message id and validates the name in one regular
+    expression match, only unescapes arguments that contain a backslash and
+    skips the re-validation done by :meth:`Message.__init__`. Lines that the
+    fast path does not accept are handed to :meth:`MessageParser.parse` so
+    that error semantics are unchanged.
+
+    Select it by replacing the `_parser` attribute of a
+    :class:`katcp.server.KATCPServer` or :class:`katcp.DeviceClient`, e.g.::
+
+        server._parser = FastMessageParser()
+
+    """
+
+    ## @brief Regular expression matching type, name, id and start of the
+    #  arguments of a message.
+    HEADER_RE = re.compile(
+        r"([?!#])([a-zA-Z][a-zA-Z0-9\-]*)(?:\[([0-9]+)\])?(?:[ \t]+|$)")
+
+    ## @brief Regular expression matching specials that may not appear in
+    #  the argument part of a line (whitespace is an argument separator).
+    ARG_SPECIAL_RE = re.compile(r"[\0\n\r\x1b]")
+
+    ## @brief Regular expression matching a single (still escaped) argument.
+    ARG_RE = re.compile(r"[^ \t]+")
+
+    def parse(self, line):
+        """Parse a line, return a Message.
+
+        Parameters
+        ----------
+        line : str
+            The line to parse (should not contain the terminating newline
+            or carriage return).
+
+        Returns
+        -------
+        msg : Message object
+            The resulting Message.
+
+        """
+        match = self.HEADER_RE.match(line)
+        if match is None:
+            return MessageParser.parse(self, line)
+        type_char, name, mid = match.groups()
+        arg_start = match.end()
+        if arg_start < len(line):
+            if self.ARG_SPECIAL_RE.search(line, arg_start):
+                return MessageParser.parse(self, line)
+            unescape = self.UNESCAPE_RE.sub
+            unescape_match = self._unescape_match
+            arguments = [unescape(unescape_match, arg) if "\\" in arg else arg
+                         for arg in self.ARG_RE.findall(line, arg_start)]
+        else:
+            arguments = []
+
+        msg = Message.__new__(Message)
+        msg.mtype = self.TYPE_SYMBOL_LOOKUP[type_char]
+        msg.name = name
+        msg.mid = mid
+        msg.arguments = arguments
+        return msg
+
+    def parse_many(self, buffer):
+        """Parse all complete lines in a block of data.
+
+        See :meth:`MessageParser.parse_many`. The fast path is inlined in
+        the loop to avoid a method call per line.
+
+        """
+        lines = self.LINE_END_RE.split(buffer)
+        tail = lines.pop()
+        msgs = []
+        errors = []
+        header_match = self.HEADER_RE.match
+        special_search = self.ARG_SPECIAL_RE.search
+        find_args = self.ARG_RE.findall
+        unescape = self.UNESCAPE_RE.sub
+        unescape_match = self._unescape_match
+        type_lookup = self.TYPE_SYMBOL_LOOKUP
+        new_message = Message.__new__
+        for line in lines:
+            if not line:
+                continue
+            try:
+                match = header_match(line)
+                if match is None:
+                    msgs.append(MessageParser.parse(self, line))
+                    continue
+                arg_start = match.end()
+                if arg_start < len(line):
+                    if special_search(line, arg_start):
+                        msgs.append(MessageParser.parse(self, line))
+                        continue
+                    arguments = [unescape(unescape_match, arg)
+                                 if "\\" in arg else arg
+                                 for arg in find_args(line, arg_start)]
+                else:
+                    arguments = []
+            except KatcpSyntaxError, e:
+                errors.append((line, e))
+                continue
+            type_char, name, mid = match.groups()
+            msg = new_message(Message)
+            msg.mtype = type_lookup[type_char]
+            msg.name = name
+            msg.mid = mid
+            msg.arguments = arguments
+            msgs.append(msg)
+        return msgs, tail, errors
+
+
+class LazyMessage(Message):
+    """A received Message whose arguments are only unescaped when accessed.
+
+    Created by :class:`LazyMessageParser`. The raw line is kept and the
+    arguments are split and unescaped on first access of :attr:`arguments`.
+    While the type, name, id and arguments are unchanged, :meth:`__str__`
+    returns the original line instead of re-escaping the arguments, which
+    suits proxies that forward messages and listeners that only look at
+    the message name.
+
+    """
+
+    __slots__ = ["_raw", "_header", "_arg_start", "_arguments", "_decoded"]
+
+    ## @brief Copy of ARG_RE from FastMessageParser.
+    ARG_RE = FastMessageParser.ARG_RE
+
+    ## @brief Regular expression matching all (validated) escapes.
+    UNESCAPE_RE = re.compile(r"\\(.)")
+
+    @classmethod
+    def from_line(cls, line, mtype, name, mid, arg_start):
+        """Create a message from a validated raw line.
+
+        Parameters
+        ----------
+        line : str
+            The raw line, which must be a valid KATCP message.
+        mtype : Message type constant
+            The message type.
+        name : str
+            The message name.
+        mid : str or None
+            The message identifier.
+        arg_start : int
+            Offset of the first argument in `line`.
+
+        """
+        msg = cls.__new__(cls)
+        msg.mtype = mtype
+        msg.name = name
+        msg.mid = mid
+        msg._raw = line
+        msg._header = (mtype, name, mid)
+        msg._arg_start = arg_start
+        msg._arguments = None
+        return msg
+
+    @property
+    def arguments(self):
+        """List of string message arguments."""
+        if self._arguments is None:
+            self._arguments = self._decode()
+            self._decoded = list(self._arguments)
+        return self._arguments
+
+    @arguments.setter
+    def arguments(self, arguments):
+        self._arguments = arguments
+        self._raw = None
+
+    def _decode(self):
+        raw = self._raw
+        args = self.ARG_RE.findall(raw, self._arg_start)
+        if raw.find("\\", self._arg_start) < 0:
+            return args
+        unescape = self.UNESCAPE_RE.sub
+        unescape_match = self._unescape_match
+        return [unescape(unescape_match, arg) if "\\" in arg else arg
+                for arg in args]
+
+    def _unescape_match(self, match):
+        """Given an re.Match, unescape the (validated) escape code."""
+        return self.ESCAPE_LOOKUP[match.group(1)]
+
+    def __str__(self):
+        """ Return Message serialized for transmission.
+
+        Returns
+        -------
+        msg : str
+           The message encoded as a ASCII string.
+
+        """
+        raw = self._raw
+        if (raw is not None and
+                self._header == (self.mtype, self.name, self.mid) and
+                (self._arguments is None or
+                 self._arguments == self._decoded)):
+            return raw
+        return super(LazyMessage, self).__str__()
+
+
+class LazyMessageParser(FastMessageParser):
+    """Parses lines into LazyMessage objects.
+
+    Validates lines like :class:`FastMessageParser`, but defers splitting
+    and unescaping of the arguments until they are accessed (see
+    :class:`LazyMessage`). Select it by replacing the `_parser` attribute of
+    a :class:`katcp.server.KATCPServer` or :class:`katcp.DeviceClient`.
+
+    """
+
+    ## @brief Regular expression matching arguments with only valid escapes.
+    VALID_ESCAPES_RE = re.compile(r"[^\\]*(?:\\[\\_0nret@][^\\]*)*\Z")
+
+    def parse(self, line):
+        """Parse a line, return a Message.
+
+        Parameters
+        ----------
+        line : str
+            The line to parse (should not contain the terminating newline
+            or carriage return).
+
+        Returns
+        -------
+        msg : LazyMessage object
+            The resulting Message.
+
+        """
+        match = self.HEADER_RE.match(line)
+        if match is None:
+            return MessageParser.parse(self, line)
+        arg_start = match.end()
+        if arg_start < len(line):
+            if self.ARG_SPECIAL_RE.search(line, arg_start):
+                return MessageParser.parse(self, line)
+            if (line.find("\\", arg_start) >= 0 and
+                    not self.VALID_ESCAPES_RE.match(line, arg_start)):
+                return MessageParser.parse(self, line)
+        type_char, name, mid = match.groups()
+        return LazyMessage.from_line(line, self.TYPE_SYMBOL_LOOKUP[type_char],
+                                     name, mid, arg_start)
+
+    def parse_many(self, buffer):
+        """Parse all complete lines in a block of data.
+
+        See :meth:`MessageParser.parse_many`.
+
+        """
+        return MessageParser.parse_many(self, buffer)
+
+
+class LineSplitter(object):
+    """Splits chunks of received data into KATCP lines.
+
+    Both newline and carriage return terminate a line, and empty lines are
+    skipped. Incomplete lines are kept until the rest of the line is fed.
+
+    Parameters
+    ----------
+    max_line_size : int or None
+        Maximum size of an incomplete line in bytes, or None for no limit.
+
+    """
+
+    ## @brief Regular expression matching KATCP line terminators.
+    LINE_END_RE = MessageParser.LINE_END_RE
+
+    def __init__(self, max_line_size=None):
+        self.max_line_size = max_line_size
+        self._pending = []
+        self._pending_size = 0
+
+    def feed(self, data):
+        """Add received data and return all complete lines.
+
+        Parameters
+        ----------
+        data : str
+            Data received from the stream.
+
+        Returns
+        -------
+        lines : list of str
+            The complete, non-empty lines (without terminators).
+
+        Raises
+        ------
+        KatcpSyntaxError
+            If an incomplete line exceeds `max_line_size`.
+
+        """
+        if self.LINE_END_RE.search(data) is None:
+            self._pending.append(data)
+            self._pending_size += len(data)
+            self._check_size()
+            return []
+        if self._pending:
+            self._pending.append(data)
+            data = "".join(self._pending)
+        lines = self.LINE_END_RE.split(data)
+        tail = lines.pop()
+        self._pending = [tail] if tail else []
+        self._pending_size = len(tail)
+        self._check_size()
+        return [line for line in lines if line]
+
+    def _check_size(self):
+        if (self.max_line_size is not None and
+                self._pending_size > self.max_line_size):
+            raise KatcpSyntaxError("Line longer than %d bytes."
+                                   % (self.max_line_size,))
+
 
 class ProtocolFlags(object):
     """Utility class for handling KATCP protocol flags.
@@ -572,6 +964,8 @@ class ProtocolFlags(object):
     * M - server supports multiple clients
     * I - server supports message identifiers
     * T - server provides request timeout hints via ?request-timeout-hint
+    * B - server supports setting the sampling strategy of multiple sensors
+      in a single ?sensor-sampling request
 
     Parameters
     ----------
@@ -590,6 +984,12 @@ class ProtocolFlags(object):
     message_ids : bool
         Whether the server the version string came from supports
         message ids.
+    request_timeout_hints : bool
+        Whether the server the version string came from provides
+        request timeout hints.
+    bulk_set_sensor_sampling : bool
+        Whether the server the version string came from accepts a
+        comma-separated list of sensor names in ?sensor-sampling.
 
     """
     VERSION_RE = re.compile(r"^(?P<major>\d+)\.(?P<minor>\d+)"
@@ -602,6 +1002,8 @@ class ProtocolFlags(object):
     # New proposal flag to indicate that a device supports ?request-timeout-hint
     # See CB-2051
     REQUEST_TIMEOUT_HINTS = 'T'
+    # Server accepts a comma-separated list of sensor names in ?sensor-sampling
+    BULK_SET_SENSOR_SAMPLING = 'B'
 
     STRATEGIES_V4 = frozenset(['none', 'auto', 'period', 'event',
                                'differential'])
@@ -614,6 +1016,7 @@ class ProtocolFlags(object):
         }
 
     REQUEST_TIMEOUT_HINTS_MIN_VERSION = (5, 1)
+    BULK_SET_SENSOR_SAMPLING_MIN_VERSION = (5, 1)
 
     def __init__(self, major, minor, flags):
         self.major = major
@@ -622,6 +1025,8 @@ class ProtocolFlags(object):
         self.multi_client = self.MULTI_CLIENT in self.flags
         self.message_ids = self.MESSAGE_IDS in self.flags
         self.request_timeout_hints = self.REQUEST_TIMEOUT_HINTS in self.flags
+        self.bulk_set_sensor_sampling = (
+            self.BULK_SET_SENSOR_SAMPLING in self.flags)
         if self.message_ids and self.major < MID_KATCP_MAJOR:
             raise ValueError(
                 'MESSAGE_IDS is only supported in katcp v5 and newer')
@@ -631,6 +1036,12 @@ class ProtocolFlags(object):
             raise ValueError(
                 'REQUEST_TIMEOUT_HINTS only suported in katcp v{}.{} and newer'
                 .format(*self.REQUEST_TIMEOUT_HINTS_MIN_VERSION))
+        version_supports_bulk = ((self.major, self.minor) >=
+                                 self.BULK_SET_SENSOR_SAMPLING_MIN_VERSION)
+        if self.bulk_set_sensor_sampling and not version_supports_bulk:
+            raise ValueError(
+                'BULK_SET_SENSOR_SAMPLING only suported in katcp v{}.{} and '
+                'newer'.format(*self.BULK_SET_SENSOR_SAMPLING_MIN_VERSION))
 
     def strategy_allowed(self, strategy):
         return strategy in self.STRATEGIES_ALLOWED_BY_MAJOR_VERSION[self.major]
@@ -951,6 +1362,23 @@ class Sensor(object):
     # @brief List of strings containing the additional parameters (length and
     #        interpretation are specific to the sensor type)
 
+    ## @brief Kattype instances shared between sensors, keyed by sensor type
+    #  (and params for discrete sensors).
+    _KATTYPES = {}
+
+    ## @brief Locks serialising the replacement of the observer tuples,
+    #  shared between sensors by address so that each sensor need not carry
+    #  a lock of its own (see _observers_lock).
+    _OBSERVERS_LOCKS = [threading.Lock() for _ in range(64)]
+
+    # Attributes are kept in slots to keep sensors small. A __dict__ is
+    # still available (and only allocated when used) so that subclasses and
+    # users may add attributes or override methods on instances.
+    __slots__ = ["_sensor_type", "_observers", "_kattype", "_current_reading",
+                 "_inform_cache", "name", "_description", "units", "params",
+                 "_stype",
+                 "__dict__", "__weakref__"]
+
     def __init__(self, sensor_type, name, description=None, units='',
                  params=None, default=None, initial_status=None):
         if params is None:
@@ -962,7 +1390,12 @@ class Sensor(object):
         sensor_type = self.SENSOR_SHORTCUTS.get(sensor_type, sensor_type)
 
         self._sensor_type = sensor_type
-        self._observers = set()
+        # Tuple of observers, replaced (never modified) by attach() and
+        # detach(). None until the first attach() since most sensors are
+        # never observed. Sensors rarely have more than a few observers, so
+        # a tuple that is cheap to iterate in notify() is preferred over a
+        # set, at the cost of a linear scan and copy on attach and detach.
+        self._observers = None
 
         typeclass, default_value = self.SENSOR_TYPES[sensor_type]
 
@@ -972,17 +1405,14 @@ class Sensor(object):
             if len(params) == 2:
                 if not params[0] <= default_value <= params[1]:
                     default_value = params[0]
-            self._kattype = typeclass()
         elif self._sensor_type == Sensor.DISCRETE:
             default_value = params[0]
-            self._kattype = typeclass(params)
-        else:
-            if self._sensor_type == Sensor.TIMESTAMP and units:
-                raise ValueError(
-                    'Units cannot be specified for TIMESTAMP sensors since '
-                    'their units is defined by the KATCP spec as either '
-                    'seconds or, for katcp versions 4 and below, milliseconds')
-            self._kattype = typeclass()
+        elif self._sensor_type == Sensor.TIMESTAMP and units:
+            raise ValueError(
+                'Units cannot be specified for TIMESTAMP sensors since '
+                'their units is defined by the KATCP spec as either '
+                'seconds or, for katcp versions 4 and below, milliseconds')
+        self._kattype = self._shared_kattype(sensor_type, params)
 
         if default is not None:
             default_value = default
@@ -996,22 +1426,84 @@ class Sensor(object):
 
         self._current_reading = Reading(time.time(), initial_status,
                                         default_value)
-        self._formatter = self._kattype.pack
-        self._parser = self._kattype.unpack
-        # Also Expose `type` attribute to be compatible with resource.KATCPSensor
-        self.type = self.stype = self._kattype.name
-
+        # (reading, major, msg) of the last #sensor-status inform formatted
+        # by katcp.sampling, shared by all strategies sampling this sensor
+        self._inform_cache = None
         self.name = name
+        # The default description is generated when first read
+        self._description = description
+        self.units = units
+        self.params = params
+        # Type name assigned to stype (or type), if any
+        self._stype = None
+
+    @classmethod
+    def _shared_kattype(cls, sensor_type, params):
+        """Return the kattype instance for a sensor type and params."""
+        typeclass, _value = cls.SENSOR_TYPES[sensor_type]
+        if sensor_type != cls.DISCRETE:
+            key = sensor_type
+        else:
+            try:
+                key = (sensor_type, tuple(params))
+                hash(key)
+            except TypeError:
+                return typeclass(params)
+        kattype = cls._KATTYPES.get(key)
+        if kattype is None:
+            if sensor_type == cls.DISCRETE:
+                kattype = typeclass(params)
+            else:
+                kattype = typeclass()
+            kattype = cls._KATTYPES.setdefault(key, kattype)
+        return kattype
+
+    @property
+    def stype(self):
+        """Name of the sensor type."""
+        return self._stype or self._kattype.name
+
+    @stype.setter
+    def stype(self, stype):
+        self._stype = stype
+
+    # Also Expose `type` attribute to be compatible with resource.KATCPSensor
+    type = stype
+
+    @property
+    def description(self):
+        """String describing the sensor."""
+        description = self._description
         if description is None:
+            units = self.units
             description = '%(type)s sensor %(name)r %(unit_description)s' % (
                           dict(type=self.stype.capitalize(), name=self.name,
                                unit_description=('in unit '+units if units else
                                                  'with no unit')) )
+        return description
 
-        self.description = description
-        self.units = units
-        self.params = params
-        self.formatted_params = [self._formatter(p, True) for p in params]
+    @description.setter
+    def description(self, description):
+        self._description = description
+
+    @property
+    def _observers_lock(self):
+        """Lock serialising the replacement of self._observers."""
+        locks = self._OBSERVERS_LOCKS
+        return locks[(id(self) >> 4) % len(locks)]
+
+    @property
+    def formatted_params(self):
+        """List of the params formatted as KATCP strings."""
+        return [self._kattype.pack(p, True) for p in self.params]
+
+    @property
+    def _formatter(self):
+        return self._kattype.pack
+
+    @property
+    def _parser(self):
+        return self._kattype.unpack
 
     # support for legacy KATCP users that relied on being able to
     # read _timestamp, _status and _value. Such usage will be
@@ -1260,7 +1752,10 @@ class Sensor(object):
             when the sensor value is set
 
         """
-        self._observers.add(observer)
+        with self._observers_lock:
+            observers = self._observers or ()
+            if not any(o is observer for o in observers):
+                self._observers = observers + (observer,)
 
     def detach(self, observer):
         """Detach an observer from this sensor.
@@ -1272,12 +1767,39 @@ class Sensor(object):
             when the sensor value is set.
 
         """
-        self._observers.discard(observer)
+        self.detach_many((observer,))
+
+    def detach_many(self, observers):
+        """Detach several observers from this sensor at once.
+
+        Equivalent to calling :meth:`detach` for each observer, but the
+        tuple of observers is only rebuilt once.
+
+        Parameters
+        ----------
+        observers : iterable of objects
+            The observers to remove from the set of observers notified
+            when the sensor value is set.
+
+        """
+        ids = set(id(observer) for observer in observers)
+        with self._observers_lock:
+            old_observers = self._observers
+            if not old_observers:
+                return
+            new_observers = tuple(o for o in old_observers
+                                  if id(o) not in ids)
+            if len(new_observers) != len(old_observers):
+                self._observers = new_observers
 
     def notify(self, reading):
         """Notify all observers of changes to this sensor."""
-        # copy list before iterating in case new observers arrive
-        for o in list(self._observers):
+        # attach() and detach() replace the tuple rather than modifying it,
+        # so it can be iterated without taking a copy
+        observers = self._observers
+        if not observers:
+            return
+        for o in observers:
             o.update(self, reading)
 
     def parse_value(self, s_value, katcp_major=DEFAULT_KATCP_MAJOR):
@@ -1295,7 +1817,7 @@ class Sensor(object):
             A value of a type appropriate to the sensor.
 
         """
-        return self._parser(s_value, katcp_major)
+        return self._kattype.unpack(s_value, katcp_major)
 
     def set(self, timestamp, status, value):
         """Set the current value of the sensor.
@@ -1312,6 +1834,7 @@ class Sensor(object):
 
         """
         reading = self._current_reading = Reading(timestamp, status, value)
+        self._inform_cache = None
         self.notify(reading)
 
     def set_formatted(self, raw_timestamp, raw_status, raw_value,
@@ -1391,7 +1914,7 @@ class Sensor(object):
         timestamp, status, value = reading
         return (self.TIMESTAMP_TYPE.encode(timestamp, major),
                 self.STATUSES[status],
-                self._formatter(value, True, major))
+                self._kattype.pack(value, True, major))
 
     def read(self):
         """Read the sensor and return a (timestamp, status, value) tuple.
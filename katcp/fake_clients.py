@@ -9,6 +9,7 @@ from thread import get_ident as get_thread_ident
 
 from tornado.gen import Return
 from tornado.concurrent import Future
+from tornado.util import ObjectDict
 
 from katcp import client, server, kattypes, resource, Sensor
 from katcp.core import AttrDict, ProtocolFlags, Message, convert_method_name
@@ -221,6 +222,7 @@ class FakeInspectingClientManager(object):
     def __init__(self, fake_inspecting_client):
         self._fic = fake_inspecting_client
         self._fkc = fake_inspecting_client.katcp_client
+        self._help_informs = {}
         self.add_request_handlers_object(self)
         self.fake_sensor_infos = {}
 
@@ -249,6 +251,7 @@ class FakeInspectingClientManager(object):
         return self._fkc.request_handlers
 
     request_help = server.DeviceServer.request_help.im_func
+    _help_inform_arguments = server.DeviceServer._help_inform_arguments.im_func
 
     def add_sensors(self, sensor_infos):
         """Add fake sensors
@@ -310,10 +313,18 @@ class FakeKATCPServer(object):
     def get_address(self, conn_id):
         return '<fake-client-connection: {!r}>'.format(conn_id)
 
+    def get_write_stats(self, conn_id):
+        return ObjectDict(messages=0, writes=0, batching_factor=0.,
+                          overflows=0, dropped=0, coalesced=0, held=0)
+
     def send_message(self, conn_id, msg):
         raise FakeKATCPServerError(
             'Cannot send messages via fake request/conection object')
 
+    def send_lines(self, conn_id, data):
+        raise FakeKATCPServerError(
+            'Cannot send messages via fake request/conection object')
+
     def mass_send_message(self, msg):
         raise FakeKATCPServerError(
             'Cannot send messages via fake request/conection object')
@@ -332,6 +343,9 @@ class FakeClientRequestConnection(server.ClientRequestConnection):
         inf_msg = Message.reply_inform(self.msg, *args)
         self.informs_sent.append(inf_msg)
 
+    def inform_formatted(self, arg_strs, arguments=None):
+        self._inform_each(arg_strs, arguments)
+
 class FakeAsyncClient(client.AsyncClient):
     """Fake version of :class:`katcp.client.AsyncClient`
 
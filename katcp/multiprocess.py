@@ -0,0 +1,527 @@
+# multiprocess.py
+# -*- coding: utf8 -*-
+# vim:fileencoding=utf8 ai ts=4 sts=4 et sw=4
+# Copyright 2009 SKA South Africa (http://ska.ac.za/)
+# BSD license - see COPYING for details
+
+"""Run a device server in several processes that share one port.
+
+A :class:`DeviceServerPool` forks worker processes that each run their own
+device server on the same port using SO_REUSEPORT, so that the kernel
+spreads client connections over the workers. Sensor readings set in the
+parent process are published in a :class:`SharedSensorTable` and copied to
+the sensors of each worker, where the usual sampling strategies see them.
+
+"""
+
+from __future__ import division, print_function, absolute_import
+
+import errno
+import fcntl
+import logging
+import mmap
+import os
+import select
+import signal
+import socket
+import struct
+import threading
+import time
+
+from itertools import izip
+
+from .core import Reading, Sensor
+
+
+log = logging.getLogger("katcp.multiprocess")
+
+# Sequence number of a table slot, odd while the slot is being written
+_SEQ = struct.Struct('<I')
+# Timestamp, status and value length at the start of each table slot
+_SLOT_HEADER = struct.Struct('<diI')
+# Binary encodings of the values of numeric sensor types, other sensor
+# values are stored in their KATCP format
+_NUMERIC_FORMATS = {
+    'integer': struct.Struct('<q'),
+    'boolean': struct.Struct('<q'),
+    'float': struct.Struct('<d'),
+    'timestamp': struct.Struct('<d'),
+}
+
+
+def _round8(size):
+    return (size + 7) // 8 * 8
+
+
+def _set_nonblocking(fd):
+    flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+    fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+
+
+def _reinit_locks_after_fork():
+    """Replace the locks that other threads may have held during a fork.
+
+    Only the forking thread exists in the child process, so a lock held by
+    any other thread at the time of the fork would never be released.
+
+    """
+    Sensor._OBSERVERS_LOCKS[:] = [threading.Lock()
+                                  for _ in Sensor._OBSERVERS_LOCKS]
+    logging._lock = threading.RLock()
+    for handler_ref in logging._handlerList:
+        handler = handler_ref()
+        if handler is not None:
+            handler.createLock()
+
+
+class SharedSensorTable(object):
+    """Share the readings of sensors with forked processes.
+
+    The readings are kept in an anonymous shared memory map with one
+    fixed-size slot per sensor. Each slot has a sequence number that is odd
+    while the slot is being written, so that readers can detect and retry
+    partial reads. The table attaches itself to the sensors and writes
+    every reading set in the owner process to its slot.
+
+    Readers are added with :meth:`add_reader` before forking them. A
+    forked reader process then calls :meth:`follow`, after which its copies
+    of the sensors are updated from the table in its ioloop, notifying
+    their observers (e.g. sampling strategies) as usual. The owner wakes a
+    reader up through a pipe, at most once per scan of the table by the
+    reader.
+
+    Parameters
+    ----------
+    sensors : sequence of Sensor objects
+        The sensors to share.
+    max_readers : int, optional
+        Maximum number of readers that can be added.
+    value_size : int, optional
+        Maximum length in bytes of the KATCP formatted values of
+        non-numeric sensors.
+
+    """
+
+    READ_RETRIES = 100
+    """Times to retry reading a slot that is being written to."""
+
+    RETRY_DELAY = 0.001
+    """Seconds before rescanning slots that could not be read."""
+
+    def __init__(self, sensors, max_readers=64, value_size=256):
+        self.sensors = list(sensors)
+        self._indices = dict((sensor, i)
+                             for i, sensor in enumerate(self.sensors))
+        self._numeric_formats = [_NUMERIC_FORMATS.get(sensor.stype)
+                                 for sensor in self.sensors]
+        num_sensors = len(self.sensors)
+        self._max_readers = max_readers
+        self._value_size = value_size
+        # Layout: one 'armed' flag byte per reader, the sequence numbers of
+        # all the slots and then the slots themselves
+        self._seq_offset = _round8(max_readers)
+        self._slot_offset = _round8(self._seq_offset + _SEQ.size * num_sensors)
+        self._slot_size = _round8(_SLOT_HEADER.size + value_size)
+        self._seqs = struct.Struct('<%dI' % num_sensors)
+        self._mmap = mmap.mmap(
+            -1, self._slot_offset + self._slot_size * num_sensors)
+        # Owner state: last sequence number written to each slot and the
+        # (reader, pipe write fd) tuples of the readers to wake up
+        self._lock = threading.Lock()
+        self._write_seqs = [0] * num_sensors
+        self._wake_fds = ()
+        # Pipe read fds of the readers, None once closed in this process
+        self._read_fds = []
+        # Reader state
+        self._reader = None
+        self._read_seqs = None
+        self._ioloop = None
+        for sensor in self.sensors:
+            self.update(sensor, sensor.read())
+            sensor.attach(self)
+
+    def update(self, sensor, reading):
+        """Write a sensor reading to the table (called by the sensor).
+
+        Raises
+        ------
+        ValueError
+            If the formatted value is longer than the value_size of the
+            table.
+
+        """
+        i = self._indices[sensor]
+        numeric_format = self._numeric_formats[i]
+        if numeric_format is not None:
+            value = numeric_format.pack(reading.value)
+        else:
+            value = sensor.format_reading(reading)[2]
+            if len(value) > self._value_size:
+                raise ValueError("Value of sensor %r is longer than %d bytes."
+                                 % (sensor.name, self._value_size))
+        mm = self._mmap
+        seq_offset = self._seq_offset + _SEQ.size * i
+        offset = self._slot_offset + self._slot_size * i
+        start = offset + _SLOT_HEADER.size
+        with self._lock:
+            seq = (self._write_seqs[i] + 1) & 0xffffffff
+            _SEQ.pack_into(mm, seq_offset, seq)
+            _SLOT_HEADER.pack_into(mm, offset, reading.timestamp,
+                                   reading.status, len(value))
+            mm[start:start + len(value)] = value
+            seq = self._write_seqs[i] = (seq + 1) & 0xffffffff
+            _SEQ.pack_into(mm, seq_offset, seq)
+            for reader, fd in self._wake_fds:
+                # A reader re-arms its flag before scanning the table, so
+                # only wake it up if it has not been woken since
+                if mm[reader] == '\x01':
+                    mm[reader] = '\x00'
+                    try:
+                        os.write(fd, '\x00')
+                    except OSError:
+                        # The reader has exited or already has a wake-up
+                        # pending in its (full) pipe
+                        pass
+
+    def read(self, sensor):
+        """Read the reading of a sensor from the table.
+
+        Returns
+        -------
+        reading : :class:`katcp.core.Reading` object or None
+            The reading, or None (and a warning is logged) if the slot was
+            being written to for READ_RETRIES attempts.
+
+        """
+        result = self._read_slot(self._indices[sensor])
+        return result and result[1]
+
+    def _read_slot(self, i):
+        """Return (sequence number, reading) of a slot, or None."""
+        mm = self._mmap
+        seq_offset = self._seq_offset + _SEQ.size * i
+        offset = self._slot_offset + self._slot_size * i
+        start = offset + _SLOT_HEADER.size
+        for attempt in range(self.READ_RETRIES):
+            if attempt:
+                # Let the writer finish
+                time.sleep(0)
+            seq = _SEQ.unpack_from(mm, seq_offset)[0]
+            if seq & 1:
+                continue
+            timestamp, status, length = _SLOT_HEADER.unpack_from(mm, offset)
+            raw_value = mm[start:start + min(length, self._value_size)]
+            if _SEQ.unpack_from(mm, seq_offset)[0] != seq:
+                continue
+            numeric_format = self._numeric_formats[i]
+            sensor = self.sensors[i]
+            if numeric_format is not None:
+                value = numeric_format.unpack(raw_value)[0]
+                if sensor.stype == 'boolean':
+                    value = bool(value)
+            else:
+                value = sensor.parse_value(raw_value)
+            return seq, Reading(timestamp, status, value)
+        log.warning('Sensor %r was being written to for %d attempts to read it '
+                    'from the shared sensor table', self.sensors[i].name,
+                    self.READ_RETRIES)
+        return None
+
+    def add_reader(self):
+        """Add a reader and return its index.
+
+        Must be called in the owner process before forking the reader.
+
+        """
+        reader = len(self._read_fds)
+        if reader >= self._max_readers:
+            raise ValueError("The table supports at most %d readers."
+                             % self._max_readers)
+        read_fd, write_fd = os.pipe()
+        _set_nonblocking(read_fd)
+        _set_nonblocking(write_fd)
+        self._read_fds.append(read_fd)
+        with self._lock:
+            self._wake_fds = self._wake_fds + ((reader, write_fd),)
+        return reader
+
+    def _release_reader(self, reader):
+        """Close the owner's copy of the pipe of a forked reader."""
+        os.close(self._read_fds[reader])
+        self._read_fds[reader] = None
+
+    def follow(self, reader, ioloop):
+        """Update the sensors of this process from the table.
+
+        Must be called in a process forked after :meth:`add_reader`
+        returned `reader`. Sensor readings set in this process are no
+        longer written to the table. Readings set in the owner are set on
+        the sensors in the `ioloop` thread.
+
+        """
+        for sensor in self.sensors:
+            sensor.detach(self)
+        for _, fd in self._wake_fds:
+            os.close(fd)
+        self._wake_fds = ()
+        read_fd = self._read_fds[reader]
+        for other_reader, fd in enumerate(self._read_fds):
+            if other_reader != reader and fd is not None:
+                os.close(fd)
+        # The read end of the pipe now belongs to the ioloop handler
+        self._read_fds = []
+        self._reader = reader
+        # Readings written before the fork are already set on the sensors
+        self._read_seqs = list(self._write_seqs)
+        self._ioloop = ioloop
+        ioloop.add_callback(self._start_following, read_fd)
+
+    def _start_following(self, read_fd):
+        self._ioloop.add_handler(read_fd, self._handle_wake,
+                                 self._ioloop.READ)
+        self._refresh()
+
+    def _handle_wake(self, fd, events):
+        while True:
+            try:
+                data = os.read(fd, 4096)
+            except OSError, e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    break
+                raise
+            if not data:
+                # The owner has exited
+                self._ioloop.remove_handler(fd)
+                os.close(fd)
+                break
+        self._refresh()
+
+    def _refresh(self):
+        """Set the readings that changed since the last scan on the sensors."""
+        mm = self._mmap
+        # Re-arm before scanning so that any later update wakes us up again
+        mm[self._reader] = '\x01'
+        read_seqs = self._read_seqs
+        retry = False
+        for i, (seq, read_seq) in enumerate(
+                izip(self._seqs.unpack_from(mm, self._seq_offset), read_seqs)):
+            if seq == read_seq:
+                continue
+            result = self._read_slot(i)
+            if result is None:
+                retry = True
+                continue
+            read_seqs[i], (timestamp, status, value) = result
+            self.sensors[i].set(timestamp, status, value)
+        if retry:
+            self._ioloop.call_later(self.RETRY_DELAY, self._refresh)
+
+    def close(self):
+        """Stop writing the readings of the sensors to the table."""
+        for sensor in self.sensors:
+            sensor.detach(self)
+        with self._lock:
+            wake_fds, self._wake_fds = self._wake_fds, ()
+        for _, fd in wake_fds:
+            os.close(fd)
+        for reader, fd in enumerate(self._read_fds):
+            if fd is not None:
+                self._release_reader(reader)
+
+
+class DeviceServerPool(object):
+    """Run a device server in several processes that listen on one port.
+
+    Forks worker processes that each create a device server by calling
+    `server_factory(host, port)` and serve on the shared port using
+    SO_REUSEPORT (see :attr:`katcp.server.KATCPServer.REUSE_PORT`), so that
+    the kernel spreads new client connections over the workers. If a
+    sensor table is given, each worker follows it, so that sensor readings
+    set in this process reach the sampling strategies of all the workers.
+    A worker stops its device server and exits on SIGTERM.
+
+    The pool should be started before this process starts any other
+    threads (e.g. device servers or ioloop threads), since only the
+    forking thread continues in the workers. The locks of the katcp
+    modules, the table sensors and logging are replaced in the workers in
+    case another thread held them, but other state shared with running
+    threads may still be inconsistent.
+
+    Parameters
+    ----------
+    server_factory : callable, signature server_factory(host, port)
+        Called in each worker process to create the (unstarted)
+        :class:`katcp.DeviceServer`-like server. Its sensors are typically
+        the sensors of `sensor_table`.
+    host : str
+        IP to bind the server sockets on.
+    port : int
+        Port to listen on, or 0 to pick a free port.
+    num_workers : int
+        Number of worker processes.
+    sensor_table : :class:`SharedSensorTable` object, optional
+        Table to publish the sensor readings of this process in.
+    logger : :class:`logging.Logger` object, optional
+        Logger instance to use for logging, defaults to module log.
+
+    """
+
+    def __init__(self, server_factory, host, port, num_workers,
+                 sensor_table=None, logger=log):
+        self._server_factory = server_factory
+        self._bindaddr = (host, port)
+        self._num_workers = num_workers
+        self._sensor_table = sensor_table
+        self._logger = logger
+        self._sock = None
+        self._pids = []
+
+    @property
+    def bind_address(self):
+        """The (host, port) where the workers listen for connections."""
+        return self._bindaddr
+
+    def start(self, timeout=None):
+        """Fork the worker processes.
+
+        Parameters
+        ----------
+        timeout : float or None, optional
+            Time in seconds to wait for all the workers to be listening.
+
+        Returns
+        -------
+        running : bool or None
+            Whether all the workers are listening, if a timeout was given.
+
+        """
+        if self._pids:
+            raise RuntimeError('Device server pool already started')
+        if threading.active_count() > 1:
+            self._logger.warning('Starting device server pool with %d other '
+                                 'threads running, start it before any '
+                                 'threads instead',
+                                 threading.active_count() - 1)
+        # Bind without listening to reserve the port for the workers, which
+        # also turns port 0 into an actual port
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind(self._bindaddr)
+        self._sock = sock
+        self._bindaddr = sock.getsockname()
+        ready_fd, ready_write_fd = os.pipe()
+        try:
+            for _ in range(self._num_workers):
+                reader = None
+                if self._sensor_table is not None:
+                    reader = self._sensor_table.add_reader()
+                pid = self._fork()
+                if pid == 0:
+                    os.close(ready_fd)
+                    self._run_worker(reader, ready_write_fd)
+                if reader is not None:
+                    self._sensor_table._release_reader(reader)
+                self._pids.append(pid)
+            os.close(ready_write_fd)
+            if timeout:
+                return self._wait_ready(ready_fd, timeout)
+        finally:
+            os.close(ready_fd)
+
+    def _fork(self):
+        """Fork a worker while the sensor table is not being written to."""
+        table = self._sensor_table
+        if table is None:
+            pid = os.fork()
+        else:
+            # The worker gets a consistent copy of the table's owner state
+            with table._lock:
+                pid = os.fork()
+        if pid == 0:
+            _reinit_locks_after_fork()
+        return pid
+
+    def _wait_ready(self, ready_fd, timeout):
+        """Wait for a byte from each worker on the ready pipe."""
+        deadline = time.time() + timeout
+        num_ready = 0
+        while num_ready < self._num_workers:
+            remaining = deadline - time.time()
+            if remaining <= 0 or not select.select([ready_fd], [], [],
+                                                   remaining)[0]:
+                return False
+            data = os.read(ready_fd, self._num_workers)
+            if not data:
+                # All the workers have exited or closed the pipe
+                return False
+            num_ready += len(data)
+        return True
+
+    def _run_worker(self, reader, ready_fd):
+        """Serve in a forked worker process until SIGTERM is received."""
+        status = 1
+        try:
+            self._sock.close()
+            stop = threading.Event()
+            signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+            server = self._server_factory(*self._bindaddr)
+            server._server.REUSE_PORT = True
+            server.start()
+            if reader is not None:
+                self._sensor_table.follow(reader, server.ioloop)
+            if server.wait_running(timeout=5):
+                os.write(ready_fd, '\x01')
+            os.close(ready_fd)
+            while not stop.is_set():
+                stop.wait(0.1)
+            server.stop()
+            server.join(timeout=5)
+            status = 0
+        except Exception:
+            self._logger.exception('Error in device server worker process %d'
+                                   % os.getpid())
+        finally:
+            os._exit(status)
+
+    def stop(self):
+        """Ask the worker processes to shut down."""
+        for pid in self._pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                # The worker has already exited
+                pass
+
+    def join(self, timeout=None):
+        """Wait for the worker processes to exit.
+
+        Parameters
+        ----------
+        timeout : float or None, optional
+            Time in seconds to wait for the workers.
+
+        Returns
+        -------
+        stopped : bool
+            Whether all the workers have exited.
+
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        while self._pids:
+            for pid in list(self._pids):
+                try:
+                    exited = os.waitpid(pid, os.WNOHANG)[0]
+                except OSError, e:
+                    if e.errno != errno.ECHILD:
+                        raise
+                    exited = pid
+                if exited:
+                    self._pids.remove(pid)
+            if not self._pids or (deadline and time.time() > deadline):
+                break
+            time.sleep(0.01)
+        if not self._pids and self._sock is not None:
+            self._sock.close()
+            self._sock = None
+        return not self._pids
@@ -472,17 +472,27 @@ class KATCPClientResource(resource.KATCPResource):
             Resolves when done
         """
         sensor_list = yield self.list_sensors(filter=filter)
-        sensor_dict = {}
+        sensor_names = {}
         for sens in sensor_list:
-            # Set the strategy on each sensor
-            try:
-                sensor_name = sens.object.normalised_name
-                yield self.set_sampling_strategy(sensor_name, strategy_and_parms)
+            # Cache the strategy so that it persists across reconnects
+            sensor_name = sens.object.normalised_name
+            self._sensor_strategy_cache[sensor_name] = strategy_and_parms
+            # Only set strategies on sensors that still exist, otherwise
+            # depend on self._add_sensors() to set it when the sensor appears
+            if dict.get(self._sensor, sensor_name):
+                sensor_names[sens.object.name] = sensor_name
+        # Set the strategies in as few requests as the server allows
+        results = yield self._sensor_manager.set_sampling_strategies(
+            list(sensor_names.keys()), strategy_and_parms)
+        sensor_dict = {}
+        for name, (success, info) in list(results.items()):
+            sensor_name = sensor_names[name]
+            if success:
                 sensor_dict[sensor_name] = strategy_and_parms
-            except Exception as exc:
-                self._logger.exception(
-                    'Unhandled exception trying to set sensor strategies {!r} for {} ({})'
-                    .format(strategy_and_parms, sens, exc))
+            else:
+                self._logger.error(
+                    'Error trying to set sensor strategies {!r} for {} ({})'
+                    .format(strategy_and_parms, name, info))
                 sensor_dict[sensor_name] = None
         # Otherwise, depend on self._add_sensors() to handle it from the cache when the sensor appears\
         raise tornado.gen.Return(sensor_dict)
@@ -733,6 +743,9 @@ class KATCPClientResourceSensorsManager(object):
     Assumes that all methods are called from the same ioloop context
     """
 
+    MAX_BULK_SAMPLING_NAMES = 1000
+    """Maximum number of sensor names in one bulk ?sensor-sampling request"""
+
     def __init__(self, inspecting_client, resource_name, logger=log):
         self._inspecting_client = inspecting_client
         self.time = inspecting_client.ioloop.time
@@ -817,10 +830,89 @@ class KATCPClientResourceSensorsManager(object):
             sensor_strategy = (False, str(e))
         raise tornado.gen.Return(sensor_strategy)
 
+    @tornado.gen.coroutine
+    def set_sampling_strategies(self, sensor_names, strategy_and_params):
+        """Set the same sampling strategy for several named sensors
+
+        If the server advertises the bulk sensor sampling protocol flag, the
+        strategy is set using as few ?sensor-sampling requests as possible,
+        otherwise one request per sensor is made. The sensors of a bulk
+        request that fails as a whole are retried one at a time.
+
+        Parameters
+        ----------
+
+        sensor_names : seq of str
+            Names of the sensors
+        strategy_and_params : seq of str or str
+            As for :meth:`set_sampling_strategy`
+
+        Returns
+        -------
+        sensor_strategies : dict
+            Sensor names as keys and a (success, info) tuple as for
+            :meth:`set_sampling_strategy` as values.
+        """
+        sensor_names = list(sensor_names)
+        sensor_strategies = {}
+        if len(sensor_names) < 2 or not self._bulk_sampling_supported():
+            for sensor_name in sensor_names:
+                sensor_strategies[sensor_name] = yield self.set_sampling_strategy(
+                    sensor_name, strategy_and_params)
+            raise tornado.gen.Return(sensor_strategies)
+
+        try:
+            strategy_and_params = resource.normalize_strategy_parameters(
+                strategy_and_params)
+        except Exception as e:
+            self._logger.exception('Exception found!')
+            raise tornado.gen.Return(dict.fromkeys(sensor_names, (False, str(e))))
+        for sensor_name in sensor_names:
+            self._strategy_cache[sensor_name] = strategy_and_params
+
+        chunk_size = self.MAX_BULK_SAMPLING_NAMES
+        for i in range(0, len(sensor_names), chunk_size):
+            chunk = sensor_names[i:i + chunk_size]
+            try:
+                reply = yield self._inspecting_client.wrapped_request(
+                    'sensor-sampling', ','.join(chunk), *strategy_and_params)
+            except Exception:
+                self._logger.exception('Exception found!')
+                reply = None
+            if not reply or not reply.succeeded:
+                self._logger.warn('Bulk sensor-sampling request failed, setting '
+                                  'strategies one sensor at a time: {!s}'
+                                  .format(reply))
+                for sensor_name in chunk:
+                    sensor_strategies[sensor_name] = (
+                        yield self.set_sampling_strategy(
+                            sensor_name, strategy_and_params))
+                continue
+            # Each sensor's result is reported in an inform, with 'fail'
+            # and the reason if its strategy could not be set
+            sensor_strategies.update(
+                dict.fromkeys(chunk, (True, strategy_and_params)))
+            for inform in reply.informs:
+                if len(inform.arguments) > 1 and inform.arguments[1] == 'fail':
+                    sensor_name = inform.arguments[0]
+                    error = KATCPSensorError(
+                        'Error setting strategy for sensor {0}: \n{1!s}'
+                        .format(sensor_name, ' '.join(inform.arguments[2:])))
+                    self._logger.error(str(error))
+                    sensor_strategies[sensor_name] = (False, str(error))
+        raise tornado.gen.Return(sensor_strategies)
+
+    def _bulk_sampling_supported(self):
+        protocol_flags = self._inspecting_client.katcp_client.protocol_flags
+        return bool(protocol_flags and protocol_flags.bulk_set_sensor_sampling)
+
     @tornado.gen.coroutine
     def reapply_sampling_strategies(self):
         """Reapply all sensor strategies using cached values"""
         check_sensor = self._inspecting_client.future_check_sensor
+        # Group sensors by strategy so that each group can be set in bulk
+        # if the server supports it
+        sensors_by_strategy = collections.defaultdict(list)
         for sensor_name, strategy in list(self._strategy_cache.items()):
             try:
                 sensor_exists = yield check_sensor(sensor_name)
@@ -828,15 +920,25 @@ class KATCPClientResourceSensorsManager(object):
                     self._logger.warn('Did not set strategy for non-existing sensor {}'
                              .format(sensor_name))
                     continue
-
-                result = yield self.set_sampling_strategy(sensor_name, strategy)
-            except KATCPSensorError as e:
-                self._logger.error('Error reapplying strategy for sensor {0}: {1!s}'
-                                   .format(sensor_name, e))
+                sensors_by_strategy[tuple(strategy)].append(sensor_name)
             except Exception:
                 self._logger.exception('Unhandled exception reapplying strategy for '
                                        'sensor {}'.format(sensor_name), exc_info=True)
 
+        for strategy, sensor_names in list(sensors_by_strategy.items()):
+            try:
+                results = yield self.set_sampling_strategies(
+                    sensor_names, strategy)
+            except Exception:
+                self._logger.exception('Unhandled exception reapplying strategy {!r} '
+                                       'for sensors {}'.format(strategy, sensor_names),
+                                       exc_info=True)
+                continue
+            for sensor_name, (success, info) in list(results.items()):
+                if not success:
+                    self._logger.error('Error reapplying strategy for sensor {0}: {1!s}'
+                                       .format(sensor_name, info))
+
     @tornado.gen.coroutine
     @steal_docstring_from(resource.KATCPSensorsManager.poll_sensor)
     def poll_sensor(self, sensor_name):
@@ -9,33 +9,146 @@
 from __future__ import division, print_function, absolute_import
 
 import logging
+import math
 import os
+import threading
+import time
 
 import tornado.ioloop
 
 from thread import get_ident as get_thread_ident
 from functools import wraps
+from itertools import izip
 
-from .core import Message, Sensor
+from .core import Message, LazyMessage, Sensor, Reading, DEFAULT_KATCP_MAJOR
+
+# NumPy is optional, SensorBank falls back to per-sensor updates without it
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 
 log = logging.getLogger("katcp.sampling")
 
 AGE_OF_UNIVERSE = 4.32329886e17  # approximate age of the universe
 
+## @brief Names of the counters returned by the get_stats() method of
+#  sampling strategies, in order.
+SAMPLING_STATS_FIELDS = ('informs', 'suppressed', 'superseded',
+                         'timer-fires', 'inform-time')
+
 
 # pylint: disable-msg=W0142
 
 def format_inform_v4(sensor, *reading):
-    timestamp, status, value = sensor.format_reading(reading, 4)
-    return Message.inform(
-        "sensor-status", timestamp, "1", sensor.name, status, value)
+    return _format_inform(sensor, reading, 4)
 
 
 def format_inform_v5(sensor, *reading):
-    timestamp, status, value = sensor.format_reading(reading, 5)
-    return Message.inform(
-        "sensor-status", timestamp, "1", sensor.name, status, value)
+    return _format_inform(sensor, reading, 5)
+
+
+def format_inform_line(sensor, reading, major):
+    """Return the serialised #sensor-status inform for a reading of a sensor.
+
+    The line (including its newline) is formatted once per reading and KATCP
+    version and cached on the sensor, so that all strategies (and client
+    connections) that send the same reading share it. Setting a new reading
+    clears the cache.
+
+    """
+    cache = sensor._inform_cache
+    if cache is not None and cache[1] == major and cache[0] == reading:
+        return cache[2]
+    timestamp, status, value = sensor.format_reading(reading, major)
+    line = str(Message.trusted(Message.INFORM, "sensor-status",
+                               [timestamp, "1", sensor.name, status,
+                                value])) + "\n"
+    sensor._inform_cache = (reading, major, line)
+    return line
+
+
+def _format_inform(sensor, reading, major):
+    """Return the #sensor-status inform for a reading of a sensor.
+
+    Messages are mutable, so every call returns a new message, but they
+    all wrap the line cached by :func:`format_inform_line`.
+
+    """
+    line = format_inform_line(sensor, reading, major)
+    return LazyMessage.from_line(line[:-1], Message.INFORM, "sensor-status",
+                                 None, len("#sensor-status "))
+
+
+class SensorStatusPacker(object):
+    """Packs readings into multi-sensor #sensor-status informs.
+
+    Readings added during one ioloop iteration are collected and sent at the
+    end of it, with all readings that share a timestamp packed into a single
+    inform with a sensor count larger than one.
+
+    Parameters
+    ----------
+    send_inform : callable, signature send_inform(msg)
+        Called with each #sensor-status inform to send.
+    ioloop : tornado.ioloop.IOLoop instance
+        The ioloop in which readings are added.
+    major : int
+        Major version of KATCP to use when formatting readings.
+    max_count : int or None
+        Maximum number of sensors in a single inform, or None for no limit.
+
+    """
+
+    def __init__(self, send_inform, ioloop, major=DEFAULT_KATCP_MAJOR,
+                 max_count=None):
+        self._send_inform = send_inform
+        self.ioloop = ioloop
+        self.major = major
+        self.max_count = max_count
+        # Map from formatted timestamp to list of name, status, value args
+        self._pending = {}
+        # Formatted timestamps in the order they were first added
+        self._timestamps = []
+
+    def add(self, sensor, reading, schedule_flush=True):
+        """Add a sensor reading to be sent at the end of the iteration.
+
+        If `schedule_flush` is false, no flush is scheduled for the end of
+        the iteration and the caller must call :meth:`flush` itself.
+
+        """
+        timestamp, status, value = sensor.format_reading(reading, self.major)
+        args = self._pending.get(timestamp)
+        if args is None:
+            if schedule_flush and not self._pending:
+                self.ioloop.add_callback(self.flush)
+            args = self._pending[timestamp] = []
+            self._timestamps.append(timestamp)
+        args.extend((sensor.name, status, value))
+
+    def close(self):
+        """Drop all pending readings, e.g. when the client disconnects.
+
+        A flush that is already scheduled then sends nothing.
+
+        """
+        self._pending = {}
+        self._timestamps = []
+
+    def flush(self):
+        """Send all pending readings."""
+        pending, self._pending = self._pending, {}
+        timestamps, self._timestamps = self._timestamps, []
+        step = 3 * self.max_count if self.max_count else None
+        for timestamp in timestamps:
+            args = pending[timestamp]
+            for start in range(0, len(args), step or len(args)):
+                chunk = args[start:start + step] if step else args
+                self._send_inform(Message.trusted(
+                    Message.INFORM, "sensor-status",
+                    [timestamp, str(len(chunk) // 3)] + chunk))
 
 
 def update_in_ioloop(update):
@@ -47,18 +160,179 @@ def update_in_ioloop(update):
     (the ioloop instance in use). Also assumes the signature
     `update(self, sensor, reading)` for the method.
 
+    If the object has a true :attr:`_coalesce_updates` attribute (see
+    :class:`SampleStrategy`), updates from other threads are coalesced so
+    that at most one callback is pending and only the latest reading is
+    delivered.
+
 
     """
     @wraps(update)
     def wrapped_update(self, sensor, reading):
         if get_thread_ident() == self._ioloop_thread_id:
             update(self, sensor, reading)
+        elif getattr(self, '_coalesce_updates', False):
+            self._coalesce_update(update, sensor, reading)
         else:
-            self.ioloop.add_callback(update, self, sensor, reading)
+            batch = getattr(_batch_local, 'batch', None)
+            if batch is None:
+                self.ioloop.add_callback(update, self, sensor, reading)
+            else:
+                batch.add_update(self.ioloop, update, self, sensor, reading)
 
     return wrapped_update
 
 
+# Holds the SensorBatch (if any) that is active in each thread
+_batch_local = threading.local()
+
+
+class SensorBatch(object):
+    """Context manager that batches sensor updates made in a thread.
+
+    Sensors updated inside the context are set immediately, but the updates
+    that sampling strategies would each hand over to their ioloop with a
+    separate callback are collected and delivered in a single ioloop
+    callback per ioloop when the outermost context exits, e.g.::
+
+        with SensorBatch():
+            for sensor, value in readings:
+                sensor.set_value(value)
+
+    Updates made from within the ioloop thread itself are not deferred.
+    Nested contexts in the same thread are merged into the outermost one.
+
+    """
+
+    def __init__(self):
+        self._outer = None
+        # Mapping from ioloop to list of (update, args) tuples, in order
+        self._updates = {}
+
+    def __enter__(self):
+        self._outer = getattr(_batch_local, 'batch', None)
+        if self._outer is None:
+            _batch_local.batch = self
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._outer is None:
+            _batch_local.batch = None
+            self.flush()
+
+    def add_update(self, ioloop, update, *args):
+        """Defer a call of update(*args) in the given ioloop to the flush."""
+        self._updates.setdefault(ioloop, []).append((update, args))
+
+    def flush(self):
+        """Hand over all deferred updates, one callback per ioloop."""
+        updates, self._updates = self._updates, {}
+        for ioloop, calls in updates.items():
+            ioloop.add_callback(self._run_updates, calls)
+
+    @staticmethod
+    def _run_updates(calls):
+        for update, args in calls:
+            try:
+                update(*args)
+            except Exception:
+                log.exception('Unhandled exception in batched sensor update')
+
+
+class _PeriodicEntry(object):
+    """Callback registered with a :class:`PeriodicScheduler`."""
+
+    __slots__ = ['callback', 'key']
+
+    def __init__(self, callback, key):
+        self.callback = callback
+        self.key = key
+
+
+class PeriodicScheduler(object):
+    """Calls many periodic callbacks from a shared set of ioloop timeouts.
+
+    Callbacks with the same period whose next call falls in the same time
+    slot of `resolution` seconds are grouped in a bucket that is driven by a
+    single ioloop timeout, instead of each callback scheduling its own.
+    Adding and removing a callback is O(1). Must only be used from the
+    ioloop thread.
+
+    Parameters
+    ----------
+    ioloop : tornado.ioloop.IOLoop instance
+        The ioloop to schedule the timeouts on.
+    resolution : float
+        Size in seconds of the time slots used to group callbacks. Callbacks
+        may be called up to this much earlier than their exact phase.
+
+    """
+
+    def __init__(self, ioloop, resolution=0.01):
+        self.ioloop = ioloop
+        self.resolution = resolution
+        # Map from (period, slot) key to set of _PeriodicEntry objects
+        self._buckets = {}
+        # Map from (period, slot) key to ioloop timeout handle
+        self._timeouts = {}
+
+    def add(self, callback, period, next_time):
+        """Call `callback()` every `period` seconds, starting at `next_time`.
+
+        Returns
+        -------
+        entry : object
+            Handle to pass to :meth:`remove`.
+
+        """
+        entry = _PeriodicEntry(callback, None)
+        self._add_entries([entry], period, next_time)
+        return entry
+
+    def remove(self, entry):
+        """Stop calling the callback registered with the given handle."""
+        key = entry.key
+        # Also marks the entry as removed while its bucket is being run
+        entry.key = None
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            return
+        bucket.discard(entry)
+        if not bucket:
+            del self._buckets[key]
+            self.ioloop.remove_timeout(self._timeouts.pop(key))
+
+    def _add_entries(self, entries, period, next_time):
+        key = (period, int(math.floor(next_time / self.resolution)))
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = set()
+            self._timeouts[key] = self.ioloop.call_at(
+                next_time, self._run_bucket, key, next_time)
+        for entry in entries:
+            entry.key = key
+            bucket.add(entry)
+
+    def _run_bucket(self, key, fire_time):
+        del self._timeouts[key]
+        bucket = self._buckets.pop(key)
+        for entry in list(bucket):
+            try:
+                entry.callback()
+            except Exception:
+                log.exception('Unhandled exception in periodic callback')
+        # Callbacks may have removed themselves
+        bucket = [entry for entry in bucket if entry.key == key]
+        if bucket:
+            period = key[0]
+            now = self.ioloop.time()
+            next_time = fire_time + period
+            if next_time < now:
+                # Catch up if we have fallen far behind
+                next_time = now + period
+            self._add_entries(bucket, period, next_time)
+
+
 class SampleStrategy(object):
     """Base class for strategies for sampling sensors.
 
@@ -99,11 +373,28 @@ class SampleStrategy(object):
     OBSERVE_UPDATES = False
     "True if a strategy must be attached to its sensor as an observer"
 
+    INFORM_TIMING_INTERVAL = 16
+    """Only one in this many informs is timed to estimate inform_time"""
+
     def __init__(self, inform_callback, sensor, *params, **kwargs):
         self.ioloop = kwargs.get('ioloop') or tornado.ioloop.IOLoop.current()
         self._inform_callback = inform_callback
         self._sensor = sensor
         self._params = params
+        self._coalesce_updates = kwargs.get('coalesce_updates', False)
+        self._pending_update = None
+        # Protects _pending_update, only needed when coalescing
+        self._coalesce_lock = (threading.Lock() if self._coalesce_updates
+                               else None)
+        self._cancelled = False
+        # Number of readings from other threads that were replaced by a
+        # newer reading before they were delivered (when coalescing)
+        self.superseded_updates = 0
+        # Instrumentation, see get_stats()
+        self.informs_sent = 0
+        self.suppressed_updates = 0
+        self.timer_fires = 0
+        self.inform_time = 0.0
 
     @classmethod
     def get_strategy(cls, strategyName, inform_callback, sensor,
@@ -125,6 +416,11 @@ class SampleStrategy(object):
         -----------------
         ioloop : tornado.ioloop.IOLoop instance, optional
             Tornado ioloop to use, otherwise tornado.ioloop.IOLoop.current()
+        coalesce_updates : bool, optional
+            If True, sensor updates made outside the ioloop thread are
+            coalesced: at most one ioloop callback is pending at a time and
+            only the latest reading is delivered. Superseded readings are
+            counted in :attr:`superseded_updates`. Default is False.
 
         Returns
         -------
@@ -179,6 +475,39 @@ class SampleStrategy(object):
         """
         pass
 
+    def _coalesce_update(self, update, sensor, reading):
+        with self._coalesce_lock:
+            pending = self._pending_update
+            self._pending_update = (update, sensor, reading)
+            if pending is not None:
+                self.superseded_updates += 1
+        if pending is None:
+            self.ioloop.add_callback(self._run_pending_update)
+
+    def _run_pending_update(self):
+        with self._coalesce_lock:
+            pending, self._pending_update = self._pending_update, None
+        if pending is not None:
+            update, sensor, reading = pending
+            update(self, sensor, reading)
+
+    def get_stats(self):
+        """Counters describing the load caused by this strategy.
+
+        Returns
+        -------
+        stats : tuple
+            Values of the counters named in :data:`SAMPLING_STATS_FIELDS`:
+            the number of informs sent, sensor updates suppressed by the
+            strategy's rate limit, updates superseded while coalescing,
+            ioloop timer callbacks run, and the total time in seconds spent
+            in the inform callback. The time is estimated by timing only one
+            in :attr:`INFORM_TIMING_INTERVAL` informs.
+
+        """
+        return (self.informs_sent, self.suppressed_updates,
+                self.superseded_updates, self.timer_fires, self.inform_time)
+
     def get_sampling(self):
         """The Strategy constant for this sampling strategy.
 
@@ -225,6 +554,7 @@ class SampleStrategy(object):
 
     def cancel(self):
         """Detach strategy from its sensor and cancel ioloop callbacks."""
+        self._cancelled = True
         if self.OBSERVE_UPDATES:
             self.detach()
         self.ioloop.add_callback(self.cancel_timeouts)
@@ -246,18 +576,72 @@ class SampleStrategy(object):
 
     def inform(self, reading):
         """Inform strategy creator of the sensor status."""
+        self.informs_sent += 1
+        interval = self.INFORM_TIMING_INTERVAL
+        timed = self.informs_sent % interval == 1 % interval
+        if timed:
+            start_time = time.time()
         try:
             self._inform_callback(self._sensor, reading)
         except Exception:
             log.exception('Unhandled exception trying to send {!r} '
                           'for sensor {!r} of type {!r}'
                           .format(reading, self._sensor.name, self._sensor.type))
+        if timed:
+            self.inform_time += (time.time() - start_time) * interval
 
     def cancel_timeouts(self):
         """Override this method to cancel any outstanding ioloop timeouts."""
         pass
 
 
+def cancel_strategies(strategies):
+    """Cancel many sampling strategies at once.
+
+    Equivalent to calling :meth:`SampleStrategy.cancel` on each strategy,
+    but the ioloop callbacks of the strategies are cancelled directly if
+    called from their ioloop thread, or else in a single callback per
+    ioloop, instead of scheduling a callback per strategy. Strategies
+    observing the same sensor are detached from it with a single
+    :meth:`katcp.Sensor.detach_many` call. Sensors keep their observers in
+    a tuple, and every detach scans and rebuilds it, so this keeps
+    the cost per sensor linear rather than quadratic in its number of
+    observers.
+
+    Parameters
+    ----------
+    strategies : iterable of SampleStrategy objects
+        The strategies to cancel.
+
+    """
+    current_thread_id = get_thread_ident()
+    # Map ioloop to list of strategies whose timeouts must be cancelled there
+    deferred = {}
+    # Map sensor ID to (sensor, strategies to detach from it)
+    observing = {}
+    for strategy in strategies:
+        strategy._cancelled = True
+        if strategy.OBSERVE_UPDATES:
+            sensor = strategy._sensor
+            observing.setdefault(id(sensor), (sensor, []))[1].append(strategy)
+        if getattr(strategy, '_ioloop_thread_id', None) == current_thread_id:
+            strategy.cancel_timeouts()
+        else:
+            deferred.setdefault(strategy.ioloop, []).append(strategy)
+    for sensor, sensor_strategies in observing.values():
+        sensor.detach_many(sensor_strategies)
+    for ioloop, ioloop_strategies in deferred.items():
+        ioloop.add_callback(_cancel_timeouts, ioloop_strategies)
+
+
+def _cancel_timeouts(strategies):
+    for strategy in strategies:
+        try:
+            strategy.cancel_timeouts()
+        except Exception:
+            log.exception('Unhandled exception cancelling strategy timeouts')
+
+
 class SampleAuto(SampleStrategy):
     """Strategy which sends updates whenever the sensor itself is updated."""
 
@@ -302,6 +686,9 @@ class SampleDifferential(SampleStrategy):
 
     OBSERVE_UPDATES = True
 
+    ## @brief (group, index) of each SensorBank group tracking the state
+    _bank_slots = ()
+
     def __init__(self, inform_callback, sensor, *params, **kwargs):
         SampleStrategy.__init__(self, inform_callback, sensor, *params, **kwargs)
         if len(params) != 1:
@@ -337,9 +724,18 @@ class SampleDifferential(SampleStrategy):
         _timestamp, status, value = reading
         if (status != self._lastStatus or
                 abs(value - self._lastValue) > self._threshold):
-            self._lastStatus = status
-            self._lastValue = value
-            self.inform(reading)
+            self._handle_change(reading)
+
+    def _differential_state(self):
+        """Return (threshold, last status, last value) for SensorBank."""
+        return self._threshold, self._lastStatus, self._lastValue
+
+    def _handle_change(self, reading):
+        """Send a reading known to differ enough from the last one."""
+        _timestamp, self._lastStatus, self._lastValue = reading
+        for group, k in self._bank_slots:
+            group.set_state(k, self._lastStatus, self._lastValue)
+        self.inform(reading)
 
     def get_sampling(self):
         return SampleStrategy.DIFFERENTIAL
@@ -360,16 +756,29 @@ class SamplePeriod(SampleStrategy):
                              "Parameters passed: %r, in pid : %s"
                              % (params, os.getpid()))
         self._period = period
+        self._scheduler = kwargs.get('scheduler')
+        self._scheduler_entry = None
 
     def start(self):
         super(SamplePeriod, self).start()
         def start_periodic_sampling():
-            self.next_time = self.ioloop.time()
-            self._run_once()
+            if self._scheduler is None:
+                self.next_time = self.ioloop.time()
+                self._run_once()
+            elif not self._cancelled:
+                self._sample()
+                self._scheduler_entry = self._scheduler.add(
+                    self._sample, self._period,
+                    self.ioloop.time() + self._period)
         self.ioloop.add_callback(start_periodic_sampling)
 
+    def _sample(self):
+        self.timer_fires += 1
+        self.inform(self._sensor.read())
+
     def _run_once(self):
         assert get_thread_ident() == self._ioloop_thread_id
+        self.timer_fires += 1
         now = self.ioloop.time()
         self.inform(self._sensor.read())
         self.next_time += self._period
@@ -382,8 +791,155 @@ class SamplePeriod(SampleStrategy):
     def get_sampling(self):
         return SampleStrategy.PERIOD
 
+    def cancel(self):
+        self._cancelled = True
+        if (self._scheduler is not None and
+                get_thread_ident() == getattr(self, '_ioloop_thread_id', None)):
+            # Removal from the shared scheduler is cheap, do it right away
+            self.cancel_timeouts()
+        else:
+            super(SamplePeriod, self).cancel()
+
     def cancel_timeouts(self):
-        self.ioloop.remove_timeout(self.next_timeout_handle)
+        if self._scheduler is None:
+            self.ioloop.remove_timeout(self.next_timeout_handle)
+        elif self._scheduler_entry is not None:
+            self._scheduler.remove(self._scheduler_entry)
+            self._scheduler_entry = None
+
+
+class SamplePatternPeriod(object):
+    """Periodic sampling of all sensors with names matching a pattern.
+
+    Takes the place of a separate period strategy per sensor. Every period
+    the readings of all matching sensors are sent in multi-sensor
+    #sensor-status informs (see :class:`SensorStatusPacker`). Sensors may be
+    added and removed while the strategy is running. Must only be used from
+    the ioloop thread.
+
+    Parameters
+    ----------
+    send_inform : callable, signature send_inform(msg)
+        Called with each #sensor-status inform to send.
+    pattern : str
+        The name pattern, as passed to the request.
+    name_filter : callable, signature name_filter(name) -> bool
+        Returns True for the names of sensors to sample.
+    period : float or str
+        Sampling period in seconds.
+
+    Keyword Arguments
+    -----------------
+    ioloop : tornado.ioloop.IOLoop instance, optional
+        Tornado ioloop to use, otherwise tornado.ioloop.IOLoop.current()
+    scheduler : :class:`PeriodicScheduler` instance, optional
+        Scheduler to use, otherwise one is created for the strategy.
+    major : int, optional
+        Major version of KATCP to use when formatting readings.
+
+    """
+
+    ## @brief Maximum number of sensors in a single inform.
+    MAX_SENSORS_PER_INFORM = 256
+
+    ## @brief Only one in this many samples is timed to estimate inform_time.
+    INFORM_TIMING_INTERVAL = SampleStrategy.INFORM_TIMING_INTERVAL
+
+    def __init__(self, send_inform, pattern, name_filter, period, **kwargs):
+        self._params = (period,)
+        period = float(period)
+        if period <= 0:
+            raise ValueError("The period must be a positive float in "
+                             "seconds.")
+        self.pattern = pattern
+        self.ioloop = kwargs.get('ioloop') or tornado.ioloop.IOLoop.current()
+        self._name_filter = name_filter
+        self._period = period
+        self._scheduler = (kwargs.get('scheduler') or
+                           PeriodicScheduler(self.ioloop))
+        self._send_inform = send_inform
+        self._packer = SensorStatusPacker(
+            self._count_inform, self.ioloop,
+            kwargs.get('major', DEFAULT_KATCP_MAJOR),
+            self.MAX_SENSORS_PER_INFORM)
+        # Instrumentation, see SampleStrategy.get_stats()
+        self.informs_sent = 0
+        self.timer_fires = 0
+        self.inform_time = 0.0
+        # Map from name to matching sensor
+        self._sensors = {}
+        # Matching sensors sorted by name, or None if it needs updating
+        self._sorted_sensors = None
+        self._scheduler_entry = None
+
+    def add_sensor(self, sensor):
+        """Start sampling the sensor if its name matches the pattern."""
+        if self._name_filter(sensor.name):
+            self._sensors[sensor.name] = sensor
+            self._sorted_sensors = None
+
+    def remove_sensor(self, sensor):
+        """Stop sampling the sensor."""
+        if self._sensors.get(sensor.name) is sensor:
+            del self._sensors[sensor.name]
+            self._sorted_sensors = None
+
+    def start(self, sensors):
+        """Start sampling the matching sensors from an iterable of sensors."""
+        for sensor in sensors:
+            self.add_sensor(sensor)
+        self._sample()
+        self._scheduler_entry = self._scheduler.add(
+            self._sample, self._period, self.ioloop.time() + self._period)
+
+    def cancel(self):
+        """Stop sampling."""
+        if self._scheduler_entry is not None:
+            self._scheduler.remove(self._scheduler_entry)
+            self._scheduler_entry = None
+
+    def get_sampling_formatted(self):
+        """The current sampling strategy and parameters.
+
+        Returns
+        -------
+        strategy_name : string
+            KATCP name for the strategy.
+        params : list of strings
+            KATCP formatted parameters for the strategy.
+
+        """
+        return SampleStrategy.SAMPLING_LOOKUP[SampleStrategy.PERIOD], [
+            str(p) for p in self._params]
+
+    def get_stats(self):
+        """Counters describing the load caused by this strategy.
+
+        See :meth:`SampleStrategy.get_stats`.
+
+        """
+        return (self.informs_sent, 0, 0, self.timer_fires, self.inform_time)
+
+    def _count_inform(self, msg):
+        self.informs_sent += 1
+        self._send_inform(msg)
+
+    def _sample(self):
+        self.timer_fires += 1
+        interval = self.INFORM_TIMING_INTERVAL
+        timed = self.timer_fires % interval == 1 % interval
+        if timed:
+            start_time = time.time()
+        sensors = self._sorted_sensors
+        if sensors is None:
+            sensors = self._sorted_sensors = [
+                self._sensors[name] for name in sorted(self._sensors)]
+        add = self._packer.add
+        for sensor in sensors:
+            add(sensor, sensor.read(), False)
+        self._packer.flush()
+        if timed:
+            self.inform_time += (time.time() - start_time) * interval
 
 
 class SampleEventRate(SampleStrategy):
@@ -433,6 +989,7 @@ class SampleEventRate(SampleStrategy):
             # Ignore stupidly long periods
             self._periodic_timeout_handle = None
             return
+        self.timer_fires += 1
         if self.ioloop.time() >= self._not_after:
             self.inform(self._sensor.read())
         # We depend on self.inform() having updated self._not_after
@@ -441,6 +998,7 @@ class SampleEventRate(SampleStrategy):
 
     def _short_timeout_handler(self):
         self._short_timeout_handle = None
+        self.timer_fires += 1
         if (self.ioloop.time() >= self._not_before):
             self.inform(self._sensor.read())
 
@@ -455,9 +1013,14 @@ class SampleEventRate(SampleStrategy):
         if not sensor_changed:
             # Ignore update if sensor value/status is unchanged
             return
+        self._handle_change(reading)
+
+    def _handle_change(self, reading):
+        """Send (or schedule) a reading known to differ from the last one."""
         now = self.ioloop.time()
         if now < self._not_before:
             # Too soon to send an update again
+            self.suppressed_updates += 1
             if not self._short_timeout_handle:
                 # Make sure we schedule a callback to send the sensor value as
                 # soon as the minimum period since the last update has expired
@@ -529,7 +1092,211 @@ class SampleDifferentialRate(SampleEventRate):
         # but should let it return True
         self._last_reading_sent = (None, None, 1e99)
 
+    ## @brief (group, index) of each SensorBank group tracking the state
+    _bank_slots = ()
+
     def _sensor_changed(self, reading):
         _, status, value = reading
         _, last_s, last_v = self._last_reading_sent
         return (abs(value - last_v) > self.difference or status != last_s)
+
+    def inform(self, reading):
+        SampleEventRate.inform(self, reading)
+        for group, k in self._bank_slots:
+            group.set_state(k, reading[1], reading[2])
+
+    def _differential_state(self):
+        """Return (threshold, last status, last value) for SensorBank."""
+        _, last_s, last_v = self._last_reading_sent
+        return self.difference, last_s, last_v
+
+
+class SensorBank(object):
+    """Set the values of a bank of numeric sensors from one array.
+
+    Setting each sensor of a large bank (e.g. one float sensor per antenna
+    and channel) with :meth:`Sensor.set` calls every observer once per
+    sensor. A SensorBank instead sets all the readings in one pass and,
+    if NumPy is available, decides which differential and
+    differential-rate strategies see a change larger than their threshold
+    in one vectorised step per ioloop. Only the strategies whose threshold
+    was crossed are then updated. Other observers are updated as usual.
+
+    Without NumPy, :meth:`set_values` falls back to calling
+    :meth:`Sensor.set` for each sensor.
+
+    The readings are stored directly, bypassing :meth:`Sensor.set` and
+    :meth:`Sensor.set_value`, so sensors whose class overrides either
+    method are refused.
+
+    Parameters
+    ----------
+    sensors : sequence of Sensor objects
+        Integer or float sensors, in the order of the values that will be
+        passed to :meth:`set_values`.
+
+    """
+
+    def __init__(self, sensors):
+        self.sensors = list(sensors)
+        for sensor in self.sensors:
+            if sensor.stype not in ('integer', 'float'):
+                raise ValueError("Sensor %r is not an integer or float sensor."
+                                 % sensor.name)
+            sensor_class = type(sensor)
+            if (sensor_class.set.im_func is not Sensor.set.im_func or
+                    sensor_class.set_value.im_func is not
+                    Sensor.set_value.im_func):
+                raise ValueError("Sensor %r overrides set() or set_value()."
+                                 % sensor.name)
+        # Observers of the sensors, as a list of _DifferentialGroup objects
+        # and a list of (observer, index) tuples for other observers, valid
+        # while each sensor still has the observer tuple in _observer_tuples
+        # (attach() and detach() replace the tuple)
+        self._groups = []
+        self._other_observers = []
+        self._observer_tuples = [None] * len(self.sensors)
+
+    def set_values(self, values, status=Sensor.NOMINAL, timestamp=None):
+        """Set the values of all the sensors in the bank.
+
+        Parameters
+        ----------
+        values : sequence or NumPy array
+            New sensor values, one per sensor in the bank.
+        status : Sensor status constant, optional
+            Status of all the new readings (the default is NOMINAL).
+        timestamp : float, optional
+            Time in seconds of all the new readings (the default is now).
+
+        """
+        if len(values) != len(self.sensors):
+            raise ValueError("Expected %d values, got %d."
+                             % (len(self.sensors), len(values)))
+        if timestamp is None:
+            timestamp = time.time()
+        if numpy is None:
+            for sensor, value in izip(self.sensors, values):
+                sensor.set(timestamp, status, value)
+            return
+
+        values = numpy.asarray(values)
+        readings = []
+        append = readings.append
+        # Replace each reading as it is created so that the old readings are
+        # freed along the way, which keeps the cyclic GC from kicking in
+        for sensor, value in izip(self.sensors, values.tolist()):
+            reading = sensor._current_reading = Reading(
+                timestamp, status, value)
+            sensor._inform_cache = None
+            append(reading)
+
+        if any(sensor._observers is not observers for sensor, observers
+               in izip(self.sensors, self._observer_tuples)):
+            self._update_observers()
+        # The caller may reuse its buffer, so groups in other threads get a
+        # copy of the values
+        values_copy = None
+        for group in self._groups:
+            if get_thread_ident() == group.ioloop_thread_id:
+                group.update(values, readings, status)
+            else:
+                if values_copy is None:
+                    values_copy = values.copy()
+                group.ioloop.add_callback(group.update, values_copy,
+                                          readings, status)
+        sensors = self.sensors
+        for observer, i in self._other_observers:
+            observer.update(sensors[i], readings[i])
+
+    def _update_observers(self):
+        self._observer_tuples = [sensor._observers for sensor in self.sensors]
+        for group in self._groups:
+            group.ioloop.add_callback(group.close)
+        # Map ioloop to list of (index, strategy) tuples
+        entries = {}
+        self._other_observers = []
+        for i, observers in enumerate(self._observer_tuples):
+            for observer in observers or ():
+                if isinstance(observer, _DIFFERENTIAL_STRATEGIES):
+                    entries.setdefault(observer.ioloop, []).append(
+                        (i, observer))
+                else:
+                    self._other_observers.append((observer, i))
+        self._groups = [_DifferentialGroup(ioloop, group_entries)
+                        for ioloop, group_entries in entries.items()]
+
+
+class _DifferentialGroup(object):
+    """Differential strategies of a SensorBank that share an ioloop.
+
+    The threshold, last status and last value of each strategy are kept in
+    arrays. The strategies write changes to their state through to the
+    arrays via their :attr:`_bank_slots` while the group is open, so the
+    arrays stay valid even if the strategies are also updated one by one.
+    All methods except the constructor run in the ioloop thread.
+
+    """
+
+    def __init__(self, ioloop, entries):
+        self.ioloop = ioloop
+        self._indices = numpy.array([i for i, _ in entries], int)
+        self._strategies = [strategy for _, strategy in entries]
+        self._thresholds = None
+        self._last_statuses = None
+        self._last_values = None
+        self._closed = False
+
+    @property
+    def ioloop_thread_id(self):
+        return getattr(self._strategies[0], '_ioloop_thread_id', None)
+
+    def _open(self):
+        states = [strategy._differential_state()
+                  for strategy in self._strategies]
+        self._thresholds = numpy.array([state[0] for state in states], float)
+        # None (nothing sent yet) becomes NaN, which never compares equal
+        self._last_statuses = numpy.array(
+            [numpy.nan if state[1] is None else state[1] for state in states],
+            float)
+        self._last_values = numpy.array(
+            [numpy.nan if state[2] is None else state[2] for state in states],
+            float)
+        for k, strategy in enumerate(self._strategies):
+            strategy._bank_slots = strategy._bank_slots + ((self, k),)
+
+    def set_state(self, k, status, value):
+        """Record the last status and value of the k'th strategy."""
+        self._last_statuses[k] = status
+        self._last_values[k] = value
+
+    def close(self):
+        """Stop tracking the state of the strategies."""
+        self._closed = True
+        if self._thresholds is not None:
+            for k, strategy in enumerate(self._strategies):
+                strategy._bank_slots = tuple(
+                    slot for slot in strategy._bank_slots if slot != (self, k))
+
+    def update(self, values, readings, status):
+        """Update the strategies whose threshold was crossed."""
+        if self._closed:
+            return
+        if self._thresholds is None:
+            self._open()
+        new_values = values[self._indices]
+        with numpy.errstate(invalid='ignore'):
+            # NaN differences (nothing sent yet) count as a change
+            crossed = ~(numpy.abs(new_values - self._last_values) <=
+                        self._thresholds)
+        crossed |= self._last_statuses != status
+        indices = self._indices
+        strategies = self._strategies
+        for k in numpy.flatnonzero(crossed).tolist():
+            try:
+                strategies[k]._handle_change(readings[indices[k]])
+            except Exception:
+                log.exception('Unhandled exception in differential update')
+
+
+_DIFFERENTIAL_STRATEGIES = (SampleDifferential, SampleDifferentialRate)
@@ -15,12 +15,14 @@ import logging
 import sys
 import re
 import time
+import itertools
+import bisect
 
 import tornado.ioloop
 import tornado.tcpserver
 
 from functools import partial, wraps
-from collections import deque
+from collections import deque, OrderedDict
 from thread import get_ident as get_thread_ident
 
 from tornado import gen, iostream
@@ -31,9 +33,13 @@ from concurrent.futures import Future
 
 from .ioloop_manager import IOLoopManager, with_relative_timeout
 from .core import (DeviceServerMetaclass, Message, MessageParser,
-                   FailReply, AsyncReply, ProtocolFlags)
-from .sampling import SampleStrategy, SampleNone
-from .sampling import format_inform_v5, format_inform_v4
+                   FailReply, AsyncReply, ProtocolFlags, LatencyTimer,
+                   LineSplitter, Sensor)
+from .sampling import (SampleStrategy, SampleNone, PeriodicScheduler,
+                       SensorStatusPacker, SamplePatternPeriod,
+                       SAMPLING_STATS_FIELDS, cancel_strategies)
+from .sampling import (format_inform_v5, format_inform_v4,
+                       format_inform_line)
 from .core import (SEC_TO_MS_FAC, MS_TO_SEC_FAC, SEC_TS_KATCP_MAJOR,
                    VERSION_CONNECT_KATCP_MAJOR, DEFAULT_KATCP_MAJOR)
 from .kattypes import (request, return_reply,
@@ -107,6 +113,29 @@ def construct_name_filter(pattern):
     return True, lambda name: name == pattern
 
 
+def format_inform_arguments(name, arguments):
+    """Serialise the arguments of an inform message.
+
+    The result can be cached and later sent with
+    :meth:`ClientRequestConnection.inform_formatted`.
+
+    Parameters
+    ----------
+    name : str
+        The name of the inform message.
+    arguments : list of objects
+        The inform arguments.
+
+    Returns
+    -------
+    arg_str : str
+        The escaped arguments, each preceded by a space.
+
+    """
+    inform = Message.trusted(Message.INFORM, name, arguments)
+    return str(inform)[len(name) + 1:]
+
+
 class ClientConnection(object):
     """Encapsulates the connection between a single client and the server."""
 
@@ -115,7 +144,9 @@ class ClientConnection(object):
         self._conn_key = conn_id
         self._disconnect_called = False
         self._get_address = partial(server.get_address, conn_id)
+        self._get_write_stats = partial(server.get_write_stats, conn_id)
         self._send_message = partial(server.send_message, conn_id)
+        self._send_lines = partial(server.send_lines, conn_id)
         self._mass_send_message = server.mass_send_message
         self.flush_on_close = partial(server.flush_on_close, conn_id)
 
@@ -123,6 +154,16 @@ class ClientConnection(object):
     def address(self):
         return self._get_address()
 
+    @property
+    def ioloop(self):
+        """The IOLoop that handles this connection."""
+        return self._server.get_stream_ioloop(self._conn_key)
+
+    @property
+    def write_stats(self):
+        """Write statistics of this connection, see KATCPServer.get_write_stats."""
+        return self._get_write_stats()
+
     @property
     def client_disconnect_called(self):
         return self._disconnect_called
@@ -167,6 +208,17 @@ class ClientConnection(object):
         inform.mid = orig_req.mid
         return self._send_message(inform)
 
+    def send_lines(self, data):
+        """Send already serialised messages to this client.
+
+        Parameters
+        ----------
+        data : str
+            One or more newline-terminated messages.
+
+        """
+        return self._send_lines(data)
+
     def mass_inform(self, msg):
         """Send an inform message to all clients.
 
@@ -214,9 +266,389 @@ class ThreadsafeClientConnection(ClientConnection):
     def __init__(self, server, conn_id):
         super(ThreadsafeClientConnection, self).__init__(server, conn_id)
         self._send_message = partial(server.send_message_from_thread, conn_id)
+        self._send_lines = partial(server.send_lines_from_thread, conn_id)
         self._mass_send_message = server.mass_send_message_from_thread
 
 
+class CoalescingStreamWriter(object):
+    """Gathers the lines written to a stream during one ioloop iteration.
+
+    Lines passed to :meth:`write` are buffered and sent to the stream in a
+    single `stream.write()` call from a callback that runs at the end of the
+    current ioloop iteration. If a line is written while the oldest buffered
+    line has been waiting for more than `max_latency` seconds (e.g. during a
+    long-running handler), the buffer is flushed immediately instead.
+
+    Parameters
+    ----------
+    stream : :class:`tornado.iostream.IOStream` object
+        The stream to write to.
+    ioloop : :class:`tornado.ioloop.IOLoop` object
+        The ioloop that `stream` belongs to.
+    max_latency : float
+        Maximum time in seconds that a line may be buffered.
+    error_callback : callable, signature error_callback(stream, data)
+        Called in an exception context if `stream.write()` fails.
+
+    Attributes
+    ----------
+    messages : int
+        Number of lines written to the stream.
+    writes : int
+        Number of `stream.write()` calls used to write them.
+
+    Notes
+    -----
+    All methods must be called from the ioloop thread.
+
+    """
+
+    def __init__(self, stream, ioloop, max_latency, error_callback):
+        self._stream = stream
+        self._ioloop = ioloop
+        self.max_latency = max_latency
+        self._error_callback = error_callback
+        self._lines = []
+        self._future = None
+        self._first_queued = None
+        self.messages = 0
+        self.writes = 0
+
+    @property
+    def batching_factor(self):
+        """Average number of lines sent per stream write."""
+        return self.messages / self.writes if self.writes else 0.
+
+    def write(self, line):
+        """Queue a line for writing.
+
+        Returns
+        -------
+        future : :class:`tornado.concurrent.Future` object
+            Resolves when the batch containing `line` has been written.
+
+        """
+        if not self._lines:
+            self._future = tornado_Future()
+            # Don't log exceptions that nobody waited for, like IOStream does
+            self._future.add_done_callback(lambda f: f.exception())
+            self._first_queued = self._ioloop.time()
+            self._ioloop.add_callback(self.flush)
+        self._lines.append(line)
+        future = self._future
+        if self._ioloop.time() - self._first_queued > self.max_latency:
+            self.flush()
+        return future
+
+    def flush(self):
+        """Write all buffered lines to the stream in one go."""
+        if not self._lines:
+            return
+        lines, future = self._lines, self._future
+        self._lines, self._future = [], None
+        if self._stream.closed():
+            future.set_result(None)
+            return
+        data = ''.join(lines)
+        self.messages += len(lines)
+        self.writes += 1
+        try:
+            write_future = self._stream.write(data)
+        except Exception:
+            future.set_exc_info(sys.exc_info())
+            self._error_callback(self._stream, data)
+        else:
+            chain_future(write_future, future)
+
+
+class OverflowPolicy(object):
+    """Handles the messages sent to a client connection that falls behind.
+
+    Keeps track of the bytes written to a client stream that have not been
+    flushed to the OS yet. Once more than `high_watermark` bytes are
+    outstanding the connection is overflowing, and further lines are passed
+    to :meth:`hold` instead of being written. When the outstanding bytes
+    drop to `low_watermark` or below, the held lines are written out in
+    order. Bytes are counted as flushed when the future returned by the
+    stream write resolves, which requires tornado 4.5 (earlier versions
+    only resolve the future of the most recent write).
+
+    This base policy holds all lines unchanged and disconnects the client
+    if more than `max_held_bytes` are held. Subclasses override :meth:`hold`
+    to coalesce or drop lines instead.
+
+    Parameters
+    ----------
+    high_watermark : int, optional
+        Outstanding bytes above which the connection is overflowing.
+    low_watermark : int, optional
+        Outstanding bytes at or below which held lines are released.
+    max_held_bytes : int, optional
+        Maximum number of bytes that may be held before disconnecting.
+
+    Attributes
+    ----------
+    overflowing : bool
+        True while the connection is overflowing.
+    overflows : int
+        Number of times the connection started overflowing.
+    dropped : int
+        Number of messages dropped while overflowing.
+    coalesced : int
+        Number of held messages replaced by newer ones while overflowing.
+
+    Notes
+    -----
+    Instances are created per connection by
+    :attr:`KATCPServer.overflow_policy_factory`. All methods must be called
+    from the ioloop thread.
+
+    """
+
+    def __init__(self, high_watermark=1024*1024, low_watermark=256*1024,
+                 max_held_bytes=2*1024*1024):
+        if not 0 <= low_watermark <= high_watermark:
+            raise ValueError('Watermarks must satisfy '
+                             '0 <= low_watermark <= high_watermark')
+        self.high_watermark = high_watermark
+        self.low_watermark = low_watermark
+        self.max_held_bytes = max_held_bytes
+        self.outstanding = 0
+        self.overflowing = False
+        self.held_bytes = 0
+        self._held = []
+        self._release_pending = False
+        self.overflows = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self._write = None
+        self._ioloop = None
+        self._error_callback = None
+
+    @property
+    def held(self):
+        """Number of messages currently held."""
+        return sum(1 for line in self._held if line is not None)
+
+    def bind(self, write, ioloop, error_callback):
+        """Bind the policy to a client connection.
+
+        Parameters
+        ----------
+        write : callable, signature write(line) -> Future
+            Writes a line to the client stream.
+        ioloop : :class:`tornado.ioloop.IOLoop` object
+            The ioloop of the client stream.
+        error_callback : callable, signature error_callback(data)
+            Called in an exception context if writing held lines fails.
+
+        """
+        self._write = write
+        self._ioloop = ioloop
+        self._error_callback = error_callback
+
+    def write(self, line):
+        """Write a line, or hold it if the connection is overflowing.
+
+        Returns
+        -------
+        future : Future or None
+            Resolves when the line is written, None if the line was held.
+
+        """
+        if self.overflowing:
+            self.hold(line)
+            return None
+        return self._write_through(line)
+
+    def hold(self, line):
+        """Hold a line while the connection is overflowing.
+
+        Raises an exception to disconnect the client.
+
+        """
+        self._append_held(line)
+
+    def flush(self):
+        """Write all held lines regardless of the watermarks."""
+        for line in self._take_held():
+            self._write_through(line)
+
+    def _append_held(self, line):
+        self.held_bytes += len(line)
+        if self.held_bytes > self.max_held_bytes:
+            raise RuntimeError('Client is falling behind, more than {0} '
+                               'bytes held'.format(self.max_held_bytes))
+        self._held.append(line)
+
+    def _take_held(self):
+        # Held lines that were coalesced away are replaced by None
+        held = [line for line in self._held if line is not None]
+        self._held = []
+        self.held_bytes = 0
+        self.overflowing = False
+        return held
+
+    def _write_through(self, line):
+        nbytes = len(line)
+        future = self._write(line)
+        self.outstanding += nbytes
+        future.add_done_callback(partial(self._written, nbytes))
+        if self.outstanding > self.high_watermark and not self.overflowing:
+            self.overflowing = True
+            self.overflows += 1
+        return future
+
+    def _written(self, nbytes, future):
+        self.outstanding -= nbytes
+        if (self.overflowing and not self._release_pending and
+                self.outstanding <= self.low_watermark):
+            # Write futures resolve inside IOStream, so write from a callback
+            self._release_pending = True
+            self._ioloop.add_callback(self._release)
+
+    def _release(self):
+        self._release_pending = False
+        held = self._take_held()
+        for line in held:
+            try:
+                self.write(line)
+            except Exception:
+                self._error_callback(line)
+                return
+
+
+class DisconnectOverflowPolicy(OverflowPolicy):
+    """Disconnect the client as soon as it exceeds the high watermark."""
+
+    def hold(self, line):
+        raise RuntimeError('Client is falling behind, more than {0} bytes '
+                           'outstanding'.format(self.high_watermark))
+
+
+class DroppingOverflowPolicy(OverflowPolicy):
+    """Drop asynchronous informs with the given names while overflowing.
+
+    Informs that are part of a request reply (i.e. that have a message id)
+    and all other messages are held as usual.
+
+    Parameters
+    ----------
+    inform_names : sequence of str, optional
+        Names of the informs that may be dropped.
+
+    Other keyword arguments are passed to :class:`OverflowPolicy`.
+
+    """
+
+    def __init__(self, inform_names=('sensor-status',), **kwargs):
+        super(DroppingOverflowPolicy, self).__init__(**kwargs)
+        self._prefixes = tuple('#{0}{1}'.format(name, end)
+                               for name in inform_names for end in ' \n')
+
+    def hold(self, line):
+        if line.startswith(self._prefixes):
+            self.dropped += 1
+        else:
+            self._append_held(line)
+
+
+class CoalescingOverflowPolicy(OverflowPolicy):
+    """Only keep the latest held #sensor-status inform for each sensor.
+
+    While overflowing, a new asynchronous #sensor-status inform replaces any
+    held inform for the same sensor(s). All other messages are held as usual.
+
+    """
+
+    def __init__(self, **kwargs):
+        super(CoalescingOverflowPolicy, self).__init__(**kwargs)
+        self._held_index = {}
+
+    def hold(self, line):
+        if not line.startswith('#sensor-status '):
+            self._append_held(line)
+            return
+        # Key on the (escaped) sensor names: "#sensor-status ts n name ..."
+        parts = line.split(' ')
+        try:
+            key = tuple(parts[3:3 + 3*int(parts[2]):3])
+        except (IndexError, ValueError):
+            self._append_held(line)
+            return
+        pos = self._held_index.get(key)
+        if pos is not None:
+            self.held_bytes -= len(self._held[pos])
+            self._held[pos] = None
+            self.coalesced += 1
+        self._held_index[key] = len(self._held)
+        self._append_held(line)
+
+    def _take_held(self):
+        self._held_index = {}
+        return super(CoalescingOverflowPolicy, self)._take_held()
+
+
+def _detach_stream_socket(stream):
+    """Take the connection out of a fresh IOStream so it can be rewrapped.
+
+    The socket is duplicated and the original stream closed, so that the
+    stream accepted on the main ioloop does not linger with a reference to
+    the connection that is handed to another ioloop. The stream must not
+    have been read from or written to yet.
+
+    """
+    connection = stream.socket
+    detached = socket.fromfd(connection.fileno(), connection.family,
+                             connection.type)
+    stream.close()
+    return detached
+
+
+class _IOLoopShard(object):
+    """An additional ioloop thread that handles some of the client connections.
+
+    Parameters
+    ----------
+    daemonic : bool
+        Whether the managed ioloop thread is a daemon thread.
+    logger : :class:`logging.Logger` object
+        Logger instance to use for logging.
+
+    """
+
+    def __init__(self, daemonic, logger):
+        self._ioloop_manager = IOLoopManager(managed_default=True,
+                                             logger=logger)
+        self._ioloop_manager.setDaemon(daemonic)
+        self.ioloop = self._ioloop_manager.get_ioloop()
+        # ID of the thread that runs the ioloop, set once it is running
+        self.thread_id = None
+        self._installed = threading.Event()
+
+    def start(self):
+        """Start the ioloop thread and wait until its thread ID is known.
+
+        Connections may only be handed to the shard once this returns,
+        otherwise checks against `thread_id` would fail.
+
+        """
+        self._ioloop_manager.start()
+        self.ioloop.add_callback(self._install)
+        self._installed.wait()
+
+    def _install(self):
+        self.thread_id = get_thread_ident()
+        self._installed.set()
+
+    def stop(self, callback=None):
+        """Call callback in the ioloop and stop it, returning a Future."""
+        return self._ioloop_manager.stop(callback=callback)
+
+    def join(self, timeout=None):
+        self._ioloop_manager.join(timeout=timeout)
+
+
 class KATCPServer(object):
     """Tornado IO backend for a KATCP Device.
 
@@ -227,6 +659,14 @@ class KATCPServer(object):
 
     """
     BACKLOG = 5              # Size of server socket backlog
+    REUSE_PORT = False
+    """Set SO_REUSEPORT on the server socket.
+
+    Allows several processes to listen on the same port, with the kernel
+    spreading new connections between them (see
+    :class:`katcp.multiprocess.DeviceServerPool`).
+
+    """
     MAX_MSG_SIZE = 2*1024*1024
     """Maximum message size that can be received in bytes.
 
@@ -240,6 +680,50 @@ class KATCPServer(object):
     If more than MAX_WRITE_BUFFER_SIZE bytes are outstanding, the client
     connection is closed. Note that the OS also buffers socket writes,
     so more than MAX_WRITE_BUFFER_SIZE bytes may be untransmitted in total.
+    See overflow_policy_factory for handling slow clients more gracefully.
+
+    """
+    COALESCE_WRITES = False
+    """Gather messages sent to a client during one ioloop iteration.
+
+    If True, messages sent to a client connection are buffered and written to
+    its stream in a single write at the end of the current ioloop iteration
+    (see :class:`CoalescingStreamWriter`).
+
+    """
+    MAX_COALESCE_LATENCY = 0.05
+    """Maximum time in seconds that a coalesced message may be buffered.
+
+    Only used if COALESCE_WRITES is True.
+
+    """
+    CHUNKED_READS = False
+    """Read client data in chunks rather than one line at a time.
+
+    If True, whatever data is available is read from a client stream (up to
+    READ_CHUNK_SIZE bytes) and split into lines in one go, instead of doing
+    one `read_until_regex()` call per line.
+
+    """
+    READ_CHUNK_SIZE = 64*1024
+    """Maximum number of bytes to read at a time if CHUNKED_READS is True."""
+    MAX_LOOP_LATENCY = 0.03
+    """Do not spend more than this many seconds handling buffered client data.
+
+    Only used if CHUNKED_READS is True; otherwise the read loop yields to the
+    ioloop after every message.
+
+    """
+    IOLOOP_SHARDS = 1
+    """Number of ioloop threads that client connections are spread over.
+
+    If more than 1, IOLOOP_SHARDS - 1 additional ioloops are started in their
+    own managed threads and new connections are handed out round-robin to
+    the main ioloop and the additional ones. A connection is read from,
+    written to and sampled only in the thread of its ioloop (see
+    get_stream_ioloop()), so that a busy server can use more than one core.
+    The device on_* methods are then called from several threads and must
+    be thread safe.
 
     """
     DISCONNECT_TIMEOUT = 1
@@ -260,6 +744,21 @@ class KATCPServer(object):
 
     """
 
+    overflow_policy_factory = None
+    """Factory that produces an OverflowPolicy compatible instance, or None.
+
+    signature: overflow_policy_factory()
+
+    Each client connection gets its own policy instance that decides what
+    happens to messages while the client is falling behind, e.g.
+    `functools.partial(CoalescingOverflowPolicy, high_watermark=65536)`. If
+    None, clients are only disconnected once MAX_WRITE_BUFFER_SIZE is
+    exceeded.
+
+    Should be set before calling start().
+
+    """
+
     def __init__(self, device, host, port, tb_limit=20, logger=log):
         """Initialise the IO server instance.
 
@@ -338,6 +837,9 @@ class KATCPServer(object):
         # Map from tornado IOStreams to ClientConnection objects
         self._connections = {}
         self._ioloop_manager = IOLoopManager(managed_default=True)
+        # Additional _IOLoopShard objects if IOLOOP_SHARDS > 1
+        self._shards = []
+        self._daemonic = False
 
     @property
     def bind_address(self):
@@ -351,6 +853,7 @@ class KATCPServer(object):
         start(), or it will also have no effect
         """
         self._ioloop_manager.setDaemon(daemonic)
+        self._daemonic = bool(daemonic)
 
     def set_ioloop(self, ioloop=None):
         """Set the tornado IOLoop to use.
@@ -385,7 +888,16 @@ class KATCPServer(object):
         # if too-large messages are received
         self._tcp_server = tornado.tcpserver.TCPServer(
             self.ioloop, max_buffer_size=self.MAX_MSG_SIZE)
-        self._tcp_server.handle_stream = self._handle_stream
+        self._shards = [_IOLoopShard(self._daemonic, self._logger)
+                        for _ in range(self.IOLOOP_SHARDS - 1)]
+        for shard in self._shards:
+            shard.start()
+        if self._shards:
+            # The main ioloop is represented by None and gets connections last
+            self._next_shard = itertools.cycle(self._shards + [None]).next
+            self._tcp_server.handle_stream = self._dispatch_stream
+        else:
+            self._tcp_server.handle_stream = self._handle_stream
         self._server_sock = self._bind_socket(self._bindaddr)
         self._bindaddr = self._server_sock.getsockname()
 
@@ -427,6 +939,8 @@ class KATCPServer(object):
         """
         t0 = time.time()
         self._ioloop_manager.join(timeout=timeout)
+        for shard in self._shards:
+            shard.join(timeout=timeout and max(timeout - (time.time() - t0), 0))
         if timeout:
             self._stopped.wait(timeout - (time.time() - t0))
 
@@ -442,6 +956,8 @@ class KATCPServer(object):
         """Create a listening server socket."""
         sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if self.REUSE_PORT:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
         sock.setblocking(0)
         try:
             sock.bind(bindaddr)
@@ -463,31 +979,72 @@ class KATCPServer(object):
         assert get_thread_ident() == self.ioloop_thread_id
         try:
             self._tcp_server.stop()
-            for stream, conn in self._connections.items():
-                yield self._disconnect_client(stream, conn,
-                                              'Device server shutting down.')
+            yield self._disconnect_shard_clients(None)
+            shards_stopped = [
+                shard.stop(callback=partial(self._disconnect_shard_clients,
+                                            shard))
+                for shard in self._shards]
+            for stopped in shards_stopped:
+                yield stopped
         finally:
             self.ioloop = None
             self._running.clear()
             self._stopped.set()
 
     @gen.coroutine
-    def _handle_stream(self, stream, address):
+    def _disconnect_shard_clients(self, shard):
+        """Disconnect the clients handled by an ioloop shard (None is main)."""
+        for stream, conn in self._connections.items():
+            if self._stream_shard(stream) is shard:
+                yield self._disconnect_client(stream, conn,
+                                              'Device server shutting down.')
+
+    def _dispatch_stream(self, stream, address):
+        """Hand a new connection over to the next ioloop shard."""
+        shard = self._next_shard()
+        if shard is None:
+            return self._handle_stream(stream, address)
+        shard.ioloop.add_callback(self._handle_shard_connection, shard,
+                                  _detach_stream_socket(stream), address)
+
+    def _handle_shard_connection(self, shard, connection, address):
+        stream = iostream.IOStream(connection, io_loop=shard.ioloop,
+                                   max_buffer_size=self.MAX_MSG_SIZE)
+        return self._handle_stream(stream, address, shard)
+
+    @gen.coroutine
+    def _handle_stream(self, stream, address, shard=None):
         """Handle a new connection as a tornado.iostream.IOStream instance."""
         try:
-            assert get_thread_ident() == self.ioloop_thread_id
+            # Abuse IOStream object slightly by adding 'shard', 'address' and
+            # 'closing' attributes. Use nasty prefix to prevent naming
+            # collisions. The ioloop shard is None for the main ioloop.
+            stream.KATCPServer_shard = shard
+            assert self._in_stream_thread(stream)
+            ioloop = self.get_stream_ioloop(stream)
             stream.set_close_callback(partial(self._stream_closed_callback,
                                               stream))
             # Our message packets are small, don't delay sending them.
             stream.set_nodelay(True)
             stream.max_write_buffer_size = self.MAX_WRITE_BUFFER_SIZE
 
-            # Abuse IOStream object slightly by adding 'address' and 'closing'
-            # attributes. Use nasty prefix to prevent naming collisions.
             stream.KATCPServer_address = address
             # Flag to indicate that no more write should be accepted so that
             # we can flush the write buffer when closing a connection
             stream.KATCPServer_closing = False
+            # Optional per-connection write coalescing
+            stream.KATCPServer_writer = (
+                CoalescingStreamWriter(stream, ioloop,
+                                       self.MAX_COALESCE_LATENCY,
+                                       self._handle_write_error)
+                if self.COALESCE_WRITES else None)
+            overflow_policy = None
+            if self.overflow_policy_factory is not None:
+                overflow_policy = self.overflow_policy_factory()
+                overflow_policy.bind(
+                    (stream.KATCPServer_writer or stream).write, ioloop,
+                    partial(self._handle_write_error, stream))
+            stream.KATCPServer_overflow_policy = overflow_policy
 
             client_conn = self.client_connection_factory(self, stream)
             self._connections[stream] = client_conn
@@ -505,14 +1062,17 @@ class KATCPServer(object):
                 stream.write(str(Message.inform('log', log_msg)))
                 stream.close(exc_info=True)
             else:
-                self._line_read_loop(stream, client_conn)
+                if self.CHUNKED_READS:
+                    self._chunked_line_read_loop(stream, client_conn)
+                else:
+                    self._line_read_loop(stream, client_conn)
         except Exception:
             self._logger.error('Unhandled exception trying '
                                'to handle new connection', exc_info=True)
 
     @gen.coroutine
     def _line_read_loop(self, stream, client_conn):
-        assert get_thread_ident() == self.ioloop_thread_id
+        assert self._in_stream_thread(stream)
         client_address = self.get_address(stream)
         try:
             while True:
@@ -535,14 +1095,7 @@ class KATCPServer(object):
                     line = line.replace("\r", "\n").split("\n")[0]
                     msg = self._parser.parse(line) if line else None
                 except Exception:
-                    msg = None
-                    e_type, e_value, trace = sys.exc_info()
-                    reason = "\n".join(traceback.format_exception(
-                        e_type, e_value, trace, self._tb_limit))
-                    self._logger.error("BAD COMMAND: %s in line %r"
-                                       % (reason, line))
-                    self.send_message(
-                        stream, self._device.create_log_inform("error", reason, "root"))
+                    self._handle_bad_line(stream, line)
                     continue  # Wait for the next message and hope it is better
                 try:
                     if msg:  # Ignore empty messages (i.e empty lines)
@@ -562,8 +1115,68 @@ class KATCPServer(object):
             self._logger.info('Reading loop for client {0} completed'
                               .format(client_address))
 
+    @gen.coroutine
+    def _chunked_line_read_loop(self, stream, client_conn):
+        assert self._in_stream_thread(stream)
+        client_address = self.get_address(stream)
+        latency_timer = LatencyTimer(self.MAX_LOOP_LATENCY,
+                                     self.get_stream_ioloop(stream))
+        splitter = LineSplitter(self.MAX_MSG_SIZE)
+        try:
+            while not stream.closed():
+                try:
+                    chunk_fut = stream.read_bytes(self.READ_CHUNK_SIZE,
+                                                  partial=True)
+                    latency_timer.check_future(chunk_fut)
+                    if latency_timer.time_to_yield():
+                        yield gen.moment
+                    chunk = yield chunk_fut
+                    lines = splitter.feed(chunk)
+                except iostream.StreamClosedError:
+                    # Assume that _stream_closed_callback() will handle this
+                    break
+                except Exception:
+                    self._logger.warn('Unhandled Exception '
+                                      'while reading from client {0}:'
+                                      .format(client_address), exc_info=True)
+                    stream.close(exc_info=True)
+                    break
+                for line in lines:
+                    if stream.closed():
+                        # Don't call message handlers for a closed connection
+                        break
+                    try:
+                        msg = self._parser.parse(line)
+                    except Exception:
+                        self._handle_bad_line(stream, line)
+                        continue
+                    try:
+                        ready = self._device.on_message(client_conn, msg)
+                        latency_timer.check_future(ready)
+                        if latency_timer.time_to_yield():
+                            yield gen.moment
+                        yield ready
+                    except Exception:
+                        self._logger.error('Error handling message {0!s}'
+                                           .format(msg), exc_info=True)
+        except Exception:
+            self._logger.error('Unexpected exception in read-loop for client {0}:'
+                               .format(client_address))
+        finally:
+            self._logger.info('Reading loop for client {0} completed'
+                              .format(client_address))
+
+    def _handle_bad_line(self, stream, line):
+        """Log a line that failed to parse (in an exception context)."""
+        e_type, e_value, trace = sys.exc_info()
+        reason = "\n".join(traceback.format_exception(
+            e_type, e_value, trace, self._tb_limit))
+        self._logger.error("BAD COMMAND: %s in line %r" % (reason, line))
+        self.send_message(
+            stream, self._device.create_log_inform("error", reason, "root"))
+
     def _stream_closed_callback(self, stream):
-        assert get_thread_ident() == self.ioloop_thread_id
+        assert self._in_stream_thread(stream)
         # Remove ClientConnection object for the current stream from our state
         conn = self._connections.pop(stream, None)
         error_repr = '{0!r}'.format(stream.error) if stream.error else ''
@@ -577,7 +1190,7 @@ class KATCPServer(object):
 
     @gen.coroutine
     def _disconnect_client(self, stream, conn, reason):
-        assert get_thread_ident() == self.ioloop_thread_id
+        assert self._in_stream_thread(stream)
         stream_open = not stream.closed()
         address = self.get_address(stream)
         try:
@@ -625,7 +1238,7 @@ class KATCPServer(object):
 
         Notes
         -----
-        This method can only be called in the IOLoop thread.
+        This method can only be called in the IOLoop thread of the stream.
 
         Failed sends disconnect the client connection and calls the device
         on_client_disconnect() method. They do not raise exceptions, but they
@@ -633,17 +1246,51 @@ class KATCPServer(object):
         bytes are queued for sending, implying that client is falling behind.
 
         """
-        assert get_thread_ident() == self.ioloop_thread_id
+        assert self._in_stream_thread(stream)
+        return self._write_line(stream, str(msg) + '\n')
+
+    def send_lines(self, stream, data):
+        """Send already serialised messages to a particular client.
+
+        Parameters
+        ----------
+        stream : :class:`tornado.iostream.IOStream` object
+            The stream to send the messages to.
+        data : str
+            One or more newline-terminated messages, written to the stream
+            in a single write.
+
+        Notes
+        -----
+        This method can only be called in the IOLoop thread of the stream.
+        Failed sends are handled as for :meth:`send_message`.
+
+        """
+        assert self._in_stream_thread(stream)
+        return self._write_line(stream, data)
+
+    def _write_line(self, stream, line):
+        """Write an already serialised, newline-terminated message."""
         try:
             if stream.KATCPServer_closing:
                 raise RuntimeError('Stream is closing so we cannot '
                                    'accept any more writes')
-            return stream.write(str(msg) + '\n')
+            overflow_policy = stream.KATCPServer_overflow_policy
+            if overflow_policy is not None:
+                return overflow_policy.write(line)
+            writer = stream.KATCPServer_writer
+            if writer is not None:
+                return writer.write(line)
+            return stream.write(line)
         except Exception:
-            addr = self.get_address(stream)
-            self._logger.warn('Could not send message {0!r} to {1}'
-                              .format(str(msg), addr), exc_info=True)
-            stream.close(exc_info=True)
+            self._handle_write_error(stream, line)
+
+    def _handle_write_error(self, stream, data):
+        """Log a failed write and close the stream (in an exception context)."""
+        addr = self.get_address(stream)
+        self._logger.warn('Could not send message {0!r} to {1}'
+                          .format(data[:-1], addr), exc_info=True)
+        stream.close(exc_info=True)
 
     def flush_on_close(self, stream):
         """Flush tornado iostream write buffer and prevent further writes.
@@ -651,12 +1298,48 @@ class KATCPServer(object):
         Returns a future that resolves when the stream is flushed.
 
         """
-        assert get_thread_ident() == self.ioloop_thread_id
+        assert self._in_stream_thread(stream)
         # Prevent futher writes
         stream.KATCPServer_closing = True
+        try:
+            if stream.KATCPServer_overflow_policy is not None:
+                stream.KATCPServer_overflow_policy.flush()
+        except Exception:
+            self._handle_write_error(stream, '<held messages>\n')
+        if stream.KATCPServer_writer is not None:
+            stream.KATCPServer_writer.flush()
         # Write empty message to get future that resolves when buffer is flushed
         return stream.write('\n')
 
+    def get_write_stats(self, stream):
+        """Write statistics of a client connection stream.
+
+        Returns
+        -------
+        stats : :class:`tornado.util.ObjectDict`
+            With attributes `messages` (lines written), `writes` (stream
+            writes used) and `batching_factor` (messages per write), which
+            are zero unless COALESCE_WRITES is enabled, and `overflows`,
+            `dropped`, `coalesced` and `held` (messages currently held),
+            which are zero unless an overflow policy is used.
+
+        Notes
+        -----
+        This method can only be called in the IOLoop thread of the stream.
+
+        """
+        stats = ObjectDict(messages=0, writes=0, batching_factor=0.,
+                           overflows=0, dropped=0, coalesced=0, held=0)
+        writer = stream.KATCPServer_writer
+        if writer is not None:
+            stats.update(messages=writer.messages, writes=writer.writes,
+                         batching_factor=writer.batching_factor)
+        policy = stream.KATCPServer_overflow_policy
+        if policy is not None:
+            stats.update(overflows=policy.overflows, dropped=policy.dropped,
+                         coalesced=policy.coalesced, held=policy.held)
+        return stats
+
     def call_from_thread(self, fn):
         """Allow thread-safe calls to ioloop functions.
 
@@ -666,7 +1349,12 @@ class KATCPServer(object):
         Resolves with an exception if one occurred.
 
         """
-        if self.in_ioloop_thread():
+        return self._call_in_shard(None, fn)
+
+    def _call_in_shard(self, shard, fn):
+        """Implement call_from_thread() for an ioloop shard (None is main)."""
+        ioloop, thread_id = self._shard_ioloop(shard)
+        if get_thread_ident() == thread_id:
             f = tornado_Future()
             try:
                 f.set_result(fn())
@@ -689,7 +1377,7 @@ class KATCPServer(object):
                         self._logger.exception(
                             'Error executing wrapped async callback')
 
-                self.ioloop.add_callback(send_message_callback)
+                ioloop.add_callback(send_message_callback)
             finally:
                 return f
 
@@ -714,32 +1402,108 @@ class KATCPServer(object):
         resolve a thread-safe concurrent.futures.Future instance.
 
         """
-        return self.call_from_thread(partial(self.send_message, stream, msg))
+        return self._call_in_shard(self._stream_shard(stream),
+                                   partial(self.send_message, stream, msg))
+
+    def send_lines_from_thread(self, stream, data):
+        """Thread-safe version of send_lines() returning a Future instance.
+
+        See return value and notes for send_message_from_thread().
+
+        """
+        return self._call_in_shard(self._stream_shard(stream),
+                                   partial(self.send_lines, stream, data))
 
     def mass_send_message(self, msg):
         """Send a message to all connected clients.
 
+        The message is serialised once and the same line is written to
+        every client stream.
+
         Notes
         -----
-        This method can only be called in the IOLoop thread.
+        This method can only be called in an IOLoop thread of the server.
+        Clients handled by other ioloop shards (see IOLOOP_SHARDS) are sent
+        the message via their own ioloops.
 
         """
-        for stream in self._connections.keys():
+        thread_id = get_thread_ident()
+        assert (thread_id == self.ioloop_thread_id or
+                any(shard.thread_id == thread_id for shard in self._shards))
+        self._broadcast_line(str(msg) + '\n')
+
+    def _broadcast_line(self, line):
+        """Write an already serialised message to the clients of all shards."""
+        thread_id = get_thread_ident()
+        for shard in [None] + self._shards:
+            ioloop, shard_thread_id = self._shard_ioloop(shard)
+            if thread_id == shard_thread_id:
+                self._mass_write_line(line, shard)
+            else:
+                ioloop.add_callback(self._mass_write_line, line, shard)
+
+    def _mass_write_line(self, line, shard=None):
+        """Write an already serialised message to the clients of a shard."""
+        streams = self._connections.keys()
+        if self._shards:
+            streams = [stream for stream in streams
+                       if self._stream_shard(stream) is shard]
+        for stream in streams:
             if not stream.closed():
                 # Don't cause noise by trying to write to already closed streams
-                self.send_message(stream, msg)
+                self._write_line(stream, line)
 
     def mass_send_message_from_thread(self, msg):
         """Thread-safe version of send_message() returning a Future instance.
 
-        See return value and notes for send_message_from_thread().
+        See return value and notes for send_message_from_thread(). The
+        message is serialised in the calling thread, so the ioloop only
+        has to write the resulting line to each client stream.
 
         """
-        return self.call_from_thread(partial(self.mass_send_message, msg))
+        line = str(msg) + '\n'
+        return self.call_from_thread(partial(self._broadcast_line, line))
 
-    def in_ioloop_thread(self):
-        """Return True if called in the IOLoop thread of this server."""
-        return get_thread_ident() == self.ioloop_thread_id
+    def in_ioloop_thread(self, ioloop=None):
+        """Return True if called in the thread of an IOLoop of this server.
+
+        Parameters
+        ----------
+        ioloop : :class:`tornado.ioloop.IOLoop` object, optional
+            The main IOLoop or one of the additional ioloop shards (see
+            IOLOOP_SHARDS). Defaults to the main IOLoop.
+
+        """
+        thread_id = get_thread_ident()
+        if ioloop is None or ioloop is self.ioloop:
+            return thread_id == self.ioloop_thread_id
+        return any(shard.ioloop is ioloop and shard.thread_id == thread_id
+                   for shard in self._shards)
+
+    def get_stream_ioloop(self, stream):
+        """The IOLoop that handles a client connection stream.
+
+        Notes
+        -----
+        This method is thread-safe
+
+        """
+        return self._shard_ioloop(self._stream_shard(stream))[0]
+
+    def _stream_shard(self, stream):
+        """The ioloop shard handling a stream, or None for the main ioloop."""
+        return getattr(stream, 'KATCPServer_shard', None)
+
+    def _shard_ioloop(self, shard):
+        """The (ioloop, thread ID) of an ioloop shard (None is main)."""
+        if shard is None:
+            return self.ioloop, self.ioloop_thread_id
+        return shard.ioloop, shard.thread_id
+
+    def _in_stream_thread(self, stream):
+        """Return True if called in the IOLoop thread of a stream."""
+        thread_id = self._shard_ioloop(self._stream_shard(stream))[1]
+        return get_thread_ident() == thread_id
 
 
 class ClientRequestConnection(object):
@@ -752,9 +1516,50 @@ class ClientRequestConnection(object):
         self.mass_inform = client_connection.mass_inform
 
     def inform(self, *args):
-        inf_msg = Message.reply_inform(self.msg, *args)
+        # The request name and id were validated when the request was created
+        inf_msg = Message.trusted(Message.INFORM, self.msg.name, args,
+                                  self.msg.mid)
         return self.client_connection.inform(inf_msg)
 
+    def inform_formatted(self, arg_strs, arguments=None):
+        """Send informs whose arguments have already been serialised.
+
+        The request name and message id are added to each entry of
+        `arg_strs`, and the informs are sent to the client in one write
+        if the client connection supports :meth:`ClientConnection.send_lines`.
+        Otherwise the informs are sent one at a time with :meth:`inform`.
+
+        Parameters
+        ----------
+        arg_strs : list of str
+            The serialised arguments of each inform, as returned by
+            :func:`format_inform_arguments`.
+        arguments : iterable of sequences, optional
+            The unserialised arguments of each inform, only used if the
+            informs are sent one at a time. If not given, they are parsed
+            from `arg_strs`.
+
+        """
+        send_lines = getattr(self.client_connection, 'send_lines', None)
+        if send_lines is None:
+            return self._inform_each(arg_strs, arguments)
+        prefix = Message.TYPE_SYMBOLS[Message.INFORM] + self.msg.name
+        if self.msg.mid is not None:
+            prefix += '[%s]' % (self.msg.mid,)
+        if arg_strs:
+            return send_lines(
+                ''.join([prefix + arg_str + '\n' for arg_str in arg_strs]))
+
+    def _inform_each(self, arg_strs, arguments=None):
+        """Send pre-serialised informs one at a time using inform()."""
+        if arguments is None:
+            parser = MessageParser()
+            prefix = Message.TYPE_SYMBOLS[Message.INFORM] + self.msg.name
+            arguments = (parser.parse(prefix + arg_str).arguments
+                         for arg_str in arg_strs)
+        for args in arguments:
+            self.inform(*args)
+
     def reply(self, *args):
         rep_msg = Message.reply_to_request(self.msg, *args)
         self._post_reply()
@@ -774,6 +1579,7 @@ class ClientRequestConnection(object):
         self.reply = self.reply_again
         self.reply_with_message = self.reply_again
         self.inform = self.inform_after_reply
+        self.inform_formatted = self.inform_after_reply
 
     def reply_again(self, *args):
         raise RuntimeError('Reply to request %r already sent.' % self.msg)
@@ -786,9 +1592,38 @@ class ClientRequestConnection(object):
         return Message.reply_to_request(self.msg, *args)
 
 
-class MessageHandlerThread(object):
-    """Provides backwards compatibility for server expecting its own thread."""
-    def __init__(self, handler, log_inform_formatter, logger=log):
+class MessageHandlerPool(object):
+    """Handles messages from all clients in a pool of handler threads.
+
+    Each client connection gets its own queue, and the handler threads take
+    messages from the queues of the clients in turn so that a busy client
+    cannot starve the others. Messages of a connection are handled one at a
+    time and in the order they arrived. If `max_queue_size` messages are
+    already queued, new requests are failed with an overload reply (and
+    an error #log inform is sent to the client) instead of being queued.
+
+    Handlers need the device state and the client connection, so they
+    always run in a thread of this process. CPU-bound request handlers
+    can return a future from e.g. a
+    :class:`concurrent.futures.ProcessPoolExecutor` instead.
+
+    Parameters
+    ----------
+    handler : callable, signature handler(client_conn, msg)
+        The message handler, typically a bound DeviceServer method.
+    log_inform_formatter : callable
+        Creates #log informs, signature as for
+        :meth:`DeviceServerBase.create_log_inform`.
+    num_threads : int, optional
+        Number of handler threads.
+    max_queue_size : int, optional
+        Maximum number of messages queued over all clients.
+    logger : :class:`logging.Logger` object, optional
+        Logger instance to use for logging, defaults to module log.
+
+    """
+    def __init__(self, handler, log_inform_formatter, num_threads=1,
+                 max_queue_size=1000, logger=log):
         self.handler = handler
         try:
             owner = handler.im_self.name
@@ -796,13 +1631,22 @@ class MessageHandlerThread(object):
             owner = handler.im_self.__class__.__name__
         self.name = "{}.message_handler" .format(owner)
         self.log_inform_formatter = log_inform_formatter
-        self._wake = threading.Event()
-        self._msg_queue = deque()
+        self.num_threads = num_threads
+        self.max_queue_size = max_queue_size
         self._logger = logger
+        self._lock = threading.Condition(threading.Lock())
+        # Map client connections to deques of (enqueue time, ready future,
+        # msg) tuples, for clients with queued or in-progress messages
+        self._queues = {}
+        # Clients with queued messages that are not being handled, in turn
+        self._ready_clients = deque()
+        self._num_queued = 0
+        self._stats = ObjectDict(handled=0, rejected=0, max_queued=0,
+                                 total_wait=0.0, max_wait=0.0)
         self._running = threading.Event()
-        self._thread = None
+        self._threads = []
         self.ioloop = None
-        super(MessageHandlerThread, self).__init__()
+        super(MessageHandlerPool, self).__init__()
 
     def set_ioloop(self, ioloop):
         self.ioloop = ioloop
@@ -820,62 +1664,130 @@ class MessageHandlerThread(object):
         *on_message* should not be called again until *ready* has resolved.
 
         """
-        MAX_QUEUE_SIZE = 30
-        if len(self._msg_queue) >= MAX_QUEUE_SIZE:
-            # This should never happen if callers to handle_message wait
-            # for its futures to resolve before sending another message.
-            # NM 2014-10-06: Except when there are multiple clients. Oops.
-            raise RuntimeError('MessageHandlerThread unhandled '
-                               'message queue full, not handling message')
         ready_future = Future()
-        self._msg_queue.append((ready_future, client_conn, msg))
-        self._wake.set()
+        with self._lock:
+            overloaded = self._num_queued >= self.max_queue_size
+            if overloaded:
+                self._stats.rejected += 1
+            else:
+                queue = self._queues.get(client_conn)
+                if queue is None:
+                    queue = self._queues[client_conn] = deque()
+                    self._ready_clients.append(client_conn)
+                queue.append((time.time(), ready_future, msg))
+                self._num_queued += 1
+                self._stats.max_queued = max(self._stats.max_queued,
+                                             self._num_queued)
+                self._lock.notify()
+        if overloaded:
+            self._reject(client_conn, msg)
+            ready_future.set_result(None)
         return ready_future
 
+    def _reject(self, client_conn, msg):
+        """Tell the client that a message was dropped due to overload."""
+        reason = ('Server overloaded, {0} messages queued: not handling '
+                  'message {1!s}'.format(self.max_queue_size, msg.name))
+        self._logger.warn(reason)
+        client_conn.inform(self.log_inform_formatter('error', reason, 'root'))
+        if msg.mtype == Message.REQUEST:
+            client_conn.reply(Message.reply_to_request(msg, 'fail', reason),
+                              msg)
+
+    def get_stats(self):
+        """Queue statistics of the pool.
+
+        Returns
+        -------
+        stats : :class:`tornado.util.ObjectDict`
+            With attributes `queued` (messages currently queued),
+            `max_queued` (largest number of messages queued so far),
+            `handled` and `rejected` (number of messages handled and
+            rejected due to overload), and `mean_wait` and `max_wait`
+            (mean and maximum seconds that handled messages were queued).
+
+        """
+        with self._lock:
+            stats = ObjectDict(self._stats, queued=self._num_queued)
+        total_wait = stats.pop('total_wait')
+        stats.mean_wait = total_wait / stats.handled if stats.handled else 0.0
+        return stats
+
+    def _next_message(self):
+        """Wait for the next (client_conn, ready future, msg) or None."""
+        with self._lock:
+            while self._running.isSet() and not self._ready_clients:
+                self._lock.wait()
+            if not self._running.isSet():
+                return None
+            client_conn = self._ready_clients.popleft()
+            enqueued, ready_future, msg = self._queues[client_conn][0]
+            self._num_queued -= 1
+            wait = time.time() - enqueued
+            self._stats.handled += 1
+            self._stats.total_wait += wait
+            self._stats.max_wait = max(self._stats.max_wait, wait)
+            return client_conn, ready_future, msg
+
+    def _message_done(self, client_conn):
+        """Let the next message of the client be handled."""
+        with self._lock:
+            queue = self._queues[client_conn]
+            queue.popleft()
+            if queue:
+                self._ready_clients.append(client_conn)
+                self._lock.notify()
+            else:
+                del self._queues[client_conn]
+
     def run(self):
-        self._running.set()
         # Set the default ioloop for anything using IOLoop.current()
         # in this thread gets self.ioloop
         self.ioloop.make_current()
         try:
-            while self._running.isSet():
-                if not self._msg_queue:
-                    self._wake.wait()
-                while self._msg_queue:
-                    ready_future, client_conn, msg = self._msg_queue.popleft()
-                    try:
-                        res = self.handler(client_conn, msg)
-                        if gen.is_future(res):
-                            self.ioloop.add_callback(chain_future, res,
-                                                     ready_future)
-                        else:
-                            ready_future.set_result(res)
-                    except Exception, e:
-                        err_msg = ('Error calling message '
-                                   'handler for msg:\n {0!s}'.format(msg))
-                        self._logger.error(err_msg, exc_info=True)
-                        client_conn.inform(self.log_inform_formatter(
-                            'error', 'See device logs:\n' + err_msg, 'root'))
-                        ready_future.set_exception(e)
-                self._wake.clear()
-
+            while True:
+                next_message = self._next_message()
+                if next_message is None:
+                    break
+                client_conn, ready_future, msg = next_message
+                try:
+                    res = self.handler(client_conn, msg)
+                    if gen.is_future(res):
+                        self.ioloop.add_callback(chain_future, res,
+                                                 ready_future)
+                    else:
+                        ready_future.set_result(res)
+                except Exception, e:
+                    err_msg = ('Error calling message '
+                               'handler for msg:\n {0!s}'.format(msg))
+                    self._logger.error(err_msg, exc_info=True)
+                    client_conn.inform(self.log_inform_formatter(
+                        'error', 'See device logs:\n' + err_msg, 'root'))
+                    ready_future.set_exception(e)
+                finally:
+                    self._message_done(client_conn)
         except Exception:
             self._logger.error(
                 'Unhandled exception in message handler thread: ', exc_info=True)
         finally:
-            self._running.clear()
             self._logger.info('Message handler thread stopped.')
 
     def start(self, timeout=None):
-        if self._thread and self._thread.isAlive():
+        if self.isAlive():
             raise RuntimeError('Cannot start since thread is already running')
-        self._thread = threading.Thread(target=self.run, name=self.name)
-        self._thread.start()
+        self._running.set()
+        self._threads = [
+            threading.Thread(target=self.run, name=(
+                self.name if self.num_threads == 1
+                else '{0}.{1}'.format(self.name, i)))
+            for i in range(self.num_threads)]
+        for thread in self._threads:
+            thread.start()
         if timeout:
             return self.wait_running(timeout)
 
     def stop(self, timeout=1.0):
-        """Stop the handler thread (from another thread).
+        """Stop the handler threads (from another thread).
 
         Parameters
         ----------
@@ -885,33 +1797,47 @@ class MessageHandlerThread(object):
         """
         if timeout:
             self._running.wait(timeout)
-        self._running.clear()
-        # Make sure to wake the run thread.
-        self._wake.set()
+        with self._lock:
+            self._running.clear()
+            # Make sure to wake the handler threads.
+            self._lock.notify_all()
 
     def join(self, timeout=None):
-        """Rejoin the handler thread.
+        """Rejoin the handler threads.
 
         Parameters
         ----------
         timeout : float or None, optional
-            Time in seconds to wait for the thread to finish.
+            Time in seconds to wait for the threads to finish.
 
         """
-        self._thread.join(timeout)
+        t0 = time.time()
+        for thread in self._threads:
+            thread.join(timeout and max(timeout - (time.time() - t0), 0))
 
     def isAlive(self):
-        return self._thread and self._thread.isAlive()
+        return any(thread.isAlive() for thread in self._threads)
 
     def running(self):
-        """Whether the handler thread is running."""
+        """Whether the handler threads are running."""
         return self._running.isSet()
 
     def wait_running(self, timeout=None):
-        """Wait until the handler thread is running."""
+        """Wait until the handler threads are running."""
         return self._running.wait(timeout)
 
 
+class MessageHandlerThread(MessageHandlerPool):
+    """Provides backwards compatibility for server expecting its own thread.
+
+    A :class:`MessageHandlerPool` with a single handler thread.
+
+    """
+    def __init__(self, handler, log_inform_formatter, logger=log):
+        super(MessageHandlerThread, self).__init__(
+            handler, log_inform_formatter, num_threads=1, logger=logger)
+
+
 class DeviceServerBase(object):
     """Base class for device servers.
 
@@ -956,6 +1882,9 @@ class DeviceServerBase(object):
         self._server = KATCPServer(self, host, port, tb_limit, logger)
         self._logger = logger
         self._tb_limit = tb_limit
+        # map request names to (handler, docstring, serialised #help
+        # arguments) tuples, see _help_inform_arguments()
+        self._help_informs = {}
         # Thread that will optionally be used to handle requests
         self._handler_thread = None
         # Set default concurrency options
@@ -1088,7 +2017,8 @@ class DeviceServerBase(object):
                     # have to always fall back to adding a callback, or wrapping
                     # a thread-safe future. Supporting sync-with-thread and
                     # async futures is turning out to be a pain in the ass ;)
-                    self.ioloop.add_callback(reply.add_done_callback, async_reply)
+                    self._client_ioloop(connection).add_callback(
+                        reply.add_done_callback, async_reply)
                     # reply.add_done_callback(async_reply)
 
                     if concurrent:
@@ -1272,7 +2202,21 @@ class DeviceServerBase(object):
         self._server.set_ioloop(ioloop)
         self.ioloop = self._server.ioloop
 
-    def set_concurrency_options(self, thread_safe=True, handler_thread=True):
+    def _client_ioloop(self, client_conn):
+        """The IOLoop that handles a client connection.
+
+        This is the main IOLoop unless the server uses additional ioloop
+        shards (see :attr:`KATCPServer.IOLOOP_SHARDS`).
+
+        """
+        ioloop = getattr(client_conn, 'ioloop', None)
+        # ClientConnection-like stand-ins need not know their ioloop
+        if isinstance(ioloop, tornado.ioloop.IOLoop):
+            return ioloop
+        return self._server.ioloop
+
+    def set_concurrency_options(self, thread_safe=True, handler_thread=True,
+                                handler_threads=1, max_queued_messages=1000):
         """Set concurrency options for this device server.
         Must be called before :meth:`start`.
 
@@ -1284,11 +2228,22 @@ class DeviceServerBase(object):
             performance overhead.
         handler_thread : bool
             Can only be set if `thread_safe` is True. Handle all requests (even
-            from different clients) in a separate, single, request-handling
-            thread. Blocking request handlers will prevent the server from
+            from different clients) in a separate pool of request-handling
+            threads (see :class:`MessageHandlerPool`). With a single thread,
+            blocking request handlers will prevent the server from
             handling new requests from any client, but sensor strategies should
             still function. This more or less mimics the behaviour of a server
-            in library versions before 0.6.0.
+            in library versions before 0.6.0. Set to False if the server uses
+            additional ioloop shards (see KATCPServer.IOLOOP_SHARDS) so that
+            requests are handled in the ioloop thread of each client.
+        handler_threads : int
+            Number of request-handling threads if `handler_thread` is True.
+            Requests from different clients are handled concurrently if
+            more than one, so the request handlers must be thread safe.
+        max_queued_messages : int
+            Maximum number of messages queued for the request-handling
+            threads over all clients, if `handler_thread` is True. Further
+            requests are failed until the queue drains.
 
         """
         if handler_thread:
@@ -1296,15 +2251,32 @@ class DeviceServerBase(object):
         self._server.client_connection_factory = (
             ThreadsafeClientConnection if thread_safe else ClientConnection)
         if handler_thread:
-            self._handler_thread = MessageHandlerThread(
-                self.handle_message, self.create_log_inform, self._logger)
+            self._handler_thread = MessageHandlerPool(
+                self.handle_message, self.create_log_inform, handler_threads,
+                max_queued_messages, self._logger)
             self.on_message = self._handler_thread.on_message
         else:
             self.on_message = return_future(self.handle_message)
             self._handler_thread = None
 
         self._concurrency_options = ObjectDict(
-            thread_safe=thread_safe, handler_thread=handler_thread)
+            thread_safe=thread_safe, handler_thread=handler_thread,
+            handler_threads=handler_threads,
+            max_queued_messages=max_queued_messages)
+
+    def get_handler_stats(self):
+        """Queue statistics of the request-handling threads.
+
+        Returns
+        -------
+        stats : :class:`tornado.util.ObjectDict` or None
+            See :meth:`MessageHandlerPool.get_stats`, or None if requests
+            are handled in the ioloop (`handler_thread` is False).
+
+        """
+        if self._handler_thread is None:
+            return None
+        return self._handler_thread.get_stats()
 
     def start(self, timeout=None):
         """Start the server in a new thread.
@@ -1461,6 +2433,8 @@ class DeviceServer(DeviceServerBase):
       * request-timeout-hint (pre-standard only if protocol flags indicates
                               timeout hints, supported for KATCP v5.1 or later)
       * sensor-sampling-clear (non-standard)
+      * sensor-status-multi (non-standard)
+      * sampling-stats (non-standard)
 
     .. [#restartf1] Restart relies on .set_restart_queue() being used to
       register a restart queue with the device. When the device needs to be
@@ -1504,6 +2478,25 @@ class DeviceServer(DeviceServerBase):
 
     SUPPORTED_PROTOCOL_MAJOR_VERSIONS = (4, 5)
 
+    ## @brief Size in seconds of the time slots used to group period sampling
+    #  strategies onto shared ioloop timeouts (e.g. 0.01), or None to give
+    #  each period strategy its own timeout. Grouping rounds sample times
+    #  to the resolution, so it is off by default.
+    PERIOD_SAMPLING_RESOLUTION = None
+
+    ## @brief Whether sampling strategies coalesce sensor updates made from
+    #  other threads, delivering only the latest reading to the ioloop.
+    COALESCE_SAMPLING_UPDATES = False
+
+    ## @brief Period in seconds at which to update the sampling.* sensors
+    #  that summarise the load caused by client sampling strategies, or None
+    #  to not add these sensors.
+    SAMPLING_STATS_PERIOD = None
+
+    ## @brief Number of sensor name patterns whose matching sensors are
+    #  remembered for ?sensor-list and ?sensor-value requests.
+    SENSOR_PATTERN_CACHE_SIZE = 64
+
     ## @var log
     # @brief DeviceLogger instance for sending log messages to the client.
 
@@ -1523,15 +2516,77 @@ class DeviceServer(DeviceServerBase):
         self.extra_versions = {}
         self._restart_queue = None
         self._sensors = {}  # map names to sensor objects
+        # sorted list of the names in self._sensors
+        self._sensor_names = []
+        # LRU cache mapping name patterns to sorted lists of matching
+        # (name, sensor) pairs, cleared whenever sensors are added or removed
+        self._sensor_pattern_cache = OrderedDict()
+        self._sensor_index_lock = threading.Lock()
+        # map sensor names to (sensor, description, units, params, type,
+        # serialised #sensor-list arguments) tuples, see
+        # _sensor_list_inform_arguments()
+        self._sensor_list_informs = {}
         # map client sockets to map of sensors -> sampling strategies
         self._strategies = {}
+        # map ioloops to the PeriodicScheduler shared by the period
+        # strategies of their clients, see _get_period_scheduler()
+        self._period_schedulers = {}
+        # map client connections to SensorStatusPacker objects for clients
+        # that enabled multi-sensor informs
+        self._sensor_status_packers = {}
+        # map client connections to map of name patterns ->
+        # SamplePatternPeriod strategies
+        self._pattern_strategies = {}
         # For holding ClientConnection* instances of active connections
         self._client_conns = set()
+        # PeriodicCallback updating the sampling.* sensors, if any
+        self._sampling_stats_callback = None
 
         self.setup_sensors()
+        if self.SAMPLING_STATS_PERIOD is not None:
+            self._add_sampling_stats_sensors()
 
     # pylint: enable-msg = W0142
 
+    def start(self, timeout=None):
+        """Start the server in a new thread.
+
+        Also starts updating the sampling.* sensors on the main ioloop if
+        SAMPLING_STATS_PERIOD is set.
+
+        Parameters
+        ----------
+        timeout : float or None, optional
+            Time in seconds to wait for server thread to start.
+
+        """
+        super(DeviceServer, self).start(timeout)
+        if self.SAMPLING_STATS_PERIOD is not None:
+            self._sampling_stats_callback = tornado.ioloop.PeriodicCallback(
+                self._update_sampling_stats_sensors,
+                self.SAMPLING_STATS_PERIOD * 1000, io_loop=self.ioloop)
+            self.ioloop.add_callback(self._sampling_stats_callback.start)
+
+    def stop(self, timeout=1.0):
+        """Stop a running server (from another thread).
+
+        Parameters
+        ----------
+        timeout : float, optional
+            Seconds to wait for server to have *started*.
+
+        Returns
+        -------
+        stopped : thread-safe Future
+            Resolves when the server is stopped
+
+        """
+        stats_callback, self._sampling_stats_callback = (
+            self._sampling_stats_callback, None)
+        if stats_callback is not None:
+            self._server.call_from_thread(stats_callback.stop)
+        return super(DeviceServer, self).stop(timeout)
+
     @return_future
     def on_client_connect(self, client_conn):
         """Inform client of build state and version on connect.
@@ -1546,9 +2601,10 @@ class DeviceServer(DeviceServerBase):
         Future that resolves when the device is ready to accept messages.
 
         """
-        assert get_thread_ident() == self._server.ioloop_thread_id
+        assert self._server.in_ioloop_thread(self._client_ioloop(client_conn))
         self._client_conns.add(client_conn)
         self._strategies[client_conn] = {}  # map sensors -> sampling strategies
+        self._pattern_strategies[client_conn] = {}
 
         katcp_version = self.PROTOCOL_INFO.major
         if katcp_version >= VERSION_CONNECT_KATCP_MAJOR:
@@ -1575,16 +2631,109 @@ class DeviceServer(DeviceServerBase):
             Remove the client connection from the strategies datastructure.
             Useful for clients that disconnect.
 
+        Notes
+        -----
+        Must be called from the IOLoop thread of the client connection.
+
         """
-        assert get_thread_ident() == self._server.ioloop_thread_id
+        assert self._server.in_ioloop_thread(self._client_ioloop(client_conn))
 
-        getter = (self._strategies.pop if remove_client
-                  else self._strategies.get)
+        getter = self._strategies.pop if remove_client else self._strategies.get
+        strategies = getter(client_conn, None)
+        if strategies:
+            # Tear down all the client's strategies in one go
+            cancel_strategies(strategies.values())
+            strategies.clear()
+        getter = (self._pattern_strategies.pop if remove_client
+                  else self._pattern_strategies.get)
         strategies = getter(client_conn, None)
-        if strategies is not None:
-            for sensor, strategy in list(strategies.items()):
+        if strategies:
+            for strategy in strategies.values():
                 strategy.cancel()
-                del strategies[sensor]
+            strategies.clear()
+        if remove_client:
+            packer = self._sensor_status_packers.pop(client_conn, None)
+            if packer is not None:
+                packer.close()
+
+    def _get_period_scheduler(self, ioloop):
+        """Return the PeriodicScheduler of an ioloop (or None)."""
+        if self.PERIOD_SAMPLING_RESOLUTION is None:
+            return None
+        scheduler = self._period_schedulers.get(ioloop)
+        if scheduler is None:
+            scheduler = self._period_schedulers[ioloop] = PeriodicScheduler(
+                ioloop, self.PERIOD_SAMPLING_RESOLUTION)
+        return scheduler
+
+    def get_sampling_stats(self, by='client'):
+        """Aggregate the load counters of the active sampling strategies.
+
+        Must be called from the ioloop thread.
+
+        Parameters
+        ----------
+        by : {'client', 'sensor'}, optional
+            Whether to aggregate the counters per client connection (keyed
+            by client address) or per sensor (keyed by sensor name, or name
+            pattern for strategies set using a pattern).
+
+        Returns
+        -------
+        stats : dict
+            Maps each key to a list containing the number of strategies
+            followed by the summed counters named in
+            :data:`katcp.sampling.SAMPLING_STATS_FIELDS`.
+
+        """
+        stats = {}
+        for strategies_dict in (self._strategies, self._pattern_strategies):
+            for client_conn, strategies in strategies_dict.items():
+                for key, strategy in strategies.items():
+                    if by == 'client':
+                        name = client_conn.address
+                    else:
+                        name = getattr(key, 'name', key)
+                    totals = stats.get(name)
+                    if totals is None:
+                        totals = stats[name] = [0] * (
+                            1 + len(SAMPLING_STATS_FIELDS))
+                    totals[0] += 1
+                    for i, value in enumerate(strategy.get_stats(), 1):
+                        totals[i] += value
+        return stats
+
+    def _add_sampling_stats_sensors(self):
+        self.add_sensor(Sensor.integer(
+            "sampling.strategies",
+            "Number of active client sampling strategies."))
+        self.add_sensor(Sensor.integer(
+            "sampling.informs",
+            "Number of informs sent by the active sampling strategies."))
+        self.add_sensor(Sensor.float(
+            "sampling.inform-time",
+            "Time spent sending informs by the active sampling strategies.",
+            "s"))
+        self.add_sensor(Sensor.string(
+            "sampling.busiest-client",
+            "Address of the client whose sampling strategies spent the "
+            "most time sending informs."))
+
+    def _update_sampling_stats_sensors(self):
+        stats = self.get_sampling_stats('client')
+        strategies = informs = 0
+        inform_time = 0.0
+        busiest_client, busiest_time = "", -1.0
+        for address, totals in stats.items():
+            strategies += totals[0]
+            informs += totals[1]
+            inform_time += totals[-1]
+            if totals[-1] > busiest_time:
+                busiest_client, busiest_time = address, totals[-1]
+        self._sensors["sampling.strategies"].set_value(strategies)
+        self._sensors["sampling.informs"].set_value(informs)
+        self._sensors["sampling.inform-time"].set_value(inform_time)
+        self._sensors["sampling.busiest-client"].set_value(busiest_client)
 
     def on_client_disconnect(self, client_conn, msg, connection_valid):
         """Inform client it is about to be disconnected.
@@ -1614,7 +2763,8 @@ class DeviceServer(DeviceServerBase):
 
         try:
             self._client_conns.remove(client_conn)
-            self.ioloop.add_callback(lambda: chain_future(remove_strategies(), f))
+            self._client_ioloop(client_conn).add_callback(
+                lambda: chain_future(remove_strategies(), f))
         except Exception:
             f.set_exc_info(sys.exc_info())
         return f
@@ -1639,7 +2789,20 @@ class DeviceServer(DeviceServerBase):
             The sensor object to register with the device server.
 
         """
-        self._sensors[sensor.name] = sensor
+        with self._sensor_index_lock:
+            if sensor.name not in self._sensors:
+                bisect.insort(self._sensor_names, sensor.name)
+            self._sensors[sensor.name] = sensor
+            self._sensor_pattern_cache.clear()
+            self._sensor_list_informs.pop(sensor.name, None)
+
+        def add_to_pattern_strategies(strategies):
+            for strategy in strategies.values():
+                strategy.add_sensor(sensor)
+        for client_conn, strategies in self._pattern_strategies.items():
+            if strategies:
+                self._client_ioloop(client_conn).add_callback(
+                    add_to_pattern_strategies, strategies)
 
     def has_sensor(self, sensor_name):
         """Whether the sensor with specified name is known."""
@@ -1660,15 +2823,27 @@ class DeviceServer(DeviceServerBase):
             sensor_name = sensor
         else:
             sensor_name = sensor.name
-        sensor = self._sensors.pop(sensor_name)
+        with self._sensor_index_lock:
+            sensor = self._sensors.pop(sensor_name)
+            del self._sensor_names[bisect.bisect_left(self._sensor_names,
+                                                      sensor_name)]
+            self._sensor_pattern_cache.clear()
+            self._sensor_list_informs.pop(sensor_name, None)
 
         def cancel_sensor_strategies():
-            for conn_strategies in self._strategies.values():
-                strategy = conn_strategies.pop(sensor, None)
-                if strategy:
-                    strategy.cancel()
+            strategies = [conn_strategies.pop(sensor, None)
+                          for conn_strategies in self._strategies.values()]
+            cancel_strategies([strategy for strategy in strategies if strategy])
         self.ioloop.add_callback(cancel_sensor_strategies)
 
+        def remove_from_pattern_strategies(strategies):
+            for strategy in strategies.values():
+                strategy.remove_sensor(sensor)
+        for client_conn, strategies in self._pattern_strategies.items():
+            if strategies:
+                self._client_ioloop(client_conn).add_callback(
+                    remove_from_pattern_strategies, strategies)
+
     def get_sensor(self, sensor_name):
         """Fetch the sensor with the given name.
 
@@ -1688,6 +2863,47 @@ class DeviceServer(DeviceServerBase):
             raise ValueError("Unknown sensor '%s'." % (sensor_name,))
         return sensor
 
+    def _match_sensors(self, pattern):
+        """Find the sensors whose names match a pattern.
+
+        The pattern is interpreted as by :func:`construct_name_filter`.
+        Matches for regular expressions and for all sensors are cached, so
+        repeating a query costs time proportional to the number of matches.
+
+        Parameters
+        ----------
+        pattern : None or str
+            The sensor name or pattern to match.
+
+        Returns
+        -------
+        exact : bool
+            True if the pattern is expected to match exactly one name.
+        sensors : list of (name, sensor) tuples
+            The matching sensors, sorted by name. The list may be shared
+            with later queries and should not be modified.
+
+        """
+        is_regex = (pattern is not None and pattern.startswith('/') and
+                    pattern.endswith('/'))
+        if pattern is not None and not is_regex:
+            sensor = self._sensors.get(pattern)
+            return True, [(pattern, sensor)] if sensor is not None else []
+
+        with self._sensor_index_lock:
+            cache = self._sensor_pattern_cache
+            sensors = cache.pop(pattern, None)
+            if sensors is None:
+                names = self._sensor_names
+                if is_regex:
+                    name_re = re.compile(pattern[1:-1])
+                    names = [name for name in names if name_re.search(name)]
+                sensors = [(name, self._sensors[name]) for name in names]
+                if cache and len(cache) >= self.SENSOR_PATTERN_CACHE_SIZE:
+                    cache.popitem(last=False)
+            cache[pattern] = sensors
+        return False, sensors
+
     def get_sensors(self):
         """Fetch a list of all sensors.
 
@@ -1806,11 +3022,12 @@ class DeviceServer(DeviceServerBase):
 
         """
         if not msg.arguments:
-            for name, method in sorted(self._request_handlers.items()):
-                doc = method.__doc__
-                req.inform(name, doc)
-            num_methods = len(self._request_handlers)
-            return req.make_reply("ok", str(num_methods))
+            handlers = sorted(self._request_handlers.items())
+            req.inform_formatted([self._help_inform_arguments(name, method)
+                                  for name, method in handlers],
+                                 ((name, method.__doc__)
+                                  for name, method in handlers))
+            return req.make_reply("ok", str(len(handlers)))
         else:
             name = msg.arguments[0]
             if name in self._request_handlers:
@@ -1820,6 +3037,20 @@ class DeviceServer(DeviceServerBase):
                 return req.make_reply("ok", "1")
             return req.make_reply("fail", "Unknown request method.")
 
+    def _help_inform_arguments(self, name, method):
+        """Serialised arguments of the #help inform of a request handler.
+
+        These are cached until the handler registered for the request or
+        its docstring changes.
+
+        """
+        doc = method.__doc__
+        cached = self._help_informs.get(name)
+        if cached is None or cached[0] is not method or cached[1] is not doc:
+            cached = (method, doc, format_inform_arguments('help', (name, doc)))
+            self._help_informs[name] = cached
+        return cached[2]
+
     @request(Str(optional=True))
     @return_reply(Int())
     @has_katcp_protocol_flags(ProtocolFlags.REQUEST_TIMEOUT_HINTS)
@@ -1993,7 +3224,7 @@ class DeviceServer(DeviceServerBase):
         """
         # TODO Get list of ClientConnection* instances and implement a standard
         # 'address-print' method in the ClientConnection class
-        clients = self._client_conns
+        clients = list(self._client_conns)
         num_clients = len(clients)
         for conn in clients:
             addr = conn.address
@@ -2110,10 +3341,8 @@ class DeviceServer(DeviceServerBase):
             !sensor-list ok 2
 
         """
-        exact, name_filter = construct_name_filter(msg.arguments[0]
-                                                   if msg.arguments else None)
-        sensors = [(name, sensor) for name, sensor in
-                   sorted(self._sensors.iteritems()) if name_filter(name)]
+        exact, sensors = self._match_sensors(msg.arguments[0]
+                                             if msg.arguments else None)
 
         if exact and not sensors:
             return req.make_reply("fail", "Unknown sensor name.")
@@ -2122,9 +3351,38 @@ class DeviceServer(DeviceServerBase):
         return req.make_reply("ok", str(len(sensors)))
 
     def _send_sensor_value_informs(self, req, sensors):
-        for name, sensor in sensors:
-            req.inform(name, sensor.description, sensor.units, sensor.stype,
-                       *sensor.formatted_params)
+        req.inform_formatted([self._sensor_list_inform_arguments(name, sensor)
+                              for name, sensor in sensors],
+                             (self._sensor_list_arguments(name, sensor)
+                              for name, sensor in sensors))
+
+    @staticmethod
+    def _sensor_list_arguments(name, sensor):
+        """Arguments of the #sensor-list inform of a sensor."""
+        return [name, sensor.description, sensor.units,
+                sensor.stype] + sensor.formatted_params
+
+    def _sensor_list_inform_arguments(self, name, sensor):
+        """Serialised arguments of the #sensor-list inform of a sensor.
+
+        These are cached until the sensor is replaced or its description,
+        units, type or params attributes are assigned new objects (changes
+        made in place to the params list are not noticed).
+
+        """
+        cached = self._sensor_list_informs.get(name)
+        if (cached is None or cached[0] is not sensor or
+                cached[1] is not sensor._description or
+                cached[2] is not sensor.units or
+                cached[3] is not sensor.params or
+                cached[4] is not sensor._stype):
+            cached = (sensor, sensor._description, sensor.units,
+                      sensor.params, sensor._stype,
+                      format_inform_arguments(
+                          'sensor-list',
+                          self._sensor_list_arguments(name, sensor)))
+            self._sensor_list_informs[name] = cached
+        return cached[5]
 
     def request_sensor_value(self, req, msg):
         """Request the value of a sensor or sensors.
@@ -2175,10 +3433,8 @@ class DeviceServer(DeviceServerBase):
             !sensor-value ok 1
 
         """
-        exact, name_filter = construct_name_filter(msg.arguments[0]
-                                                   if msg.arguments else None)
-        sensors = [(name, sensor) for name, sensor in
-                   sorted(self._sensors.iteritems()) if name_filter(name)]
+        exact, sensors = self._match_sensors(msg.arguments[0]
+                                             if msg.arguments else None)
 
         if exact and not sensors:
             return req.make_reply("fail", "Unknown sensor name.")
@@ -2199,6 +3455,16 @@ class DeviceServer(DeviceServerBase):
         ----------
         name : str
             Name of the sensor whose sampling strategy to query or configure.
+            A name that starts and ends with '/' is a regular expression
+            selecting sensors by name (non-standard). Only the period and none
+            strategies may be used with such a pattern. All matching sensors,
+            including ones added later, are then reported together in
+            multi-sensor #sensor-status informs.
+            If the server's protocol flags include 'B', a comma-separated
+            list of sensor names may be given to set the same strategy on
+            all of them at once. The strategy of each sensor is then
+            reported in a #sensor-sampling inform before the reply, or
+            'fail' and the reason if it could not be set on that sensor.
         strategy : {'none', 'auto', 'event', 'differential', \
                     'period', 'event-rate'}, optional
             Type of strategy to use to report the sensor value. The
@@ -2241,10 +3507,19 @@ class DeviceServer(DeviceServerBase):
             ?sensor-sampling cpu.power.on period 500
             !sensor-sampling ok cpu.power.on period 500
 
+            ?sensor-sampling /^cpu\./ period 1
+            !sensor-sampling ok /^cpu\./ period 1
+
+            ?sensor-sampling cpu.power.on,cpu.temp,cpu.gone event
+            #sensor-sampling cpu.power.on event
+            #sensor-sampling cpu.temp event
+            #sensor-sampling cpu.gone fail Unknown\_sensor\_name:\_cpu.gone.
+            !sensor-sampling ok cpu.power.on,cpu.temp,cpu.gone event
+
         """
         f = Future()
-        self.ioloop.add_callback(lambda: chain_future(
-            self._handle_sensor_sampling(req, msg), f))
+        self._client_ioloop(req.client_connection).add_callback(
+            lambda: chain_future(self._handle_sensor_sampling(req, msg), f))
         return f
 
     @gen.coroutine
@@ -2254,69 +3529,214 @@ class DeviceServer(DeviceServerBase):
 
         name = msg.arguments[0]
 
+        if len(name) > 1 and name.startswith('/') and name.endswith('/'):
+            raise gen.Return(self._handle_pattern_sampling(req, msg))
+
+        if ',' in name and self.PROTOCOL_INFO.bulk_set_sensor_sampling:
+            reply = yield self._handle_bulk_sensor_sampling(req, msg)
+            raise gen.Return(reply)
+
         if name not in self._sensors:
             raise FailReply("Unknown sensor name: %s." % name)
 
         sensor = self._sensors[name]
         # The client connection that is not specific to this request context
         client = req.client_connection
-        katcp_version = self.PROTOCOL_INFO.major
 
         if len(msg.arguments) > 1:
             # attempt to set sampling strategy
-            strategy = msg.arguments[1]
-            params = msg.arguments[2:]
+            new_strategy = self._create_sampling_strategy(
+                client, sensor, msg.arguments[1], msg.arguments[2:])
+            self._replace_sampling_strategy(client, sensor, new_strategy)
 
-            if strategy not in SampleStrategy.SAMPLING_LOOKUP_REV:
-                raise FailReply("Unknown strategy name: %s." % strategy)
+        strategy, params = self._current_sampling_formatted(client, sensor)
 
-            if not self.PROTOCOL_INFO.strategy_allowed(strategy):
-                raise FailReply("Strategy %s not allowed for version %d of katcp"
-                                % (strategy, katcp_version))
+        # Let the ioloop run so that the #sensor-status inform is sent before
+        # the reply. Not strictly neccesary, but a number of tests depend on
+        # this behaviour, less effort to fix it here :-/
+        yield gen.moment
+        raise gen.Return(req.make_reply("ok", name, strategy, *params))
 
-            format_inform = (format_inform_v5
-                             if katcp_version >= SEC_TS_KATCP_MAJOR
-                             else format_inform_v4)
-
-            def inform_callback(sensor, reading):
-                """Inform callback for sensor strategy."""
-                timestamp, status, value = reading
-                cb_msg = format_inform(sensor, timestamp, status, value)
-                client.inform(cb_msg)
-
-            if katcp_version < SEC_TS_KATCP_MAJOR and strategy == 'period':
-                # Slightly nasty hack, but since period is the only v4 strategy
-                # involving timestamps it's not _too_ nasty :)
-                params = [float(params[0]) * MS_TO_SEC_FAC] + params[1:]
-            new_strategy = SampleStrategy.get_strategy(
-                strategy, inform_callback, sensor, *params, ioloop=self.ioloop)
-
-            # Remove and cancel old strategy
-            old_strategy = self._strategies[client].pop(sensor, None)
-            if old_strategy:
-                old_strategy.cancel()
+    @gen.coroutine
+    def _handle_bulk_sensor_sampling(self, req, msg):
+        """Handle ?sensor-sampling for a comma-separated list of names.
+
+        The same strategy is set on every sensor in the list that exists
+        and accepts it. The result for each name is reported in a
+        #sensor-sampling inform before the reply: the sensor's new strategy,
+        or 'fail' and the reason if its strategy could not be set. The
+        request only fails if no strategy could be set at all.
+
+        """
+        names_arg = msg.arguments[0]
+        names = [name for name in names_arg.split(',') if name]
+        if len(msg.arguments) < 2:
+            raise FailReply("A strategy is required when setting the "
+                            "sampling of multiple sensors.")
+
+        client = req.client_connection
+        strategy, params = msg.arguments[1], msg.arguments[2:]
+        errors = []
+        for name in names:
+            sensor = self._sensors.get(name)
+            try:
+                if sensor is None:
+                    raise FailReply("Unknown sensor name: %s." % name)
+                new_strategy = self._create_sampling_strategy(
+                    client, sensor, strategy, params)
+            except (FailReply, ValueError), e:
+                errors.append(str(e))
+                req.inform(name, "fail", str(e))
+                continue
+            self._replace_sampling_strategy(client, sensor, new_strategy)
+            current, current_params = self._current_sampling_formatted(
+                client, sensor)
+            req.inform(name, current, *current_params)
+
+        yield gen.moment
+        if len(errors) == len(names):
+            raise FailReply("No sampling strategies set: %s"
+                            % (errors[0] if errors else "no sensor names."))
+        raise gen.Return(req.make_reply("ok", names_arg, strategy, *params))
+
+    def _create_sampling_strategy(self, client, sensor, strategy, params):
+        """Create (but do not start) a sampling strategy for a client.
 
-            # todo: replace isinstance check with something better
-            if not isinstance(new_strategy, SampleNone):
-                self._strategies[client][sensor] = new_strategy
-                new_strategy.start()
+        Parameters
+        ----------
+        client : ClientConnection object
+            The client the sensor updates are sent to.
+        sensor : Sensor object
+            The sensor to sample.
+        strategy : str
+            Name of the sampling strategy.
+        params : list of str
+            Strategy parameters as received in the request.
+
+        Returns
+        -------
+        new_strategy : SampleStrategy object
+            The new strategy.
+
+        """
+        katcp_version = self.PROTOCOL_INFO.major
+
+        if strategy not in SampleStrategy.SAMPLING_LOOKUP_REV:
+            raise FailReply("Unknown strategy name: %s." % strategy)
+
+        if not self.PROTOCOL_INFO.strategy_allowed(strategy):
+            raise FailReply("Strategy %s not allowed for version %d of katcp"
+                            % (strategy, katcp_version))
+
+        format_inform = (format_inform_v5
+                         if katcp_version >= SEC_TS_KATCP_MAJOR
+                         else format_inform_v4)
+        major = 5 if katcp_version >= SEC_TS_KATCP_MAJOR else 4
+        # Real connections write the shared serialised inform directly
+        send_lines = (client.send_lines
+                      if isinstance(client, ClientConnection) else None)
+
+        def inform_callback(sensor, reading):
+            """Inform callback for sensor strategy."""
+            if strategy == 'period':
+                packer = self._sensor_status_packers.get(client)
+                if packer is not None:
+                    packer.add(sensor, reading)
+                    return
+            if send_lines is not None:
+                send_lines(format_inform_line(sensor, reading, major))
+            else:
+                client.inform(format_inform(sensor, *reading))
 
+        if katcp_version < SEC_TS_KATCP_MAJOR and strategy == 'period':
+            # Slightly nasty hack, but since period is the only v4 strategy
+            # involving timestamps it's not _too_ nasty :)
+            params = [float(params[0]) * MS_TO_SEC_FAC] + list(params[1:])
+        ioloop = self._client_ioloop(client)
+        return SampleStrategy.get_strategy(
+            strategy, inform_callback, sensor, *params, ioloop=ioloop,
+            scheduler=self._get_period_scheduler(ioloop),
+            coalesce_updates=self.COALESCE_SAMPLING_UPDATES)
+
+    def _replace_sampling_strategy(self, client, sensor, new_strategy):
+        """Cancel a client's old strategy for a sensor and start a new one."""
+        old_strategy = self._strategies[client].pop(sensor, None)
+        if old_strategy:
+            old_strategy.cancel()
+
+        # todo: replace isinstance check with something better
+        if not isinstance(new_strategy, SampleNone):
+            self._strategies[client][sensor] = new_strategy
+            new_strategy.start()
+
+    def _current_sampling_formatted(self, client, sensor):
+        """Return a client's current (strategy, params) for a sensor."""
         current_strategy = self._strategies[client].get(sensor, None)
         if not current_strategy:
             current_strategy = SampleStrategy.get_strategy(
                 "none", lambda *args: None, sensor)
 
         strategy, params = current_strategy.get_sampling_formatted()
-        if katcp_version < SEC_TS_KATCP_MAJOR and strategy == 'period':
+        if (self.PROTOCOL_INFO.major < SEC_TS_KATCP_MAJOR and
+                strategy == 'period'):
             # Another slightly nasty hack, but since period is the only
             # v4 strategy involving timestamps it's not _too_ nasty :)
             params = [int(float(params[0]) * SEC_TO_MS_FAC)] + params[1:]
+        return strategy, params
 
-        # Let the ioloop run so that the #sensor-status inform is sent before
-        # the reply. Not strictly neccesary, but a number of tests depend on
-        # this behaviour, less effort to fix it here :-/
-        yield gen.moment
-        raise gen.Return(req.make_reply("ok", name, strategy, *params))
+    def _handle_pattern_sampling(self, req, msg):
+        """Handle ?sensor-sampling for a /regex/ sensor name pattern."""
+        pattern = msg.arguments[0]
+        client = req.client_connection
+        katcp_version = self.PROTOCOL_INFO.major
+        strategies = self._pattern_strategies[client]
+
+        if len(msg.arguments) > 1:
+            strategy = msg.arguments[1]
+            params = msg.arguments[2:]
+            if strategy not in ('period', 'none'):
+                raise FailReply("Only the period and none strategies may be "
+                                "used with a sensor name pattern.")
+            if not self.PROTOCOL_INFO.strategy_allowed(strategy):
+                raise FailReply("Strategy %s not allowed for version %d of katcp"
+                                % (strategy, katcp_version))
+            new_strategy = None
+            if strategy == 'period':
+                if len(params) != 1:
+                    raise FailReply("The 'period' strategy takes one "
+                                    "parameter.")
+                try:
+                    name_filter = construct_name_filter(pattern)[1]
+                except re.error, e:
+                    raise FailReply("Invalid sensor name pattern %r: %s"
+                                    % (pattern, e))
+                period = params[0]
+                if katcp_version < SEC_TS_KATCP_MAJOR:
+                    period = float(period) * MS_TO_SEC_FAC
+                ioloop = self._client_ioloop(client)
+                try:
+                    new_strategy = SamplePatternPeriod(
+                        client.inform, pattern, name_filter, period,
+                        ioloop=ioloop,
+                        scheduler=self._get_period_scheduler(ioloop),
+                        major=katcp_version)
+                except ValueError, e:
+                    raise FailReply(str(e))
+
+            old_strategy = strategies.pop(pattern, None)
+            if old_strategy:
+                old_strategy.cancel()
+            if new_strategy:
+                strategies[pattern] = new_strategy
+                new_strategy.start(self._sensors.values())
+
+        current_strategy = strategies.get(pattern)
+        if current_strategy is None:
+            return req.make_reply("ok", pattern, "none")
+        strategy, params = current_strategy.get_sampling_formatted()
+        if katcp_version < SEC_TS_KATCP_MAJOR:
+            params = [int(float(params[0]) * SEC_TO_MS_FAC)]
+        return req.make_reply("ok", pattern, strategy, *params)
 
     @request()
     @return_reply()
@@ -2340,7 +3760,125 @@ class DeviceServer(DeviceServerBase):
             self.clear_strategies(req.client_connection)
             raise gen.Return(('ok',))
 
-        self.ioloop.add_callback(lambda: chain_future(_clear_strategies(), f))
+        self._client_ioloop(req.client_connection).add_callback(
+            lambda: chain_future(_clear_strategies(), f))
+        return f
+
+    def request_sensor_status_multi(self, req, msg):
+        """Query or set packing of period sampling informs for this client.
+
+        When enabled, #sensor-status informs of period strategies that fire
+        in the same ioloop iteration with the same timestamp are packed into
+        a single multi-sensor inform.
+
+        Parameters
+        ----------
+        enable : {'on', 'off'}, optional
+            Whether to pack the informs (the default is to leave the setting
+            unchanged).
+
+        Returns
+        -------
+        success : {'ok', 'fail'}
+            Whether the request succeeded.
+        enabled : {'on', 'off'}
+            The setting after processing the request.
+
+        Examples
+        --------
+        ::
+
+            ?sensor-status-multi on
+            !sensor-status-multi ok on
+
+        """
+        if msg.arguments and msg.arguments[0] not in ('on', 'off'):
+            raise FailReply("Expected 'on' or 'off', got %r."
+                            % (msg.arguments[0],))
+        client = req.client_connection
+        f = Future()
+
+        @gen.coroutine
+        def _set_packing():
+            if msg.arguments:
+                if msg.arguments[0] == 'off':
+                    packer = self._sensor_status_packers.pop(client, None)
+                    if packer is not None:
+                        packer.flush()
+                elif client not in self._sensor_status_packers:
+                    self._sensor_status_packers[client] = SensorStatusPacker(
+                        client.inform, self._client_ioloop(client),
+                        self.PROTOCOL_INFO.major)
+            enabled = client in self._sensor_status_packers
+            raise gen.Return(req.make_reply('ok', 'on' if enabled else 'off'))
+
+        self._client_ioloop(client).add_callback(
+            lambda: chain_future(_set_packing(), f))
+        return f
+
+    def request_sampling_stats(self, req, msg):
+        """Report the load caused by the sampling strategies of all clients.
+
+        The counters of the active sampling strategies are summed per client
+        or per sensor and sent as #sampling-stats informs, starting with the
+        client or sensor whose strategies spent the most time sending
+        informs.
+
+        Parameters
+        ----------
+        by : {'client', 'sensor'}, optional
+            Whether to aggregate per client (the default) or per sensor.
+
+        Informs
+        -------
+        name : str
+            Client address, or sensor name (or name pattern).
+        strategies : int
+            Number of active sampling strategies.
+        informs : int
+            Number of #sensor-status informs sent.
+        suppressed : int
+            Number of sensor updates suppressed by rate limits.
+        superseded : int
+            Number of sensor updates superseded by a newer update before
+            they were processed.
+        timer-fires : int
+            Number of ioloop timer callbacks run.
+        inform-time : float
+            Time spent sending informs, in seconds.
+
+        Returns
+        -------
+        success : {'ok', 'fail'}
+            Whether the request succeeded.
+        informs : int
+            Number of #sampling-stats informs sent.
+
+        Examples
+        --------
+        ::
+
+            ?sampling-stats
+            #sampling-stats 127.0.0.1:53600 2 310 4000 0 310 0.021
+            #sampling-stats 127.0.0.1:53602 1 10 0 0 10 0.001
+            !sampling-stats ok 2
+
+        """
+        by = msg.arguments[0] if msg.arguments else 'client'
+        if by not in ('client', 'sensor'):
+            raise FailReply("Expected 'client' or 'sensor', got %r." % (by,))
+        f = Future()
+
+        @gen.coroutine
+        def _send_stats():
+            stats = self.get_sampling_stats(by)
+            for name, totals in sorted(stats.items(),
+                                       key=lambda item: -item[1][-1]):
+                req.inform(name, *(totals[:-1] + ['%.6f' % totals[-1]]))
+            raise gen.Return(req.make_reply('ok', str(len(stats))))
+
+        self._client_ioloop(req.client_connection).add_callback(
+            lambda: chain_future(_send_stats(), f))
         return f
 
     def request_watchdog(self, req, msg):
@@ -12,6 +12,7 @@ from __future__ import division, print_function, absolute_import
 from builtins import str
 from builtins import object
 import logging
+import mock
 import unittest
 #
 
@@ -58,6 +59,16 @@ class TestMessage(unittest.TestCase):
         self.assertEqual(str(katcp.Message.inform("foo", "a", "b", mid=123)),
                          "#foo[123] a b")
 
+    def test_trusted(self):
+        """Test construction of pre-validated messages."""
+        msg = katcp.Message.trusted(katcp.Message.INFORM, "foo",
+                                    ["a", 1, 1.5, True], mid="12")
+        self.assertEqual(msg, katcp.Message.inform("foo", "a", 1, 1.5, True,
+                                                   mid=12))
+        self.assertEqual(str(msg), "#foo[12] a 1 1.5 1")
+        msg = katcp.Message.trusted(katcp.Message.REPLY, "bar", [])
+        self.assertEqual(str(msg), "!bar")
+
     def test_equality(self):
         class AlwaysEqual(object):
             def __eq__(self, other):
@@ -169,6 +180,94 @@ class TestMessageParser(unittest.TestCase):
         self.assertEqual(m.arguments,
                          ['1', repr(float_val), '1', '0', 'string'])
 
+    def test_parse_many(self):
+        """Test parsing a block of lines."""
+        msgs, tail, errors = self.p.parse_many(
+            "?foo a\r\n#bar[3] \\_\n\n?1bad\r!baz ok\n?qu")
+        self.assertEqual(msgs, [katcp.Message.request("foo", "a"),
+                                katcp.Message.inform("bar", " ", mid=3),
+                                katcp.Message.reply("baz", "ok")])
+        self.assertEqual(tail, "?qu")
+        self.assertEqual([line for line, e in errors], ["?1bad"])
+        self.assertTrue(isinstance(errors[0][1], katcp.KatcpSyntaxError))
+
+        msgs, tail, errors = self.p.parse_many("?foo \\z\n?bar \0\n")
+        self.assertEqual((msgs, tail), ([], ""))
+        self.assertEqual([line for line, e in errors],
+                         ["?foo \\z", "?bar \0"])
+        self.assertEqual(self.p.parse_many(""), ([], "", []))
+
+
+class TestFastMessageParser(TestMessageParser):
+    def setUp(self):
+        self.p = katcp.FastMessageParser()
+
+    def test_same_as_message_parser(self):
+        """Test that results and errors match those of MessageParser."""
+        ref = katcp.MessageParser()
+        lines = [
+            "?foo", "?foo ", "?foo\t", "#foo[12]", "#foo[12] a", "!foo[12]a",
+            "!foo[] a", "!foo[a] b", "?foo\n", "?foo a\n", "?foo a\rb",
+            "#sensor-status 1.0 1 a.b nominal 3", r"!foo \@ a\_b \\",
+            r"!foo a\ b", r"!foo a\z", "!foo a\x1bb", "!foo\fbar",
+            "?1foo", "", "x", "?", "?-a", r"?foo \\\_\0\n\r\e\t\@",
+        ]
+        for line in lines:
+            try:
+                expected = ref.parse(line)
+            except katcp.KatcpSyntaxError as e:
+                with self.assertRaises(katcp.KatcpSyntaxError) as cm:
+                    self.p.parse(line)
+                self.assertEqual(str(cm.exception), str(e))
+            else:
+                self.assertEqual(self.p.parse(line), expected)
+
+
+class TestLazyMessageParser(TestFastMessageParser):
+    def setUp(self):
+        self.p = katcp.LazyMessageParser()
+
+    def test_lazy_arguments(self):
+        """Test deferred unescaping and re-use of the raw line."""
+        line = "#sensor-status 1.0 1 a\\_b  nominal \\@"
+        msg = self.p.parse(line)
+        self.assertTrue(isinstance(msg, katcp.LazyMessage))
+        self.assertEqual(msg._arguments, None)
+        self.assertEqual(str(msg), line)
+        self.assertEqual(msg.arguments, ["1.0", "1", "a b", "nominal", ""])
+        self.assertEqual(str(msg), line)
+        self.assertEqual(msg, katcp.Message.inform(
+            "sensor-status", "1.0", "1", "a b", "nominal", ""))
+
+        msg.mid = "7"
+        self.assertEqual(str(msg),
+                         "#sensor-status[7] 1.0 1 a\\_b nominal \\@")
+        msg = self.p.parse(line)
+        msg.arguments.append("x")
+        self.assertEqual(str(msg),
+                         "#sensor-status 1.0 1 a\\_b nominal \\@ x")
+        msg = self.p.parse(line)
+        msg.arguments = ["y"]
+        self.assertEqual(str(msg), "#sensor-status y")
+
+
+class TestLineSplitter(unittest.TestCase):
+    def test_feed(self):
+        splitter = katcp.core.LineSplitter()
+        self.assertEqual(splitter.feed("?foo a\n?bar\r\n#baz"),
+                         ["?foo a", "?bar"])
+        self.assertEqual(splitter.feed(" b"), [])
+        self.assertEqual(splitter.feed(" c\r!qux\n\n"), ["#baz b c", "!qux"])
+        self.assertEqual(splitter.feed(""), [])
+
+    def test_max_line_size(self):
+        splitter = katcp.core.LineSplitter(max_line_size=8)
+        self.assertEqual(splitter.feed("?foo\n?bar"), ["?foo"])
+        splitter.feed("1234")
+        with self.assertRaises(katcp.KatcpSyntaxError):
+            splitter.feed("56")
+
+
 class TestProtocolFlags(unittest.TestCase):
     def test_parse_version(self):
         PF = katcp.ProtocolFlags
@@ -183,6 +282,12 @@ class TestProtocolFlags(unittest.TestCase):
         self.assertEqual(PF.parse_version("5.1-MTI"),
                          PF(5, 1, set([PF.MULTI_CLIENT, PF.MESSAGE_IDS,
                                        PF.REQUEST_TIMEOUT_HINTS])))
+        # Check bulk sensor sampling flag
+        pf = PF.parse_version("5.1-BIM")
+        self.assertEqual(pf, PF(5, 1, set([PF.MULTI_CLIENT, PF.MESSAGE_IDS,
+                                           PF.BULK_SET_SENSOR_SAMPLING])))
+        self.assertTrue(pf.bulk_set_sensor_sampling)
+        self.assertFalse(PF.parse_version("5.1-IM").bulk_set_sensor_sampling)
 
     def test_str(self):
         PF = katcp.ProtocolFlags
@@ -207,6 +312,10 @@ class TestProtocolFlags(unittest.TestCase):
         with self.assertRaises(ValueError):
             PF(5, 0, [PF.REQUEST_TIMEOUT_HINTS])
 
+        # Nor do they support the (proposed) bulk sensor sampling flag
+        with self.assertRaises(ValueError):
+            PF(5, 0, [PF.BULK_SET_SENSOR_SAMPLING])
+
 
 class TestSensor(unittest.TestCase):
 
@@ -265,6 +374,17 @@ class TestSensor(unittest.TestCase):
                          initial_status=Sensor.WARN)
         self.assertEquals(s.status(), Sensor.WARN)
 
+    def test_derived_attributes(self):
+        """Test attributes that are computed on access."""
+        s = Sensor.float("a.float", "A float.", "power", [0.0, 5.5])
+        self.assertEqual(s.formatted_params, ['0', '5.5'])
+        s.params = [1.0, 2.0]
+        self.assertEqual(s.formatted_params, ['1', '2'])
+        # The type names may still be assigned
+        self.assertEqual((s.stype, s.type), ('float', 'float'))
+        s.stype = 'double'
+        self.assertEqual((s.stype, s.type), ('double', 'double'))
+
 
     def test_boolean_sensor(self):
         """Test boolean sensor."""
@@ -440,6 +560,82 @@ class TestSensor(unittest.TestCase):
         self.assertEqual(len(Sensor.STATUSES), len(valid_statuses))
         self.assertEqual(len(Sensor.STATUS_NAMES), len(valid_statuses))
 
+    def test_compact_representation(self):
+        """Test that sensors keep their state in slots and share kattypes."""
+        s1 = Sensor.discrete("d1", params=["a", "b"])
+        s2 = Sensor.discrete("d2", params=["a", "b"])
+        s3 = Sensor.discrete("d3", params=["a", "c"])
+        self.assertTrue(s1._kattype is s2._kattype)
+        self.assertFalse(s1._kattype is s3._kattype)
+        self.assertTrue(Sensor.integer("i1")._kattype is
+                        Sensor.integer("i2", params=[0, 5])._kattype)
+        # Nothing has been stored in the (lazily allocated) instance dict
+        self.assertEqual(vars(s1), {})
+        self.assertEqual(s1._observers, None)
+        s1.detach(object())
+        s1.set_value("b")
+        self.assertEqual(s1.value(), "b")
+        # Instance attributes can still be added
+        s2.set = lambda *args: None
+        s2.set_value("b")
+        self.assertEqual(s2.value(), "a")
+        s3.description = "Custom description."
+        self.assertEqual(s3.description, "Custom description.")
+
+
+    def test_observers(self):
+        """Test attaching and detaching observers, also while notifying."""
+        s = Sensor.integer("an.int")
+        calls = []
+        late = mock.Mock()
+
+        class Observer(object):
+            def update(self, sensor, reading):
+                calls.append((self, reading.value))
+                # Changes made while notifying apply from the next update
+                sensor.detach(self)
+                sensor.attach(late)
+
+        o1, o2 = Observer(), Observer()
+        s.attach(o1)
+        s.attach(o2)
+        s.attach(o1)
+        self.assertEqual(s._observers, (o1, o2))
+        observers = s._observers
+        s.set_value(3)
+        self.assertEqual(calls, [(o1, 3), (o2, 3)])
+        self.assertFalse(late.update.called)
+        # The tuple is replaced, never modified in place
+        self.assertEqual(observers, (o1, o2))
+        self.assertEqual(s._observers, (late,))
+        s.set_value(4)
+        late.update.assert_called_once_with(s, s.read())
+        s.detach(late)
+        self.assertEqual(s._observers, ())
+
+    def test_detach_many(self):
+        """Test detaching observers in bulk, which compares by identity."""
+        class EqualObserver(object):
+            def __eq__(self, other):
+                return True
+        s = Sensor.integer("an.int")
+        # Sensors share a pool of locks instead of having one each
+        self.assertIn(s._observers_lock, Sensor._OBSERVERS_LOCKS)
+        o1, o2, o3 = EqualObserver(), EqualObserver(), EqualObserver()
+        s.attach(o1)
+        s.attach(o2)
+        s.attach(o3)
+        self.assertEqual(len(s._observers), 3)
+        s.detach_many([o1, o3, mock.Mock()])
+        self.assertIs(s._observers[0], o2)
+        self.assertEqual(len(s._observers), 1)
+        # Attaching or detaching observers that are not new or attached
+        # leaves the observer tuple alone
+        observers = s._observers
+        s.detach(o1)
+        s.attach(o2)
+        self.assertIs(s._observers, observers)
+
 
 class TestAsyncState(tornado.testing.AsyncTestCase):
 
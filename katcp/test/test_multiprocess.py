@@ -0,0 +1,128 @@
+# test_multiprocess.py
+# -*- coding: utf8 -*-
+# vim:fileencoding=utf8 ai ts=4 sts=4 et sw=4
+# Copyright 2009 SKA South Africa (http://ska.ac.za/)
+# BSD license - see COPYING for details
+
+"""Tests for the katcp.multiprocess module.
+   """
+
+from __future__ import division, print_function, absolute_import
+
+import unittest2 as unittest
+import mock
+import tornado.testing
+
+from tornado import gen
+
+from katcp import Sensor, DeviceServer, Message
+from katcp.core import Reading
+from katcp.multiprocess import SharedSensorTable, DeviceServerPool, _SEQ
+from katcp.testutils import BlockingTestClient, start_thread_with_cleanup
+
+
+class TestSharedSensorTable(tornado.testing.AsyncTestCase):
+
+    def setUp(self):
+        super(TestSharedSensorTable, self).setUp()
+        self.sensors = [
+            Sensor.integer('an.int'),
+            Sensor.float('a.float'),
+            Sensor.boolean('a.bool'),
+            Sensor.discrete('a.discrete', params=['on', 'off']),
+            Sensor.string('a.string'),
+        ]
+        self.table = SharedSensorTable(self.sensors, value_size=16)
+        self.addCleanup(self.table.close)
+
+    def test_read(self):
+        values = [-7, 0.125, True, 'off', 'hello world']
+        for sensor, value in zip(self.sensors, values):
+            sensor.set(1234.5, Sensor.WARN, value)
+        for sensor, value in zip(self.sensors, values):
+            self.assertEqual(self.table.read(sensor),
+                             (1234.5, Sensor.WARN, value))
+        with self.assertRaises(ValueError):
+            self.sensors[-1].set_value('a string that is too long')
+
+    def test_read_while_writing(self):
+        an_int = self.sensors[0]
+        an_int.set(1000.0, Sensor.NOMINAL, 1)
+        # Pretend that a writer died halfway through updating the slot
+        _SEQ.pack_into(self.table._mmap, self.table._seq_offset, 3)
+        self.table.READ_RETRIES = 3
+        with mock.patch('katcp.multiprocess.log') as log:
+            self.assertIsNone(self.table.read(an_int))
+        self.assertEqual(log.warning.call_count, 1)
+
+    @tornado.testing.gen_test
+    def test_follow(self):
+        an_int = self.sensors[0]
+        an_int.set(1000.0, Sensor.NOMINAL, 1)
+        reader = self.table.add_reader()
+        # Pretend that this is the forked reader process
+        self.table.follow(reader, self.io_loop)
+        observer = mock.Mock()
+        an_int.attach(observer)
+        yield gen.moment
+        # Readings set before following are not set again
+        self.assertFalse(observer.update.called)
+        # Readings set in this process are no longer written to the table
+        an_int.set(1001.0, Sensor.NOMINAL, 2)
+        self.assertEqual(self.table.read(an_int), (1000.0, Sensor.NOMINAL, 1))
+        # Readings written by the owner are set on the sensors
+        observer.reset_mock()
+        self.table.update(an_int, Reading(1002.0, Sensor.ERROR, 3))
+        self.table.update(self.sensors[4],
+                          Reading(1002.0, Sensor.NOMINAL, 'new'))
+        self.table._refresh()
+        self.assertEqual(an_int.read(), (1002.0, Sensor.ERROR, 3))
+        self.assertEqual(self.sensors[4].read(),
+                         (1002.0, Sensor.NOMINAL, 'new'))
+        observer.update.assert_called_once_with(
+            an_int, (1002.0, Sensor.ERROR, 3))
+
+
+class PoolDeviceServer(DeviceServer):
+
+    VERSION_INFO = ('pool-test', 1, 0)
+    BUILD_INFO = ('pool-test', 1, 0, '')
+
+    def __init__(self, host, port, sensors):
+        self._table_sensors = sensors
+        super(PoolDeviceServer, self).__init__(host, port)
+
+    def setup_sensors(self):
+        for sensor in self._table_sensors:
+            self.add_sensor(sensor)
+
+
+class TestDeviceServerPool(unittest.TestCase):
+
+    def test_pool(self):
+        sensor = Sensor.integer('shared.int', default=1)
+        table = SharedSensorTable([sensor])
+        self.addCleanup(table.close)
+        pool = DeviceServerPool(
+            lambda host, port: PoolDeviceServer(host, port, [sensor]),
+            '127.0.0.1', 0, 2, table)
+        self.assertTrue(pool.start(timeout=5))
+        self.addCleanup(pool.join, timeout=5)
+        self.addCleanup(pool.stop)
+
+        host, port = pool.bind_address
+        client = BlockingTestClient(self, host, port)
+        start_thread_with_cleanup(self, client, start_timeout=1)
+        self.assertTrue(client.wait_protocol(timeout=1))
+        reply, _ = client.blocking_request(
+            Message.request('sensor-sampling', 'shared.int', 'event'))
+        self.assertTrue(reply.reply_ok())
+        get_msgs = client.message_recorder(whitelist=['sensor-status'])
+        # A reading set in this process reaches the worker of the client
+        sensor.set(1234.0, Sensor.NOMINAL, 5)
+        get_msgs.wait_number(1, timeout=5)
+        self.assertEqual(str(get_msgs()[0]),
+                         '#sensor-status 1234.000000 1 shared.int nominal 5')
+
+        pool.stop()
+        self.assertTrue(pool.join(timeout=5))
@@ -454,6 +454,62 @@ class test_KATCPClientResource_Integrated(tornado.testing.AsyncTestCase):
         self.assertEqual(set(DUT.sensor), sensors_before)
         self.assertEqual(set(DUT.req), reqs_before)
 
+    @tornado.testing.gen_test(timeout=1)
+    def test_bulk_set_sampling_strategies(self):
+        class BulkSamplingServer(DeviceTestServer):
+            PROTOCOL_INFO = ProtocolFlags(5, 1, [
+                ProtocolFlags.MULTI_CLIENT, ProtocolFlags.MESSAGE_IDS,
+                ProtocolFlags.BULK_SET_SENSOR_SAMPLING])
+
+            def setup_sensors(self):
+                super(BulkSamplingServer, self).setup_sensors()
+                self.add_sensor(Sensor.integer('an.other'))
+        server = BulkSamplingServer('', 0)
+        start_thread_with_cleanup(self, server)
+        resource_spec = dict(self.default_resource_spec,
+                             address=server.bind_address)
+        DUT = resource_client.KATCPClientResource(resource_spec)
+        DUT.start()
+        yield DUT.until_state('synced')
+        ic = DUT._inspecting_client
+        ic.wrapped_request = mock.Mock(wraps=ic.wrapped_request)
+
+        result = yield DUT.set_sampling_strategies('', ('event',))
+        # All the sensors are set in a single request
+        ic.wrapped_request.assert_called_once_with(
+            'sensor-sampling', mock.ANY, 'event')
+        sensor_names = ic.wrapped_request.call_args[0][1].split(',')
+        self.assertEqual(sorted(sensor_names), sorted(server.sensor_names))
+        self.assertEqual(result, dict.fromkeys(DUT.sensor, ('event',)))
+        for sensor in dict.values(DUT.sensor):
+            self.assertEqual(sensor.sampling_strategy, ('event',))
+
+        # A sensor that fails is reported without affecting the others
+        manager = DUT._sensor_manager
+        name = sensor_names[0]
+        ic.wrapped_request.reset_mock()
+        result = yield manager.set_sampling_strategies(
+            [name, 'no.such.sensor'], ('period', '1'))
+        self.assertEqual(ic.wrapped_request.call_count, 1)
+        self.assertEqual(result[name], (True, ('period', '1.0')))
+        self.assertFalse(result['no.such.sensor'][0])
+
+        # If the bulk request fails, each sensor is set on its own
+        real_request = ic.wrapped_request
+        failed = []
+        def fail_bulk_request(request, names, *args):
+            if ',' in names:
+                failed.append(names)
+                raise RuntimeError('Bulk request failed')
+            return real_request(request, names, *args)
+        ic.wrapped_request = mock.Mock(side_effect=fail_bulk_request)
+        result = yield manager.set_sampling_strategies(
+            sensor_names[:2], ('none',))
+        self.assertEqual(len(failed), 1)
+        self.assertEqual(ic.wrapped_request.call_count, 3)
+        self.assertEqual(result, dict.fromkeys(sensor_names[:2],
+                                               (True, ('none',))))
+
 
 class test_KATCPClientResource_IntegratedTimewarp(TimewarpAsyncTestCase):
     def setUp(self):
@@ -81,6 +81,32 @@ class TestSampling(TimewarpAsyncTestCase):
         self.assertRaises(ValueError, sampling.SampleStrategy.get_strategy,
                           "differential", None, s, "bar")
 
+    def test_format_inform_shared(self):
+        """Test that informs are formatted once per reading and version."""
+        reading = self.sensor.read()
+        line = sampling.format_inform_line(self.sensor, reading, 5)
+        self.assertEqual(line, "#sensor-status 0.000000 1 an.int nominal 3\n")
+        self.assertIs(sampling.format_inform_line(self.sensor, reading, 5),
+                      line)
+        msg = sampling.format_inform_v5(self.sensor, *reading)
+        self.assertEqual(str(msg), "#sensor-status 0.000000 1 an.int nominal 3")
+        self.assertEqual(str(sampling.format_inform_v4(self.sensor, *reading)),
+                         "#sensor-status 0 1 an.int nominal 3")
+        self.assertEqual(msg, katcp.Message.inform(
+            "sensor-status", "0.000000", "1", "an.int", "nominal", "3"))
+        # Each caller gets its own (mutable) message wrapping the line
+        msg.mid = '7'
+        self.assertIsNot(sampling.format_inform_v5(self.sensor, *reading), msg)
+        self.assertEqual(str(sampling.format_inform_v5(self.sensor, *reading)),
+                         "#sensor-status 0.000000 1 an.int nominal 3")
+        self.sensor.set(1.5, Sensor.WARN, 4)
+        self.assertEqual(self.sensor._inform_cache, None)
+        msg2 = sampling.format_inform_v5(self.sensor, *self.sensor.read())
+        self.assertEqual(str(msg2), "#sensor-status 1.500000 1 an.int warn 4")
+        # An old reading is formatted afresh
+        self.assertEqual(sampling.format_inform_line(self.sensor, reading, 5),
+                         line)
+
     @tornado.testing.gen_test(timeout=200)
     # Timeout needs to be longer than 'fake' duration of the test, since the tornado
     # ioloop is using out time-warped clock to determine timeouts too!
@@ -128,6 +154,48 @@ class TestSampling(TimewarpAsyncTestCase):
         self.assertEqual(self.calls, [])
 
 
+    @tornado.testing.gen_test(timeout=200)
+    def test_periodic_shared_scheduler(self):
+        t0 = self.ioloop_time
+        scheduler = sampling.PeriodicScheduler(self.io_loop, resolution=0.5)
+        sensor2 = DeviceTestSensor(
+                Sensor.INTEGER, "an.int2", "An integer.", "count", [-40, 30],
+                timestamp=t0, status=Sensor.NOMINAL, value=4)
+        DUT1 = sampling.SamplePeriod(self.inform, self.sensor, 10,
+                                     scheduler=scheduler)
+        DUT1.start()
+        yield self.wake_ioloop()
+        yield self.set_ioloop_time(t0 + 0.2)
+        DUT2 = sampling.SamplePeriod(self.inform, sensor2, 10,
+                                     scheduler=scheduler)
+        DUT3 = sampling.SamplePeriod(self.inform, sensor2, 5,
+                                     scheduler=scheduler)
+        DUT2.start()
+        DUT3.start()
+        yield self.wake_ioloop()
+        self.assertEqual(len(self.calls), 3)
+        # Same period and phase slot share a timeout
+        self.assertEqual(len(scheduler._timeouts), 2)
+        self.calls = []
+        r1, r2 = self.sensor.read(), sensor2.read()
+        yield self.set_ioloop_time(t0 + 5.2)
+        self.assertEqual(self.calls, [(sensor2, r2)])
+        self.calls = []
+        yield self.set_ioloop_time(t0 + 10)
+        self.assertEqual(sorted(self.calls),
+                         sorted([(self.sensor, r1), (sensor2, r2)]))
+        self.calls = []
+        # Cancelling from the ioloop removes the strategy right away
+        DUT1.cancel()
+        self.assertEqual(len(scheduler._timeouts), 2)
+        DUT3.cancel()
+        self.assertEqual(len(scheduler._timeouts), 1)
+        yield self.set_ioloop_time(t0 + 20.2)
+        self.assertEqual(self.calls, [(sensor2, r2)])
+        DUT2.cancel()
+        self.assertEqual(scheduler._timeouts, {})
+        self.assertEqual(scheduler._buckets, {})
+
     @tornado.testing.gen_test(timeout=200)
     def test_auto(self):
         t0 = self.ioloop_time
@@ -156,6 +224,260 @@ class TestSampling(TimewarpAsyncTestCase):
         self._thread_update_check(t, status, value)
         yield self._check_cancel(DUT)
 
+    @tornado.testing.gen_test(timeout=200)
+    def test_sensor_batch(self):
+        sensor2 = DeviceTestSensor(
+                Sensor.INTEGER, "an.int2", "An integer.", "count", [-40, 30],
+                timestamp=self.ioloop_time, status=Sensor.NOMINAL, value=3)
+        DUT1 = sampling.SampleAuto(self.inform, self.sensor)
+        DUT2 = sampling.SampleEvent(self.inform, sensor2)
+        DUT1.start()
+        DUT2.start()
+        yield self.wake_ioloop()
+        self.calls = []
+        t0 = self.ioloop_time
+        readings = [(self.sensor, (t0 + 1, Sensor.WARN, 4)),
+                    (sensor2, (t0 + 2, Sensor.NOMINAL, 5)),
+                    (self.sensor, (t0 + 3, Sensor.NOMINAL, 6))]
+
+        in_batch = []
+
+        def do_updates():
+            with sampling.SensorBatch():
+                with sampling.SensorBatch():
+                    for sensor, reading in readings[:2]:
+                        sensor.set(*reading)
+                sensor, reading = readings[2]
+                sensor.set(*reading)
+                in_batch.append((self.sensor.read(), list(self.calls)))
+
+        with mock.patch.object(self.io_loop, 'add_callback',
+                               wraps=self.io_loop.add_callback) as add_cb:
+            t = threading.Thread(target=do_updates)
+            t.start()
+            t.join()
+            self.assertEqual(add_cb.call_count, 1)
+        # Readings are applied immediately, but only delivered after the batch
+        self.assertEqual(in_batch, [(readings[2][1], [])])
+        yield self.wake_ioloop()
+        self.assertEqual(self.calls, readings)
+        DUT1.cancel()
+        DUT2.cancel()
+
+    @tornado.testing.gen_test(timeout=200)
+    def test_sensor_status_packer(self):
+        informs = []
+        DUT = sampling.SensorStatusPacker(informs.append, self.io_loop)
+        sensor2 = Sensor.string("a.str")
+        DUT.add(self.sensor, (1.5, Sensor.NOMINAL, 4))
+        DUT.add(sensor2, (2, Sensor.WARN, "a b"))
+        DUT.add(sensor2, (1.5, Sensor.ERROR, ""))
+        self.assertEqual(informs, [])
+        yield self.wake_ioloop()
+        self.assertEqual([str(msg) for msg in informs], [
+            r"#sensor-status 1.500000 2 an.int nominal 4 a.str error \@",
+            r"#sensor-status 2.000000 1 a.str warn a\_b"])
+        yield self.wake_ioloop()
+        self.assertEqual(len(informs), 2)
+        # Large groups are split
+        informs = []
+        DUT = sampling.SensorStatusPacker(informs.append, self.io_loop,
+                                          max_count=2)
+        for i in range(5):
+            DUT.add(Sensor.integer("s%d" % i), (1.5, Sensor.NOMINAL, i))
+        DUT.flush()
+        self.assertEqual([msg.arguments[1] for msg in informs], ["2", "2", "1"])
+        # Callers that flush themselves need not schedule a flush
+        informs = []
+        DUT = sampling.SensorStatusPacker(informs.append, mock.Mock())
+        DUT.add(self.sensor, (1.5, Sensor.NOMINAL, 4), schedule_flush=False)
+        DUT.flush()
+        self.assertFalse(DUT.ioloop.add_callback.called)
+        self.assertEqual(len(informs), 1)
+
+    @tornado.testing.gen_test(timeout=200)
+    def test_coalesced_updates(self):
+        DUT = sampling.SampleAuto(self.inform, self.sensor,
+                                  coalesce_updates=True)
+        DUT.start()
+        yield self.wake_ioloop()
+        self.calls = []
+        t0 = self.ioloop_time
+        readings = [(t0 + i, Sensor.NOMINAL, i) for i in range(5)]
+
+        def do_updates():
+            for reading in readings:
+                self.sensor.set(*reading)
+
+        with mock.patch.object(self.io_loop, 'add_callback',
+                               wraps=self.io_loop.add_callback) as add_cb:
+            t = threading.Thread(target=do_updates)
+            t.start()
+            t.join()
+            self.assertEqual(add_cb.call_count, 1)
+        yield self.wake_ioloop()
+        # Only the latest reading is delivered
+        self.assertEqual(self.calls, [(self.sensor, readings[-1])])
+        self.assertEqual(DUT.superseded_updates, 4)
+        yield self._thread_update_check(*readings[0])
+        self.assertEqual(DUT.superseded_updates, 4)
+        # Each coalescing strategy has a lock of its own
+        DUT2 = sampling.SampleAuto(self.inform, self.sensor,
+                                   coalesce_updates=True)
+        self.assertIsNot(DUT2._coalesce_lock, DUT._coalesce_lock)
+        self.assertIsNone(
+            sampling.SampleAuto(self.inform, self.sensor)._coalesce_lock)
+        yield self._check_cancel(DUT)
+
+    @tornado.testing.gen_test(timeout=200)
+    def test_strategy_stats(self):
+        shortest = 1.5
+        t, status, value = self.sensor.read()
+        DUT = sampling.SampleEventRate(self.inform, self.sensor, shortest, 10)
+        self.assertEqual(DUT.get_stats(), (0, 0, 0, 0, 0.0))
+        DUT.start()
+        yield self.wake_ioloop()
+        t_last_sent = self.ioloop_time
+        # Two updates that arrive too soon are suppressed by the rate limit,
+        # the latest one is sent by the short timeout
+        self.sensor.set(t, status, value + 1)
+        self.sensor.set(t, status, value + 2)
+        yield self.set_ioloop_time(t_last_sent + shortest)
+        self.assertEqual(len(self.calls), 2)
+        informs, suppressed, superseded, timer_fires, inform_time = (
+            DUT.get_stats())
+        self.assertEqual((informs, suppressed, superseded), (2, 2, 0))
+        # The initial periodic sampling callback and the short timeout
+        self.assertEqual(timer_fires, 2)
+        self.assertGreaterEqual(inform_time, 0.0)
+        self.assertEqual(len(DUT.get_stats()),
+                         len(sampling.SAMPLING_STATS_FIELDS))
+
+        period_DUT = sampling.SamplePeriod(self.inform, self.sensor, 1)
+        period_DUT.start()
+        yield self.wake_ioloop()
+        t0 = self.ioloop_time
+        yield self.set_ioloop_time(t0 + 1)
+        yield self.set_ioloop_time(t0 + 2)
+        self.assertEqual(period_DUT.informs_sent, 3)
+        self.assertEqual(period_DUT.timer_fires, 3)
+        yield self._check_cancel(DUT)
+        period_DUT.cancel()
+
+    @tornado.testing.gen_test(timeout=200)
+    def test_cancel_strategies(self):
+        DUTs = [sampling.SampleEvent(self.inform, self.sensor),
+                sampling.SampleAuto(self.inform, self.sensor),
+                sampling.SamplePeriod(self.inform, self.sensor, 10),
+                sampling.SampleEventRate(self.inform, self.sensor, 1, 10)]
+        for DUT in DUTs:
+            DUT.start()
+        yield self.wake_ioloop()
+        self.assertEqual(len(self.sensor._observers), 3)
+
+        with mock.patch.object(self.io_loop, 'add_callback',
+                               wraps=self.io_loop.add_callback) as add_cb:
+            t = threading.Thread(target=sampling.cancel_strategies,
+                                 args=(DUTs,))
+            t.start()
+            t.join()
+            # A single callback cancels the timeouts of all the strategies
+            self.assertEqual(add_cb.call_count, 1)
+        self.assertFalse(self.sensor._observers)
+        yield self.wake_ioloop()
+        self.calls = []
+        yield self.set_ioloop_time(self.ioloop_time + 20)
+        self.sensor.set_value(4)
+        self.assertEqual(self.calls, [])
+
+    @tornado.testing.gen_test(timeout=200)
+    def test_sensor_bank(self):
+        yield self._check_sensor_bank()
+
+    @tornado.testing.gen_test(timeout=200)
+    def test_sensor_bank_without_numpy(self):
+        with mock.patch.object(sampling, 'numpy', None):
+            yield self._check_sensor_bank()
+
+    @gen.coroutine
+    def _check_sensor_bank(self):
+        t0 = self.ioloop_time
+        sensors = [Sensor.float('bank.%d' % i, default=0.0) for i in range(4)]
+        for sensor in sensors:
+            sensor.set(t0, Sensor.NOMINAL, 0.0)
+        sensors.append(Sensor.integer('bank.int', default=0))
+        sensors[-1].set(t0, Sensor.NOMINAL, 0)
+        bank = sampling.SensorBank(sensors)
+        DUTs = [sampling.SampleDifferential(self.inform, s, 1) for s in sensors]
+        DUTs.append(sampling.SampleDifferentialRate(
+            self.inform, sensors[0], 2, 0, 100))
+        DUTs.append(sampling.SampleAuto(self.inform, sensors[1]))
+        for DUT in DUTs:
+            DUT.start()
+        yield self.wake_ioloop()
+        self.calls = []
+
+        t1 = t0 + 1
+        bank.set_values([0.5, 1.5, -3, 0, 2], timestamp=t1)
+        yield self.wake_ioloop()
+        self.assertEqual(sorted(self.calls), sorted([
+            (sensors[1], (t1, Sensor.NOMINAL, 1.5)),
+            (sensors[1], (t1, Sensor.NOMINAL, 1.5)),  # auto strategy
+            (sensors[2], (t1, Sensor.NOMINAL, -3)),
+            (sensors[4], (t1, Sensor.NOMINAL, 2))]))
+        self.assertEqual([s.read() for s in sensors],
+                         [(t1, Sensor.NOMINAL, v) for v in (0.5, 1.5, -3, 0, 2)])
+
+        # Sensors may still be set one by one in between
+        sensors[2].set(t1, Sensor.NOMINAL, 0)
+        self.calls = []
+        bank.set_values([0.5, 1.5, -3, 0, 2], timestamp=t1)
+        yield self.wake_ioloop()
+        self.assertEqual(sorted(self.calls), sorted([
+            (sensors[1], (t1, Sensor.NOMINAL, 1.5)),  # auto strategy
+            (sensors[2], (t1, Sensor.NOMINAL, -3))]))
+
+        # Updates from another thread are handed over to the ioloop, a
+        # status change is always reported
+        self.calls = []
+        t2 = t0 + 2
+        t = threading.Thread(target=bank.set_values,
+                             args=([2.5, 1.5, -3, 0, 2], Sensor.WARN, t2))
+        t.start()
+        t.join()
+        yield self.wake_ioloop()
+        self.assertEqual(len(self.calls), 7)
+        self.assertIn((sensors[0], (t2, Sensor.WARN, 2.5)), self.calls)
+
+        # The values are copied before the update is handed over, so the
+        # caller may reuse its buffer
+        self.calls = []
+        t3 = t0 + 3
+        buf = [12.5, 1.5, -3, 0, 2]
+        if sampling.numpy is not None:
+            buf = sampling.numpy.array(buf)
+        t = threading.Thread(target=bank.set_values,
+                             args=(buf, Sensor.WARN, t3))
+        t.start()
+        t.join()
+        buf[0] = 2.5
+        yield self.wake_ioloop()
+        self.assertIn((sensors[0], (t3, Sensor.WARN, 12.5)), self.calls)
+        with self.assertRaises(ValueError):
+            bank.set_values([1, 2])
+        with self.assertRaises(ValueError):
+            sampling.SensorBank([Sensor.boolean('bank.bool')])
+
+        class SetSensor(Sensor):
+            def set(self, timestamp, status, value):
+                super(SetSensor, self).set(timestamp, status, value)
+        with self.assertRaises(ValueError):
+            sampling.SensorBank([SetSensor(Sensor.FLOAT, 'bank.set')])
+        for DUT in DUTs:
+            DUT.cancel()
+        yield self.wake_ioloop()
+        self.assertFalse(any(s._observers for s in sensors))
+
     @gen.coroutine
     def _thread_update_check(self, ts, status, value):
         # Check update from thread (inform() raises if called from the wrong thread)
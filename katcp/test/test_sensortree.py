@@ -50,8 +50,8 @@ class TestGenericSensorTree(BaseTreeTest):
     def test_add_links(self):
         self.tree.add_links(self.sensor1, [self.sensor2])
         self.assertEqual(self.calls, [(self.sensor1, [self.sensor2])])
-        self.assertEqual(self.sensor1._observers, set([self.tree]))
-        self.assertEqual(self.sensor2._observers, set([self.tree]))
+        self.assertEqual(self.sensor1._observers, (self.tree,))
+        self.assertEqual(self.sensor2._observers, (self.tree,))
         self.assertEqual(self.tree.children(self.sensor1), set([self.sensor2]))
         self.assertEqual(self.tree.children(self.sensor2), set())
         self.assertEqual(self.tree.parents(self.sensor1), set())
@@ -64,8 +64,8 @@ class TestGenericSensorTree(BaseTreeTest):
             (self.sensor1, [self.sensor2]),
             (self.sensor1, [self.sensor2]),
         ])
-        self.assertEqual(self.sensor1._observers, set())
-        self.assertEqual(self.sensor2._observers, set())
+        self.assertEqual(self.sensor1._observers, ())
+        self.assertEqual(self.sensor2._observers, ())
         self.assertRaises(ValueError, self.tree.children, self.sensor1)
         self.assertRaises(ValueError, self.tree.children, self.sensor2)
         self.assertRaises(ValueError, self.tree.parents, self.sensor1)
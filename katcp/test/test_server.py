@@ -46,7 +46,7 @@ log_handler = TestLogHandler()
 logging.getLogger("katcp").addHandler(log_handler)
 logger = logging.getLogger(__name__)
 
-NO_HELP_MESSAGES = 16       # Number of requests on DeviceTestServer
+NO_HELP_MESSAGES = 18       # Number of requests on DeviceTestServer
 
 class test_ClientConnection(unittest.TestCase):
     def test_init(self):
@@ -123,6 +123,31 @@ class test_ClientRequestConnection(unittest.TestCase):
         self.assertEqual(inf_msg.mid, '42')
         self.assertEqual(inf_msg.mtype, katcp.Message.INFORM)
 
+    def test_inform_formatted(self):
+        arg_strs = [katcp.server.format_inform_arguments('test-request', args)
+                    for args in [('inf1', 'with space'), ('', 2.5), ()]]
+        self.assertEqual(arg_strs, [r' inf1 with\_space', r' \@ 2.5', ''])
+        self.DUT.inform_formatted(arg_strs)
+        self.client_connection.send_lines.assert_called_once_with(
+            '#test-request[42] inf1 with\\_space\n'
+            '#test-request[42] \\@ 2.5\n'
+            '#test-request[42]\n')
+        # Connections that cannot send lines get one inform at a time
+        client_connection = ClientConnectionTest()
+        DUT = katcp.server.ClientRequestConnection(
+            client_connection, self.req_msg)
+        DUT.inform_formatted(arg_strs)
+        self.assertEqual([str(msg) for msg in client_connection.messages], [
+            r'#test-request[42] inf1 with\_space',
+            r'#test-request[42] \@ 2.5', '#test-request[42]'])
+        # Unserialised arguments are used instead of parsing, if given
+        client_connection.messages = []
+        DUT = katcp.server.ClientRequestConnection(
+            client_connection, self.req_msg)
+        DUT.inform_formatted(['ignored'], [('inf1', 'with space')])
+        self.assertEqual([str(msg) for msg in client_connection.messages], [
+            r'#test-request[42] inf1 with\_space'])
+
     def test_reply(self):
         arguments = ('inf1', 'inf2')
         self.DUT.reply(*arguments)
@@ -156,6 +181,222 @@ class test_ClientRequestConnection(unittest.TestCase):
         self.assertEqual(rep_msg.mid, '42')
         self.assertEqual(rep_msg.mtype, katcp.Message.REPLY)
 
+class test_KATCPServer(unittest.TestCase):
+    def setUp(self):
+        self.DUT = katcp.server.KATCPServer(mock.Mock(), '', 0)
+        # Hack around ioloop thread asserts
+        self.DUT.ioloop_thread_id = thread.get_ident()
+
+    def _add_fake_stream(self):
+        stream = mock.Mock()
+        stream.closed.return_value = False
+        stream.KATCPServer_closing = False
+        stream.KATCPServer_writer = None
+        stream.KATCPServer_overflow_policy = None
+        stream.KATCPServer_address = ('127.0.0.1', len(self.DUT._connections))
+        self.DUT._connections[stream] = mock.Mock()
+        return stream
+
+    def test_mass_send_message(self):
+        streams = [self._add_fake_stream() for i in range(3)]
+        closed_stream = self._add_fake_stream()
+        closed_stream.closed.return_value = True
+        msg = katcp.Message.inform('log', 'warn', '1.0', 'root', 'a message')
+        with mock.patch.object(katcp.Message, '__str__',
+                               side_effect=katcp.Message.__str__,
+                               autospec=True) as str_mock:
+            self.DUT.mass_send_message(msg)
+        # Message is serialised only once for all the streams
+        self.assertEqual(str_mock.call_count, 1)
+        lines = [s.write.call_args[0][0] for s in streams]
+        self.assertEqual(lines[0], str(msg) + '\n')
+        for line in lines[1:]:
+            self.assertIs(line, lines[0])
+        self.assertFalse(closed_stream.write.called)
+
+    def test_mass_send_message_from_thread(self):
+        stream = self._add_fake_stream()
+        msg = katcp.Message.inform('interface-changed')
+        self.DUT.mass_send_message_from_thread(msg)
+        stream.write.assert_called_once_with('#interface-changed\n')
+
+
+class test_MessageHandlerPool(unittest.TestCase):
+    def setUp(self):
+        self.handled = []
+        self.started = threading.Event()
+        self.proceed = threading.Event()
+        self.pool = katcp.server.MessageHandlerPool(
+            self.handle, self.log_inform, num_threads=1, max_queue_size=3)
+        self.pool.set_ioloop(mock.Mock())
+        start_thread_with_cleanup(self, self.pool, start_timeout=1)
+
+    def handle(self, client_conn, msg):
+        self.started.set()
+        self.proceed.wait(1)
+        self.handled.append((client_conn, msg.name))
+        return katcp.Message.reply(msg.name, 'ok')
+
+    def log_inform(self, level, msg, name):
+        return katcp.Message.inform('log', level, '0.0', name, msg)
+
+    def test_fair_queues(self):
+        client_a, client_b = ClientConnectionTest(), ClientConnectionTest()
+        futures = [self.pool.on_message(client_a, katcp.Message.request('a1'))]
+        self.assertTrue(self.started.wait(1))
+        futures += [
+            self.pool.on_message(client_a, katcp.Message.request('a2')),
+            self.pool.on_message(client_a, katcp.Message.request('a3')),
+            self.pool.on_message(client_b, katcp.Message.request('b1'))]
+        # The queue is full while the handler is busy with a1
+        self.pool.on_message(
+            client_b, katcp.Message.request('b2')).result(timeout=1)
+        log_inform, reply = client_b.messages
+        self.assertEqual(log_inform.name, 'log')
+        self.assertEqual(log_inform.arguments[0], 'error')
+        self.assertEqual(reply.name, 'b2')
+        self.assertEqual(reply.arguments[0], 'fail')
+        self.assertIn('overloaded', reply.arguments[1])
+
+        self.proceed.set()
+        for f in futures:
+            f.result(timeout=1)
+        # Clients take turns and each client's messages stay in order
+        self.assertEqual(self.handled, [(client_a, 'a1'), (client_b, 'b1'),
+                                        (client_a, 'a2'), (client_a, 'a3')])
+        stats = self.pool.get_stats()
+        self.assertEqual((stats.queued, stats.max_queued, stats.handled,
+                          stats.rejected), (0, 3, 4, 1))
+        self.assertGreater(stats.max_wait, 0.0)
+        self.assertLessEqual(stats.mean_wait, stats.max_wait)
+
+
+class test_CoalescingStreamWriter(tornado.testing.AsyncTestCase):
+    def setUp(self):
+        super(test_CoalescingStreamWriter, self).setUp()
+        self.stream = mock.Mock()
+        self.stream.closed.return_value = False
+        self.error_callback = mock.Mock()
+
+    @tornado.testing.gen_test
+    def test_write(self):
+        DUT = katcp.server.CoalescingStreamWriter(
+            self.stream, self.io_loop, 10, self.error_callback)
+        futures = [DUT.write('#a\n'), DUT.write('#b\n'), DUT.write('#c\n')]
+        self.assertFalse(self.stream.write.called)
+        self.assertIs(futures[0], futures[1])
+        yield gen.moment
+        self.stream.write.assert_called_once_with('#a\n#b\n#c\n')
+        DUT.write('#d\n')
+        yield gen.moment
+        self.assertEqual(self.stream.write.call_count, 2)
+        self.assertEqual(DUT.messages, 4)
+        self.assertEqual(DUT.writes, 2)
+        self.assertEqual(DUT.batching_factor, 2)
+        self.assertFalse(self.error_callback.called)
+
+    def test_latency_cap(self):
+        DUT = katcp.server.CoalescingStreamWriter(
+            self.stream, self.io_loop, -1, self.error_callback)
+        DUT.write('#a\n')
+        self.stream.write.assert_called_once_with('#a\n')
+
+    def test_write_error(self):
+        DUT = katcp.server.CoalescingStreamWriter(
+            self.stream, self.io_loop, 10, self.error_callback)
+        self.stream.write.side_effect = RuntimeError('buffer full')
+        future = DUT.write('#a\n')
+        DUT.flush()
+        self.error_callback.assert_called_once_with(self.stream, '#a\n')
+        self.assertIsInstance(future.exception(), RuntimeError)
+
+class test_OverflowPolicy(tornado.testing.AsyncTestCase):
+    def setUp(self):
+        super(test_OverflowPolicy, self).setUp()
+        self.written = []
+        self.error_callback = mock.Mock()
+
+    def _write(self, line):
+        future = gen.Future()
+        self.written.append((line, future))
+        return future
+
+    def _bind(self, policy):
+        policy.bind(self._write, self.io_loop, self.error_callback)
+        return policy
+
+    def _flush_written(self):
+        for line, future in self.written:
+            if not future.done():
+                future.set_result(None)
+
+    def _lines(self):
+        return [line for line, future in self.written]
+
+    def _sensor_status(self, name, value):
+        return str(katcp.Message.inform(
+            'sensor-status', '1.0', '1', name, 'nominal', value)) + '\n'
+
+    @tornado.testing.gen_test
+    def test_hold_and_release(self):
+        DUT = self._bind(katcp.server.OverflowPolicy(
+            high_watermark=10, low_watermark=5))
+        DUT.write('#a 0123456789\n')
+        self.assertTrue(DUT.overflowing)
+        self.assertIsNone(DUT.write('#b\n'))
+        self.assertIsNone(DUT.write('#c\n'))
+        self.assertEqual(self._lines(), ['#a 0123456789\n'])
+        self.assertEqual(DUT.held, 2)
+        self._flush_written()
+        yield gen.moment
+        self.assertEqual(self._lines(), ['#a 0123456789\n', '#b\n', '#c\n'])
+        self.assertFalse(DUT.overflowing)
+        self.assertEqual(DUT.overflows, 1)
+
+    def test_max_held_bytes(self):
+        DUT = self._bind(katcp.server.OverflowPolicy(
+            high_watermark=0, low_watermark=0, max_held_bytes=5))
+        DUT.write('#a\n')
+        DUT.write('#b\n')
+        with self.assertRaises(RuntimeError):
+            DUT.write('#c\n')
+
+    def test_disconnect(self):
+        DUT = self._bind(katcp.server.DisconnectOverflowPolicy(
+            high_watermark=0, low_watermark=0))
+        DUT.write('#a\n')
+        with self.assertRaises(RuntimeError):
+            DUT.write('#b\n')
+
+    def test_dropping(self):
+        DUT = self._bind(katcp.server.DroppingOverflowPolicy(
+            high_watermark=0, low_watermark=0))
+        DUT.write('#a\n')
+        DUT.write(self._sensor_status('s1', '1'))
+        DUT.write('#sensor-status[3] reply-inform\n')
+        DUT.write('#log warn\n')
+        self.assertEqual(DUT.dropped, 1)
+        self.assertEqual(DUT.held, 2)
+        DUT.flush()
+        self.assertEqual(self._lines(), [
+            '#a\n', '#sensor-status[3] reply-inform\n', '#log warn\n'])
+
+    def test_coalescing(self):
+        DUT = self._bind(katcp.server.CoalescingOverflowPolicy(
+            high_watermark=0, low_watermark=0))
+        DUT.write('#a\n')
+        for value in range(3):
+            DUT.write(self._sensor_status('s1', value))
+            DUT.write(self._sensor_status('s2', value))
+        DUT.write('#b\n')
+        DUT.write(self._sensor_status('s1', 3))
+        self.assertEqual(DUT.coalesced, 5)
+        self.assertEqual(DUT.held, 3)
+        DUT.flush()
+        self.assertEqual(self._lines(), [
+            '#a\n', self._sensor_status('s2', 2), '#b\n',
+            self._sensor_status('s1', 3)])
+
 class TestDeviceServerV4(unittest.TestCase, TestUtilMixin):
 
     class DeviceTestServerV4(DeviceTestServer):
@@ -335,6 +576,302 @@ class test_DeviceServer(unittest.TestCase, TestUtilMixin):
             '!sensor-sampling-clear ok'])
         self.server.clear_strategies.assert_called_once_with(client_connection)
 
+    def _handle_requests(self, client_connection, *reqs):
+        """Handle requests from a test client in a single ioloop callback."""
+        f = Future()
+        def _handle():
+            if client_connection not in self.server._strategies:
+                self.server.on_client_connect(client_connection)
+            tfs = [self.server.handle_message(
+                client_connection, katcp.Message.request(*req))
+                for req in reqs]
+            gen.chain_future(gen.multi_future(tfs), f)
+        self.server.ioloop.add_callback(_handle)
+        f.result(timeout=1)
+        self.server.sync_with_ioloop()
+
+    def test_period_scheduler(self):
+        ioloop = mock.Mock()
+        # Period strategies get their own timeouts unless enabled
+        self.assertIsNone(self.server._get_period_scheduler(ioloop))
+        self.server.PERIOD_SAMPLING_RESOLUTION = 0.01
+        scheduler = self.server._get_period_scheduler(ioloop)
+        self.assertIsInstance(scheduler, katcp.sampling.PeriodicScheduler)
+        self.assertIs(self.server._get_period_scheduler(ioloop), scheduler)
+
+    def test_match_sensors(self):
+        self.server.SENSOR_PATTERN_CACHE_SIZE = 2
+        start_thread_with_cleanup(self, self.server, start_timeout=1)
+        self.assertEqual(self.server._sensor_names,
+                         sorted(self.server._sensors))
+        an_int = self.server.get_sensor('an.int')
+        self.assertEqual(self.server._match_sensors('an.int'),
+                         (True, [('an.int', an_int)]))
+        self.assertEqual(self.server._match_sensors('an.unknown'), (True, []))
+        exact, sensors = self.server._match_sensors('/^an\\./')
+        self.assertFalse(exact)
+        self.assertIs(self.server._match_sensors('/^an\\./')[1], sensors)
+        self.assertEqual([name for name, _ in sensors],
+                         [name for name in self.server._sensor_names
+                          if name.startswith('an.')])
+        # Only the most recently used patterns are kept
+        self.server._match_sensors(None)
+        self.server._match_sensors('/int/')
+        self.assertEqual(list(self.server._sensor_pattern_cache),
+                         [None, '/int/'])
+
+        # Adding and removing sensors updates the index and clears the cache
+        sensor = katcp.Sensor.integer('an.added')
+        self.server.add_sensor(sensor)
+        self.assertEqual(self.server._sensor_names,
+                         sorted(self.server._sensors))
+        self.assertIn(('an.added', sensor),
+                      self.server._match_sensors('/^an\\./')[1])
+        self.server.remove_sensor('an.added')
+        self.assertEqual(self.server._sensor_names,
+                         sorted(self.server._sensors))
+        self.assertNotIn(('an.added', sensor),
+                         self.server._match_sensors('/^an\\./')[1])
+
+    def test_cached_informs(self):
+        start_thread_with_cleanup(self, self.server, start_timeout=1)
+        client_connection = ClientConnectionTest()
+        handle_requests = partial(self._handle_requests, client_connection)
+        handle_requests(('sensor-list', 'an.int'), ('help', 'watchdog'))
+        self.assertIn('an.int', self.server._sensor_list_informs)
+        # Replacing a sensor updates its cached #sensor-list inform
+        self.server.add_sensor(katcp.Sensor.integer(
+            'an.int', 'A new integer.', 'count', [0, 10]))
+        client_connection.messages = []
+        handle_requests(('sensor-list', '/^an\\.int$/'))
+        self._assert_msgs_equal(client_connection.messages, [
+            r'#sensor-list an.int A\_new\_integer. count integer 0 10',
+            r'!sensor-list ok 1'])
+        # So does replacing a request handler
+        self.server._request_handlers = dict(self.server._request_handlers)
+        self.server._request_handlers['watchdog'] = lambda req, msg: None
+        client_connection.messages = []
+        handle_requests(('help',))
+        helps = dict((msg.arguments[0], msg.arguments[1:])
+                     for msg in client_connection.informs)
+        self.assertEqual(helps['watchdog'], ['None'])
+        # Changing the metadata of a sensor or the docstring of a handler
+        # in place also updates the cached informs
+        sensor = self.server.get_sensor('an.int')
+        sensor.description = 'A changed integer.'
+        sensor.units = 'counts'
+        self.server._request_handlers['watchdog'].__doc__ = 'Woof.'
+        client_connection.messages = []
+        handle_requests(('sensor-list', 'an.int'), ('help',))
+        self._assert_msgs_equal(client_connection.messages[:2], [
+            r'#sensor-list an.int A\_changed\_integer. counts integer 0 10',
+            r'!sensor-list ok 1'])
+        helps = dict((msg.arguments[0], msg.arguments[1:])
+                     for msg in client_connection.informs[1:])
+        self.assertEqual(helps['watchdog'], ['Woof.'])
+        self.server.remove_sensor('an.int')
+        self.assertNotIn('an.int', self.server._sensor_list_informs)
+
+    def test_sensor_status_multi(self):
+        start_thread_with_cleanup(self, self.server, start_timeout=1)
+        client_connection = ClientConnectionTest()
+        for name in ('multi.a', 'multi.b'):
+            sensor = katcp.Sensor.integer(name)
+            sensor.set(1234.5, katcp.Sensor.NOMINAL, 7)
+            self.server.add_sensor(sensor)
+
+        handle_requests = partial(self._handle_requests, client_connection)
+        handle_requests(('sensor-status-multi', 'on'))
+        client_connection.messages = []
+        # Strategies that sample in the same ioloop iteration are packed
+        handle_requests(('sensor-sampling', 'multi.a', 'period', '10'),
+                        ('sensor-sampling', 'multi.b', 'period', '10'))
+        self.server.sync_with_ioloop()
+        self._assert_msgs_equal(client_connection.informs, [
+            '#sensor-status 1234.500000 2 multi.a nominal 7 '
+            'multi.b nominal 7'])
+        self.assertEqual(len(client_connection.replies), 2)
+
+        client_connection.messages = []
+        handle_requests(('sensor-status-multi', 'off'),
+                        ('sensor-status-multi',),
+                        ('sensor-sampling', 'multi.a', 'period', '10'),
+                        ('sensor-sampling', 'multi.b', 'period', '10'))
+        self.server.sync_with_ioloop()
+        self._assert_msgs_equal(client_connection.informs, [
+            '#sensor-status 1234.500000 1 multi.a nominal 7',
+            '#sensor-status 1234.500000 1 multi.b nominal 7'])
+        self._assert_msgs_equal(client_connection.replies[:2], [
+            '!sensor-status-multi ok off', '!sensor-status-multi ok off'])
+        self.server.ioloop.add_callback(
+            self.server.clear_strategies, client_connection, True)
+        self.server.sync_with_ioloop()
+
+        # Readings still pending when the client goes away are dropped
+        handle_requests(('sensor-status-multi', 'on'))
+        client_connection.messages = []
+
+        def add_and_disconnect():
+            packer = self.server._sensor_status_packers[client_connection]
+            packer.add(sensor, sensor.read())
+            self.server.clear_strategies(client_connection, True)
+        self.server.ioloop.add_callback(add_and_disconnect)
+        self.server.sync_with_ioloop()
+        self.server.sync_with_ioloop()
+        self.assertEqual(client_connection.informs, [])
+
+    def test_pattern_sampling(self):
+        start_thread_with_cleanup(self, self.server, start_timeout=1)
+        client_connection = ClientConnectionTest()
+        for name, ts in (('pat.b', 1.0), ('pat.a', 1.0), ('pat.c', 2.0)):
+            sensor = katcp.Sensor.integer(name)
+            sensor.set(ts, katcp.Sensor.NOMINAL, 7)
+            self.server.add_sensor(sensor)
+        handle_requests = partial(self._handle_requests, client_connection)
+
+        handle_requests(('sensor-sampling', '/^pat\\./', 'period', '10'))
+        self.server.sync_with_ioloop()
+        self._assert_msgs_equal(client_connection.informs[-2:], [
+            '#sensor-status 1.000000 2 pat.a nominal 7 pat.b nominal 7',
+            '#sensor-status 2.000000 1 pat.c nominal 7'])
+        self._assert_msgs_equal(client_connection.replies, [
+            r'!sensor-sampling ok /^pat\\./ period 10'])
+
+        # Sensors added or removed later are picked up
+        client_connection.messages = []
+        sensor = katcp.Sensor.integer('pat.d')
+        sensor.set(2.0, katcp.Sensor.NOMINAL, 8)
+        self.server.add_sensor(sensor)
+        self.server.remove_sensor('pat.b')
+        self.server.sync_with_ioloop()
+        strategy = self.server._pattern_strategies[client_connection][
+            '/^pat\\./']
+        self.server.ioloop.add_callback(strategy._sample)
+        self.server.sync_with_ioloop()
+        self._assert_msgs_equal(client_connection.informs, [
+            '#sensor-status 1.000000 1 pat.a nominal 7',
+            '#sensor-status 2.000000 2 pat.c nominal 7 pat.d nominal 8'])
+
+        client_connection.messages = []
+        handle_requests(('sensor-sampling', '/^pat\\./', 'event'),
+                        ('sensor-sampling', '/^pat\\./', 'none'),
+                        ('sensor-sampling', '/^pat\\./'))
+        self._assert_msgs_equal(client_connection.replies, [
+            r'!sensor-sampling fail Only\_the\_period\_and\_none\_'
+            r'strategies\_may\_be\_used\_with\_a\_sensor\_name\_pattern.',
+            r'!sensor-sampling ok /^pat\\./ none',
+            r'!sensor-sampling ok /^pat\\./ none'])
+        self.assertEqual(
+            self.server._pattern_strategies[client_connection], {})
+
+    def test_sampling_stats(self):
+        start_thread_with_cleanup(self, self.server, start_timeout=1)
+        client_connection = ClientConnectionTest()
+        client_connection.address = '127.0.0.1:60000'
+        for name in ('stats.a', 'stats.b'):
+            sensor = katcp.Sensor.integer(name)
+            sensor.set(1.0, katcp.Sensor.NOMINAL, 7)
+            self.server.add_sensor(sensor)
+        handle_requests = partial(self._handle_requests, client_connection)
+        handle_requests(('sensor-sampling', 'stats.a', 'event'),
+                        ('sensor-sampling', 'stats.b', 'auto'),
+                        ('sensor-sampling', '/^stats/', 'period', '10'))
+        self.server.sync_with_ioloop()
+
+        stats = self.server.get_sampling_stats('client')
+        self.assertEqual(stats.keys(), ['127.0.0.1:60000'])
+        self.assertEqual(stats['127.0.0.1:60000'][:2], [3, 3])
+        stats = self.server.get_sampling_stats('sensor')
+        self.assertEqual(sorted(stats), ['/^stats/', 'stats.a', 'stats.b'])
+        self.assertEqual(stats['stats.a'][:2], [1, 1])
+
+        client_connection.messages = []
+        handle_requests(('sampling-stats',), ('sampling-stats', 'sensor'),
+                        ('sampling-stats', 'bogus'))
+        informs = [str(m).split(' ') for m in client_connection.informs]
+        self.assertEqual([inform[:4] for inform in informs[:1]], [
+            ['#sampling-stats', '127.0.0.1:60000', '3', '3']])
+        self.assertEqual(sorted(inform[1] for inform in informs[1:]),
+                         ['/^stats/', 'stats.a', 'stats.b'])
+        # The failed request is replied to first, without going via the ioloop
+        self._assert_msgs_equal(client_connection.replies, [
+            r"!sampling-stats fail Expected\_'client'\_or\_'sensor',\_"
+            r"got\_'bogus'.",
+            '!sampling-stats ok 1', '!sampling-stats ok 3'])
+        self.server.ioloop.add_callback(
+            self.server.clear_strategies, client_connection, True)
+        self.server.sync_with_ioloop()
+
+    def test_sampling_stats_sensors(self):
+        class StatsServer(DeviceTestServer):
+            SAMPLING_STATS_PERIOD = 0.01
+        server = StatsServer('', 0)
+        server.set_concurrency_options(thread_safe=False,
+                                       handler_thread=False)
+        self.assertTrue(server.has_sensor('sampling.inform-time'))
+        start_thread_with_cleanup(self, server, start_timeout=1)
+        client_connection = ClientConnectionTest()
+        client_connection.address = '127.0.0.1:60001'
+        self.server = server
+        self._handle_requests(client_connection,
+                              ('sensor-sampling', 'an.int', 'event'))
+        server.ioloop.add_callback(server._update_sampling_stats_sensors)
+        server.sync_with_ioloop()
+        self.assertEqual(server.get_sensor('sampling.strategies').value(), 1)
+        self.assertEqual(server.get_sensor('sampling.informs').value(), 1)
+        self.assertEqual(
+            server.get_sensor('sampling.busiest-client').value(),
+            '127.0.0.1:60001')
+        stats_callback = server._sampling_stats_callback
+        self.assertTrue(stats_callback.is_running())
+        # Stopping the server stops updating the sensors
+        server.stop()
+        server.join(timeout=1)
+        self.assertIsNone(server._sampling_stats_callback)
+        self.assertFalse(stats_callback.is_running())
+
+    def test_bulk_strategy_teardown(self):
+        start_thread_with_cleanup(self, self.server, start_timeout=1)
+        conn1, conn2 = ClientConnectionTest(), ClientConnectionTest()
+        sensors = []
+        for i in range(20):
+            sensor = katcp.Sensor.integer('teardown.%d' % i)
+            sensor.set(1.0, katcp.Sensor.NOMINAL, i)
+            self.server.add_sensor(sensor)
+            sensors.append(sensor)
+        for conn in (conn1, conn2):
+            self._handle_requests(conn, *[
+                ('sensor-sampling', s.name, 'event') if i % 2 else
+                ('sensor-sampling', s.name, 'period', '10')
+                for i, s in enumerate(sensors)])
+        self.assertEqual(len(self.server._strategies[conn1]), 20)
+
+        # Removing a sensor tears down the strategies of all clients
+        self.server.remove_sensor('teardown.1')
+        self.server.sync_with_ioloop()
+        self.assertFalse(sensors[1]._observers)
+        self.assertNotIn(sensors[1], self.server._strategies[conn1])
+        self.assertNotIn(sensors[1], self.server._strategies[conn2])
+
+        def clear():
+            with mock.patch.object(self.server.ioloop, 'add_callback') as cb:
+                self.server.clear_strategies(conn1, remove_client=True)
+            # Timeouts are cancelled directly from the ioloop thread
+            f.set_result(cb.call_count)
+        f = Future()
+        self.server.ioloop.add_callback(clear)
+        self.assertEqual(f.result(timeout=1), 0)
+        self.server.sync_with_ioloop()
+        self.assertNotIn(conn1, self.server._strategies)
+        self.assertEqual(len(self.server._strategies[conn2]), 19)
+        # Only the other client's event strategies still observe the sensors
+        for i, sensor in enumerate(sensors):
+            self.assertEqual(len(sensor._observers or ()),
+                             1 if i % 2 and i != 1 else 0)
+        self.server.ioloop.add_callback(
+            self.server.clear_strategies, conn2, True)
+        self.server.sync_with_ioloop()
+
     def test_has_sensor(self):
         self.assertFalse(self.server.has_sensor('blaah'))
         self.server.add_sensor(katcp.Sensor.boolean('blaah', 'blaah sens'))
@@ -360,7 +897,7 @@ class test_DeviceServer51(test_DeviceServer):
     """Proposed additional tests for Verion 5.1 server"""
 
     expected_connect_messages = (
-        r'#version-connect katcp-protocol 5.1-IMT',
+        r'#version-connect katcp-protocol 5.1-BIMT',
         r'#version-connect katcp-library katcp-python-%s' % katcp_version,
         r'#version-connect katcp-device deviceapi-5.6 buildy-1.2g')
 
@@ -370,7 +907,8 @@ class test_DeviceServer51(test_DeviceServer):
             5, 1, [
                 katcp.ProtocolFlags.MULTI_CLIENT,
                 katcp.ProtocolFlags.MESSAGE_IDS,
-                katcp.ProtocolFlags.REQUEST_TIMEOUT_HINTS])
+                katcp.ProtocolFlags.REQUEST_TIMEOUT_HINTS,
+                katcp.ProtocolFlags.BULK_SET_SENSOR_SAMPLING])
         self.server = DeviceTestServer51('', 0)
         self.server.set_concurrency_options(
             thread_safe=False, handler_thread=False)
@@ -378,6 +916,54 @@ class test_DeviceServer51(test_DeviceServer):
     def test_excluded_default_handlers(self):
         pass                  #  No excluded default handlers for v5.1 as of yet
 
+    def test_bulk_sensor_sampling(self):
+        start_thread_with_cleanup(self, self.server, start_timeout=1)
+        client_connection = ClientConnectionTest()
+        for name in ('bulk.a', 'bulk.b'):
+            sensor = katcp.Sensor.integer(name)
+            sensor.set(1.0, katcp.Sensor.NOMINAL, 7)
+            self.server.add_sensor(sensor)
+        handle_requests = partial(self._handle_requests, client_connection)
+        handle_requests()
+        client_connection.messages = []
+
+        handle_requests(('sensor-sampling', 'bulk.a,bulk.b', 'event'))
+        self._assert_msgs_equal(client_connection.messages, [
+            '#sensor-sampling bulk.a event',
+            '#sensor-sampling bulk.b event',
+            '#sensor-status 1.000000 1 bulk.a nominal 7',
+            '#sensor-status 1.000000 1 bulk.b nominal 7',
+            '!sensor-sampling ok bulk.a,bulk.b event'])
+        strategies = self.server._strategies[client_connection]
+        self.assertEqual(sorted(s.name for s in strategies),
+                         ['bulk.a', 'bulk.b'])
+
+        # Bad parameters for every sensor fail the request and leave the
+        # strategies unchanged
+        client_connection.messages = []
+        handle_requests(('sensor-sampling', 'bulk.a,bulk.b', 'period', '-1'),
+                        ('sensor-sampling', 'bulk.a,bulk.b'))
+        self.assertEqual([msg.arguments[:2] for msg in
+                          client_connection.informs],
+                         [['bulk.a', 'fail'], ['bulk.b', 'fail']])
+        replies = sorted(str(msg) for msg in client_connection.replies)
+        self.assertEqual(replies[0],
+                         r'!sensor-sampling fail A\_strategy\_is\_required\_'
+                         r'when\_setting\_the\_sampling\_of\_multiple\_sensors.')
+        self.assertTrue(replies[1].startswith(
+            r'!sensor-sampling fail No\_sampling\_strategies\_set:'))
+        self.assertEqual(len(self.server._strategies[client_connection]), 2)
+
+        # Unknown names do not stop the other strategies from being set
+        client_connection.messages = []
+        handle_requests(('sensor-sampling', 'bulk.a,bulk.x,bulk.b', 'none'))
+        self._assert_msgs_equal(client_connection.messages, [
+            '#sensor-sampling bulk.a none',
+            r'#sensor-sampling bulk.x fail Unknown\_sensor\_name:\_bulk.x.',
+            '#sensor-sampling bulk.b none',
+            '!sensor-sampling ok bulk.a,bulk.x,bulk.b none'])
+        self.assertEqual(self.server._strategies[client_connection], {})
+
     def test_request_timeout_hint(self):
         req = mock_req('request-timeout-hint')
         handle_mock_req(self.server, req)
@@ -590,9 +1176,11 @@ class TestDeviceServerClientIntegrated(unittest.TestCase, TestUtilMixin):
             (r"#help raise-exception", ""),
             (r"#help raise-fail", ""),
             (r"#help restart", ""),
+            (r"#help sampling-stats", ""),
             (r"#help sensor-list", ""),
             (r"#help sensor-sampling", ""),
             (r"#help sensor-sampling-clear", ""),
+            (r"#help sensor-status-multi", ""),
             (r"#help sensor-value", ""),
             (r"#help slow-command", ""),
             (r"#help version-list", ""),
@@ -704,9 +1292,11 @@ class TestDeviceServerClientIntegrated(unittest.TestCase, TestUtilMixin):
             (r"#help[6] raise-exception", ""),
             (r"#help[6] raise-fail", ""),
             (r"#help[6] restart", ""),
+            (r"#help[6] sampling-stats", ""),
             (r"#help[6] sensor-list", ""),
             (r"#help[6] sensor-sampling", ""),
             (r"#help[6] sensor-sampling-clear", ""),
+            (r"#help[6] sensor-status-multi", ""),
             (r"#help[6] sensor-value", ""),
             (r"#help[6] slow-command", ""),
             (r"#help[6] version-list", ""),
@@ -1123,3 +1713,90 @@ class TestDeviceServerClientIntegratedAsync(
     def _setup_server(self):
         self.server = AsyncDeviceTestServer('', 0)
         start_thread_with_cleanup(self, self.server, start_timeout=1)
+
+class TestDeviceServerClientIntegratedCoalesced(
+        TestDeviceServerClientIntegrated):
+
+    def _setup_server(self):
+        self.server = DeviceTestServer('', 0)
+        self.server._server.COALESCE_WRITES = True
+        start_thread_with_cleanup(self, self.server, start_timeout=1)
+
+class TestDeviceServerClientIntegratedOverflowPolicy(
+        TestDeviceServerClientIntegrated):
+
+    def _setup_server(self):
+        self.server = DeviceTestServer('', 0)
+        self.server._server.overflow_policy_factory = partial(
+            katcp.server.CoalescingOverflowPolicy,
+            high_watermark=4096, low_watermark=1024, max_held_bytes=16384)
+        start_thread_with_cleanup(self, self.server, start_timeout=1)
+
+class TestDeviceServerClientIntegratedChunkedReads(
+        TestDeviceServerClientIntegrated):
+
+    def setUp(self):
+        patcher = mock.patch.object(katcp.DeviceClient, 'CHUNKED_READS', True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        super(TestDeviceServerClientIntegratedChunkedReads, self).setUp()
+
+    def _setup_server(self):
+        self.server = DeviceTestServer('', 0)
+        self.server._server.CHUNKED_READS = True
+        start_thread_with_cleanup(self, self.server, start_timeout=1)
+
+class TestDeviceServerClientIntegratedSharded(
+        TestDeviceServerClientIntegrated):
+
+    def _setup_server(self):
+        self.server = DeviceTestServer('', 0)
+        self.server._server.IOLOOP_SHARDS = 3
+        self.server.set_concurrency_options(handler_thread=False)
+        start_thread_with_cleanup(self, self.server, start_timeout=1)
+
+    def test_ioloop_shards(self):
+        """Test that clients are spread over the ioloop shards."""
+        for shard in self.server._server._shards:
+            self.assertIsNotNone(shard.thread_id)
+        clients = [self.client]
+        for _ in range(2):
+            client = BlockingTestClient(self, *self.server_addr)
+            start_thread_with_cleanup(self, client, start_timeout=1)
+            self.assertTrue(client.wait_protocol(timeout=1))
+            clients.append(client)
+        ioloops = set(conn.ioloop for conn
+                      in self.server._server._connections.values())
+        self.assertEqual(len(ioloops), 3)
+        self.assertIn(self.server.ioloop, ioloops)
+
+        recorders = [client.message_recorder(blacklist=self.BLACKLIST)
+                     for client in clients]
+        for client in clients:
+            reply, _ = client.blocking_request(
+                katcp.Message.request("sensor-sampling", "an.int", "event"))
+            self.assertTrue(reply.reply_ok())
+        # Sensor updates from another thread reach the client on each shard
+        self.server.get_sensor('an.int').set_value(4, timestamp=12346)
+        # Mass informs reach all the shards
+        self.server.mass_inform(katcp.Message.inform('shard-test'))
+        for get_msgs in recorders:
+            get_msgs.wait_number(3)
+            self._assert_msgs_equal(get_msgs(), [
+                r"#sensor-status 12345.000000 1 an.int nominal 3",
+                r"#sensor-status 12346.000000 1 an.int nominal 4",
+                r"#shard-test"])
+        reply, informs = self.client.blocking_request(
+            katcp.Message.request("client-list"))
+        self.assertEqual(reply.arguments, ['ok', '3'])
+
+    def test_detach_stream_socket(self):
+        """Test that a rewrapped connection is detached from its stream."""
+        sock_a, sock_b = socket.socketpair()
+        self.addCleanup(sock_b.close)
+        stream = tornado.iostream.IOStream(sock_a)
+        detached = katcp.server._detach_stream_socket(stream)
+        self.addCleanup(detached.close)
+        self.assertTrue(stream.closed())
+        detached.sendall('ping\n')
+        self.assertEqual(sock_b.recv(5), 'ping\n')